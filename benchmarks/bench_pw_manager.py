@@ -0,0 +1,573 @@
+"""Benchmarks for PasswordDB, storage as used by the menu, and password generation.
+
+Builds synthetic vaults of the given sizes from a fixed seed and prints one JSON
+object per measurement to stdout, so runs can be stored and compared:
+
+    python benchmarks/bench_pw_manager.py --sizes 1000 10000 > before.jsonl
+    python benchmarks/bench_pw_manager.py --sizes 1000 10000 --baseline before.jsonl
+
+Every record holds the benchmark name, the vault size, the number of operations per
+run and the best and mean time per operation over all runs (in microseconds); memory
+records hold the bytes allocated per entry instead.
+Runs offline; storage benchmarks write to a temporary directory.
+
+Function synthetic_entries(size, seed):
+    Creates a reproducible list of entries.
+Function bench_database(size, ops, repeat):
+    Measures lookups, additions, updates, removals and suggestions on a PasswordDB
+    and through a PasswordManager.
+Function bench_memory(size):
+    Measures the memory held per entry by the entries and a PasswordDB of them.
+Function bench_storage(size, ops, repeat):
+    Measures saving and loading a vault with every storage backend.
+Function bench_audit(size, repeat):
+    Measures an audit of a vault with some reused and generated passwords.
+Function bench_generation(ops, repeat):
+    Measures password generation under different length and exclusion rules.
+Function compare(records, baseline):
+    Prints the change of every benchmark against an earlier run.
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "pw_manager")
+)
+
+from audit import audit_entries
+from manager import PasswordManager
+from pw_classes import Entry, PasswordDB, normalize_website
+from random_password import generate_random_pw
+from storage import JournalStorage, PickleStorage, SQLiteStorage
+
+SIZES = (1000, 10000, 100000, 1000000)
+# Cheapest allowed scrypt cost, so storage benchmarks measure storage and not the KDF
+KDF_PARAMS = {"n": 2 ** 14, "r": 8, "p": 1}
+GENERATION_RULES = {
+    "default": (7, 25, True, None),
+    "short": (7, 10, True, None),
+    "long": (15, 25, True, None),
+    "no_special": (7, 25, False, None),
+    "exclude_letters": (7, 25, True, list("eiouy")),
+    "exclude_digits": (7, 25, True, list("13579")),
+}
+
+
+def _word(rng, length):
+    # Random lowercase word.
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def synthetic_entries(size, seed=0):
+    """Creates a reproducible list of entries; about one in four websites has two usernames.
+
+    Args:
+        size (int): Number of entries.
+        seed (int): Seed of the random generator. Defaults to 0.
+
+    Returns:
+        entries (list): List of size entries.
+
+    """
+
+    rng = random.Random(seed)
+    entries = []
+    i = 0
+    while len(entries) < size:
+        website = "https://www.{}{}.com".format(_word(rng, rng.randint(4, 10)), i)
+        for _ in range(2 if rng.random() < 0.25 else 1):
+            entries.append(
+                Entry(website, _word(rng, 8), _word(rng, 12) + str(rng.randint(0, 99)))
+            )
+        i += 1
+    return entries[:size]
+
+
+def _misspell(rng, website):
+    # website with one character replaced, inserted or removed.
+    i = rng.randrange(len("https://www."), len(website) - len(".com"))
+    kind = rng.randrange(3)
+    if kind == 0:
+        return website[:i] + rng.choice(string.ascii_lowercase) + website[i + 1 :]
+    if kind == 1:
+        return website[:i] + rng.choice(string.ascii_lowercase) + website[i:]
+    return website[:i] + website[i + 1 :]
+
+
+def _record(name, size, ops, times, **params):
+    # Builds the result record of a benchmark run repeat times.
+    record = {
+        "benchmark": name,
+        "size": size,
+        "ops": ops,
+        "best_us": round(min(times) / ops * 1e6, 3),
+        "mean_us": round(sum(times) / len(times) / ops * 1e6, 3),
+    }
+    record.update(params)
+    return record
+
+
+def _timed(func, *args):
+    # Runs func(*args) and returns the elapsed seconds.
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def bench_database(size, ops, repeat):
+    """Measures lookups (exact and by domain), additions, updates, removals,
+    suggestions and queries on a PasswordDB, and lookups, additions and removals
+    through a PasswordManager without storage.
+
+    Args:
+        size (int): Number of entries in the vault.
+        ops (int): Number of operations per run.
+        repeat (int): Number of runs.
+
+    Returns:
+        records (list): Result records.
+
+    """
+
+    rng = random.Random(size)
+    entries = synthetic_entries(size)
+    # creation times spread over two years, from a separate generator so the other
+    # samples stay comparable with earlier runs
+    time_rng = random.Random(-size)
+    now = int(time.time())
+    for entry in entries:
+        entry.created_at = now - time_rng.randrange(2 * 365 * 86400)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pw_db = PasswordDB(list(entries))
+        times.append(time.perf_counter() - start)
+    records = [_record("database_build", size, size, times)]
+
+    websites = [rng.choice(entries).website for _ in range(ops)]
+    new_entries = synthetic_entries(ops, seed=size + 1)
+    for entry in new_entries:
+        entry.website += "/new"
+    targets = [rng.choice(entries) for _ in range(ops)]
+    typos = [_misspell(rng, website) for website in websites]
+    # subdomains of stored websites, found through their parent domains
+    subdomains = ["login." + normalize_website(website) for website in websites]
+
+    def select():
+        for website in websites:
+            pw_db.select_entry(website)
+
+    def select_by_domain():
+        for website in subdomains:
+            pw_db.select_entry(website)
+
+    def add():
+        for entry in new_entries:
+            pw_db.add_entry(entry)
+
+    def remove():
+        for entry in new_entries:
+            pw_db.remove_entry(entry)
+
+    def update():
+        for entry in targets:
+            pw_db.update_entry(entry, "p", "updated-password")
+
+    def suggest():
+        for website in typos:
+            pw_db.suggest_websites(website)
+
+    manager = PasswordManager(pw_db)
+    rows = [(entry.website, entry.username, entry.password) for entry in new_entries]
+
+    def manager_get():
+        for website in websites:
+            manager.get(website)
+
+    def manager_add():
+        for row in rows:
+            manager.add(*row)
+
+    def manager_remove():
+        for website, username, _ in rows:
+            manager.remove(website, username)
+
+    # the first lookup by domain builds the domain index
+    records.append(
+        _record(
+            "select_entry_by_domain_first",
+            size,
+            1,
+            [_timed(pw_db.select_entry, subdomains[0])],
+        )
+    )
+    timings = {
+        "select_entry": [],
+        "select_entry_by_domain": [],
+        "add_entry": [],
+        "remove_entry": [],
+        "update_entry": [],
+        "manager_get": [],
+        "manager_add": [],
+        "manager_remove": [],
+    }
+    for _ in range(repeat):
+        timings["select_entry"].append(_timed(select))
+        timings["select_entry_by_domain"].append(_timed(select_by_domain))
+        timings["add_entry"].append(_timed(add))
+        # removes the entries just added, so every run starts from the same vault
+        timings["remove_entry"].append(_timed(remove))
+        timings["update_entry"].append(_timed(update))
+        timings["manager_get"].append(_timed(manager_get))
+        timings["manager_add"].append(_timed(manager_add))
+        timings["manager_remove"].append(_timed(manager_remove))
+    for name, times in timings.items():
+        records.append(_record(name, size, ops, times))
+
+    # the first suggestion builds the trigram index
+    records.append(
+        _record("suggest_websites_first", size, 1, [_timed(pw_db.suggest_websites, typos[0])])
+    )
+    records.append(
+        _record("suggest_websites", size, ops, [_timed(suggest) for _ in range(repeat)])
+    )
+
+    usernames = [entry.username for entry in targets]
+    times = sorted(entry.created_at for entry in entries)
+    # windows holding about ten entries each
+    windows = [
+        (times[i], times[min(i + 10, size - 1)])
+        for i in (rng.randrange(size) for _ in range(ops))
+    ]
+
+    def query_username():
+        for username in usernames:
+            for _ in pw_db.query(username=username):
+                pass
+
+    def query_time():
+        for since, before in windows:
+            for _ in pw_db.query(since=since, before=before):
+                pass
+
+    # the first queries build the username and time indexes
+    records.append(
+        _record(
+            "query_indexes_first",
+            size,
+            1,
+            [
+                _timed(
+                    lambda: (list(pw_db.query(username="")), list(pw_db.query(since=0)))
+                )
+            ],
+        )
+    )
+    records.append(
+        _record("query_username", size, ops, [_timed(query_username) for _ in range(repeat)])
+    )
+    records.append(
+        _record("query_time_range", size, ops, [_timed(query_time) for _ in range(repeat)])
+    )
+    return records
+
+
+def bench_memory(size):
+    """Measures the memory held per entry, traced with tracemalloc, by the entries
+    (strings included) and by a PasswordDB of them with all its indexes built.
+
+    Args:
+        size (int): Number of entries in the vault.
+
+    Returns:
+        records (list): Result records.
+
+    """
+
+    tracemalloc.start()
+    try:
+        entries = synthetic_entries(size)
+        entries_bytes = tracemalloc.get_traced_memory()[0]
+        pw_db = PasswordDB(entries)
+        # the indexes built on first use
+        pw_db.suggest_websites(entries[0].website)
+        list(pw_db.query(username=""))
+        list(pw_db.query(since=0))
+        pw_db.select_entry("login." + normalize_website(entries[0].website))
+        total_bytes = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return [
+        {
+            "benchmark": "memory_entries",
+            "size": size,
+            "bytes_per_entry": round(entries_bytes / size, 1),
+        },
+        {
+            "benchmark": "memory_database",
+            "size": size,
+            "bytes_per_entry": round(total_bytes / size, 1),
+        },
+    ]
+
+
+def bench_storage(size, ops, repeat):
+    """Measures saving and loading an encrypted vault with every storage backend.
+
+    Saving happens as in Menu.menu_choice: one change followed by a commit, and
+    for comparison with all changes applied in one batch and a single commit.
+
+    Args:
+        size (int): Number of entries in the vault.
+        ops (int): Number of changes committed one by one per run.
+        repeat (int): Number of runs.
+
+    Returns:
+        records (list): Result records.
+
+    """
+
+    records = []
+    entries = synthetic_entries(size)
+    new_entries = synthetic_entries(ops, seed=size + 1)
+    for entry in new_entries:
+        entry.website += "/new"
+    directory = tempfile.mkdtemp()
+    try:
+        for name, backend in (
+            ("pickle", PickleStorage),
+            ("journal", JournalStorage),
+            ("sqlite", SQLiteStorage),
+        ):
+            path = os.path.join(directory, "vault_" + name)
+            storage = backend(path)
+            storage.initialize("benchmark", KDF_PARAMS)
+            pw_db = storage.load()
+            pw_db.add_entries(iter(entries))
+            storage.close(pw_db)
+
+            load_times, commit_times, batch_times = [], [], []
+            for _ in range(repeat):
+                storage = backend(path)
+                storage.unlock("benchmark")
+                start = time.perf_counter()
+                pw_db = storage.load()
+                # a lookup, so lazily loading backends are measured until first use
+                pw_db.select_entry(entries[-1].website)
+                load_times.append(time.perf_counter() - start)
+
+                def commit_changes():
+                    for entry in new_entries:
+                        pw_db.add_entry(entry)
+                        storage.commit(pw_db)
+                    for entry in new_entries:
+                        pw_db.remove_entry(entry)
+                        storage.commit(pw_db)
+
+                def commit_batches():
+                    with pw_db.batch() as batch:
+                        for entry in new_entries:
+                            batch.add_entry(entry)
+                    storage.commit(pw_db)
+                    with pw_db.batch() as batch:
+                        for entry in new_entries:
+                            batch.remove_entry(entry)
+                    storage.commit(pw_db)
+
+                commit_times.append(_timed(commit_changes))
+                batch_times.append(_timed(commit_batches))
+                storage.close(pw_db)
+            records.append(_record("storage_load", size, 1, load_times, backend=name))
+            records.append(
+                _record("storage_commit", size, 2 * ops, commit_times, backend=name)
+            )
+            records.append(
+                _record(
+                    "storage_batch_commit", size, 2 * ops, batch_times, backend=name
+                )
+            )
+    finally:
+        shutil.rmtree(directory)
+    return records
+
+
+def bench_audit(size, repeat):
+    """Measures an audit of a vault in which every tenth password is generated and
+    every hundredth reused, in this process and with a process pool.
+
+    Args:
+        size (int): Number of entries in the vault.
+        repeat (int): Number of runs.
+
+    Returns:
+        records (list): Result records.
+
+    """
+
+    entries = synthetic_entries(size)
+    for i in range(0, size, 10):
+        entries[i].password = generate_random_pw()
+    for i in range(1, size - 1, 100):
+        entries[i].password = entries[i + 1].password
+    pw_db = PasswordDB(entries)
+    records = []
+    for processes in (None, os.cpu_count()):
+        times = [
+            _timed(lambda: sum(1 for _ in audit_entries(pw_db, processes=processes)))
+            for _ in range(repeat)
+        ]
+        records.append(_record("audit", size, size, times, processes=processes or 1))
+    return records
+
+
+def bench_generation(ops, repeat):
+    """Measures password generation under different length and exclusion rules.
+
+    Args:
+        ops (int): Number of passwords per run.
+        repeat (int): Number of runs.
+
+    Returns:
+        records (list): Result records.
+
+    """
+
+    records = []
+    for rules, args in GENERATION_RULES.items():
+        # the first call loads the wordlist and builds the character pools
+        generate_random_pw(*args)
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(ops):
+                generate_random_pw(*args)
+            times.append(time.perf_counter() - start)
+        records.append(_record("generate_random_pw", 0, ops, times, rules=rules))
+    return records
+
+
+def _key(record):
+    # Identifies a benchmark across runs.
+    return (
+        record["benchmark"],
+        record["size"],
+        record.get("backend"),
+        record.get("rules"),
+        record.get("processes"),
+    )
+
+
+def compare(records, baseline):
+    """Prints the change of every benchmark against an earlier run to stderr.
+
+    Args:
+        records (list): Result records of this run.
+        baseline (list): Result records of the earlier run.
+
+    """
+
+    earlier = {_key(record): record for record in baseline if "benchmark" in record}
+    for record in records:
+        before = earlier.get(_key(record))
+        # memory records are compared by their bytes per entry
+        if "best_us" in record:
+            field, unit = "best_us", "us"
+        else:
+            field, unit = "bytes_per_entry", "B"
+        if before is None or not before.get(field):
+            continue
+        ratio = record[field] / before[field]
+        print(
+            "{:<24} {:>8} {:<15} {:>12.3f} {} -> {:>12.3f} {}  ({:+.1%})".format(
+                record["benchmark"],
+                record["size"],
+                record.get("backend")
+                or record.get("rules")
+                or record.get("processes")
+                or "",
+                before[field],
+                unit,
+                record[field],
+                unit,
+                ratio - 1,
+            ),
+            file=sys.stderr,
+        )
+
+
+def main():
+    """Runs the selected benchmarks and prints the results as JSON lines."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=SIZES, help="vault sizes (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--ops", type=int, default=1000, help="operations per run (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--commits",
+        type=int,
+        default=5,
+        help="changes committed one by one per storage run (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="runs per benchmark (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--only",
+        choices=("database", "memory", "storage", "audit", "generation"),
+        nargs="+",
+        default=("database", "memory", "storage", "audit", "generation"),
+        help="benchmark groups to run (default: all)",
+    )
+    parser.add_argument("--baseline", help="JSON lines of an earlier run to compare with")
+    args = parser.parse_args()
+
+    print(
+        json.dumps(
+            {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "time": int(time.time()),
+            }
+        ),
+        flush=True,
+    )
+    records = []
+
+    def emit(results):
+        for record in results:
+            print(json.dumps(record), flush=True)
+        records.extend(results)
+
+    for size in args.sizes:
+        if "database" in args.only:
+            emit(bench_database(size, min(args.ops, size), args.repeat))
+        if "memory" in args.only:
+            emit(bench_memory(size))
+        if "storage" in args.only:
+            emit(bench_storage(size, args.commits, args.repeat))
+        if "audit" in args.only:
+            emit(bench_audit(size, args.repeat))
+    if "generation" in args.only:
+        emit(bench_generation(args.ops, args.repeat))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            compare(records, [json.loads(line) for line in file if line.strip()])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,82 @@
-"""Main file. If python __main__.de is called, starts password manager"""
+"""Main file. If python __main__.py is called, starts password manager.
 
-import pickle
+Options:
+    --storage journal|pickle|sqlite: How the database is stored (default journal,
+        in password_db.p and password_db.p.journal; sqlite uses password_db.sqlite).
+    --delay SECONDS: How long the menu shows a message before it is shown again (default 4).
+    --breach-corpus PATH: Corpus of breached passwords (default breached_passwords.bin,
+        used if it exists). Breached passwords are rejected unless confirmed, never
+        generated and reported by audit.
+    --stats: Prints call counts and latencies of the hot paths on exit (see module
+        instrument; also enabled by the environment variable PW_MANAGER_STATS).
+    --profile PATH: Like --stats, and writes a cProfile trace of the run to PATH.
+    --vault NAME: Vault to open (default: the database above, named 'default'). Other
+        vaults are listed in vaults.json and stored in vaults/NAME/, each with its own
+        master password; only the opened vault is unlocked and loaded.
+Subcommands (run without a subcommand for the interactive menu):
+    import FILE [--format csv|jsonl]: Adds all entries of FILE to the database.
+    export FILE [--format csv|jsonl]: Writes all entries of the database to FILE.
+    agent [--idle-timeout SECONDS]: Unlocks the database once and serves the client
+        commands below over a Unix socket until it is idle or stopped.
+    audit [--max-age DAYS] [--min-bits BITS] [--processes N] [--json]: Prints reused,
+        weak and breached passwords and entries older than DAYS (default 365), one per line.
+    build-corpus DUMP [--format plain|sha1]: Builds the corpus of breached passwords from
+        a text dump of passwords or SHA-1 hashes, one per line ('-' for stdin).
+    vault list: Lists all vaults with their storage and path.
+    vault create NAME [--storage journal|pickle|sqlite]: Adds a vault to the catalog and
+        sets its master password.
+    vault forget NAME: Removes a vault from the catalog; its files are kept.
+FILE may be '-' for stdin/stdout; CSV files have the columns website, username, password, created_at.
+Client commands (need a running agent, only ask for a master password to mount --vault):
+    get WEBSITE [USERNAME] [--json]: Prints the password (or the whole entry as JSON).
+    search WEBSITE [--all-vaults]: Prints stored websites similar to WEBSITE (in all
+        vaults mounted in the agent, with their vault).
+    add WEBSITE USERNAME [--allow-breached]: Adds an entry; asks for its password.
+    update WEBSITE USERNAME w|u|p [VALUE] [--allow-breached]: Updates website, username
+        or password (asks for the value if not given).
+    history WEBSITE USERNAME [--json]: Lists the earlier versions of an entry, newest first.
+    rollback WEBSITE USERNAME [N]: Restores version N (default 1, the latest) of the history.
+    delete WEBSITE USERNAME: Deletes an entry.
+    stop: Stops the agent.
+All agent commands accept --socket PATH (default: see agent.default_socket_path).
+With --vault NAME, client commands act on that vault; the agent mounts it on first
+access, for which the client asks for its master password.
+The database is encrypted with a key derived from the master password; the key record
+is stored next to it (e.g. password_db.p.key). A master password set by an earlier
+version (secret.py) is migrated on the first start.
+
+Only what is needed to ask for the master password is imported up front; the menu,
+import/export and password generation are imported once they are used.
+"""
+
+import argparse
 import hashlib
-from menu_class import Menu
-from pw_classes import PasswordDB
+import itertools
+import os
+import re
+import sys
 from getpass import getpass
+from exceptions import ConflictError
+import instrument
+from storage import BACKENDS as STORAGE_BACKENDS
+from breach import DEFAULT_CORPUS, FORMATS as BREACH_FORMATS
+from transfer import FORMATS, format_from_path
+from vaults import DEFAULT_VAULT, Catalog, VaultSet
+
+CLIENT_COMMANDS = (
+    "get",
+    "search",
+    "add",
+    "update",
+    "history",
+    "rollback",
+    "delete",
+    "stop",
+)
+# secret.py of earlier versions, written to the working directory
+LEGACY_SECRET = "secret.py"
+LEGACY_SECRET_PATTERN = re.compile(r"master_password = '([0-9a-f]{64})'")
+
 
 def validate_master_pw(input_password, master_password):
     """Validates hashed input password against hashed master password.
@@ -22,43 +94,580 @@ def validate_master_pw(input_password, master_password):
         return False
 
 
-try:
-    from secret import master_password
-except (ModuleNotFoundError, ImportError):
-    created = False
-    while created == False:
-        pw = getpass("Set master password: ")
-        pw_hashed = hashlib.sha256(pw.encode()).hexdigest()
-        with open("secret.py", "w") as file:
-            file.write(f"master_password = '{pw_hashed}'")
-        print("Master password set")
-        created = True
-        master_password = pw_hashed
-access = False
-tries = 2
-print('+++++++++ Welcome to your password manager +++++++++')
-while tries >= 0 and access == False:
-    pw_given = getpass("Password: ")
-    if validate_master_pw(pw_given, master_password):
-        access = True
-    else:
+def parse_args():
+    """Parses the command line arguments."""
+    parser = argparse.ArgumentParser(description="A simple password manager.")
+    parser.add_argument(
+        "--storage",
+        choices=STORAGE_BACKENDS,
+        default="journal",
+        help="how the database is stored (default: journal)",
+    )
+    parser.add_argument(
+        "--delay",
+        type=float,
+        default=4,
+        help="seconds the menu shows a message before it is shown again (default: 4)",
+    )
+    parser.add_argument(
+        "--breach-corpus",
+        default=DEFAULT_CORPUS,
+        help="corpus of breached passwords, used if it exists (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print call counts and latencies of the hot paths on exit",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="like --stats, and write a cProfile trace of the run to PATH",
+    )
+    parser.add_argument(
+        "--vault",
+        metavar="NAME",
+        help="vault to open, see 'vault list' (default: {})".format(DEFAULT_VAULT),
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    for command, help_text in (
+        ("import", "add all entries of a CSV or JSONL file to the database"),
+        ("export", "write all entries of the database to a CSV or JSONL file"),
+    ):
+        subparser = subparsers.add_parser(command, help=help_text)
+        subparser.add_argument("file", help="path of the file, '-' for stdin/stdout")
+        subparser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="file format, inferred from the file extension by default",
+        )
+    subparser = subparsers.add_parser(
+        "agent", help="unlock the database once and serve client commands"
+    )
+    subparser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=15 * 60,
+        help="seconds without a request after which the agent exits (default: 900)",
+    )
+    subparser.add_argument("--socket", help="path of the agent socket")
+    subparser = subparsers.add_parser(
+        "audit", help="report reused and weak passwords and stale entries"
+    )
+    subparser.add_argument(
+        "--max-age",
+        type=float,
+        default=365,
+        help="days after which an entry is stale (default: 365)",
+    )
+    subparser.add_argument(
+        "--min-bits",
+        type=float,
+        default=40,
+        help="estimated strength below which a password is weak (default: 40)",
+    )
+    subparser.add_argument(
+        "--processes",
+        type=int,
+        default=os.cpu_count(),
+        help="worker processes scoring passwords (default: number of CPUs)",
+    )
+    subparser.add_argument(
+        "--json", action="store_true", help="print every finding as a JSON object"
+    )
+    subparser = subparsers.add_parser(
+        "build-corpus", help="build the corpus of breached passwords from a text dump"
+    )
+    subparser.add_argument(
+        "dump", help="text file with one password or SHA-1 hash per line, '-' for stdin"
+    )
+    subparser.add_argument(
+        "--format",
+        choices=BREACH_FORMATS,
+        help="passwords or hexadecimal SHA-1 hashes, inferred from the first line by default",
+    )
+    subparser = subparsers.add_parser("vault", help="list, create or forget vaults")
+    actions = subparser.add_subparsers(dest="action", required=True)
+    actions.add_parser("list", help="list all vaults with their storage and path")
+    action = actions.add_parser(
+        "create", help="add a vault to the catalog and set its master password"
+    )
+    action.add_argument("name")
+    action.add_argument(
+        "--storage",
+        choices=STORAGE_BACKENDS,
+        default="journal",
+        help="how the vault is stored (default: journal)",
+    )
+    action = actions.add_parser(
+        "forget", help="remove a vault from the catalog, keeping its files"
+    )
+    action.add_argument("name")
+    for command, help_text, arguments in (
+        ("get", "print the password of an entry", ("website", "username?")),
+        ("search", "print stored websites similar to a website", ("website",)),
+        ("add", "add an entry", ("website", "username")),
+        ("update", "update an entry", ("website", "username", "field", "value?")),
+        ("history", "list earlier versions of an entry", ("website", "username")),
+        (
+            "rollback",
+            "restore an earlier version of an entry",
+            ("website", "username", "n?"),
+        ),
+        ("delete", "delete an entry", ("website", "username")),
+        ("stop", "stop the agent", ()),
+    ):
+        subparser = subparsers.add_parser(command, help=help_text + " via the agent")
+        for argument in arguments:
+            if argument == "n?":
+                subparser.add_argument(
+                    "n",
+                    nargs="?",
+                    type=int,
+                    help="version to restore, 1 (default) for the one before the last change",
+                )
+            elif argument.endswith("?"):
+                subparser.add_argument(argument[:-1], nargs="?")
+            else:
+                subparser.add_argument(argument)
+        subparser.add_argument("--socket", help="path of the agent socket")
+        if command == "get":
+            subparser.add_argument(
+                "--json", action="store_true", help="print the whole entry as JSON"
+            )
+        if command == "history":
+            subparser.add_argument(
+                "--json", action="store_true", help="print every version as JSON"
+            )
+        if command == "search":
+            subparser.add_argument(
+                "--all-vaults",
+                action="store_true",
+                help="search all vaults mounted in the agent",
+            )
+        if command in ("add", "update"):
+            subparser.add_argument(
+                "--allow-breached",
+                action="store_true",
+                help="accept a password listed in the breached password corpus",
+            )
+    args = parser.parse_args()
+    if args.command == "update" and args.field not in ("w", "u", "p"):
+        parser.error("field must be one of w (website), u (username) or p (password)")
+    if args.command in ("import", "export") and not args.format:
+        if args.file == "-":
+            parser.error("--format is required when reading stdin or writing stdout")
+        try:
+            args.format = format_from_path(args.file)
+        except ValueError as e:
+            parser.error(str(e))
+    return args
+
+
+def read_legacy_master_pw():
+    """Reads the hashed master password of an earlier version from secret.py.
+
+    The file is read as data and never imported. It is looked for in the working
+    directory, where it was written, and next to this file, from where it was imported.
+
+    Returns:
+        path (str): Path of secret.py, or None if there is none.
+        master_password (str): Hashed master password, or None if there is none.
+
+    """
+
+    for directory in (os.getcwd(), os.path.dirname(os.path.abspath(__file__))):
+        path = os.path.join(directory, LEGACY_SECRET)
+        try:
+            with open(path) as file:
+                match = LEGACY_SECRET_PATTERN.search(file.read())
+        except FileNotFoundError:
+            continue
+        if match:
+            return path, match.group(1)
+    return None, None
+
+
+def ask_master_pw(check):
+    """Asks for the master password up to three times.
+
+    Args:
+        check (callable): Called with the given password, returns True if it is correct.
+
+    Returns:
+        password (str): The correct password, or None if all tries failed.
+
+    """
+
+    tries = 2
+    while tries >= 0:
+        pw_given = getpass("Password: ")
+        if check(pw_given):
+            return pw_given
         if tries >= 1:
             print(
-                "Password not correct. You have {} tries left.".format(tries)
+                "Password not correct. You have {} tries left.".format(tries),
+                file=sys.stderr,
             )
-    tries -= 1
-if not access:
-    print("No tries left. System exits.")
-if access:
+        tries -= 1
+    return None
+
+
+def unlock_storage(storage, legacy=True):
+    """Unlocks storage with the master password, setting or migrating it first if needed.
+
+    Args:
+        storage (StorageBackend): Storage to unlock.
+        legacy (bool): Whether to migrate the master password of an earlier version
+                       (secret.py) if one exists. Defaults to True.
+
+    Returns:
+        access (bool): True if the storage was unlocked.
+
+    """
+
+    if storage.has_key():
+        return ask_master_pw(storage.unlock) is not None
+    from crypto import calibrate_kdf
+
+    secret_path, master_password = None, None
+    if legacy:
+        secret_path, master_password = read_legacy_master_pw()
+    if secret_path is not None:
+        # master password of an earlier version, only stored as a hash
+        pw_given = ask_master_pw(lambda pw: validate_master_pw(pw, master_password))
+        if pw_given is None:
+            return False
+        storage.initialize(pw_given, calibrate_kdf())
+        os.remove(secret_path)
+        print("Database encrypted with your master password", file=sys.stderr)
+        return True
+    pw_given = getpass("Set master password: ")
+    storage.initialize(pw_given, calibrate_kdf())
+    print("Master password set", file=sys.stderr)
+    return True
+
+
+def mount_vault(vault):
+    """Unlocks the storage of a vault, asking for its master password, and reports
+    whether its database exists. Only the default vault migrates secret.py.
+
+    Args:
+        vault (Vault): Vault to unlock.
+
+    Returns:
+        access (bool): True if the storage was unlocked.
+
+    """
+
+    if not unlock_storage(vault.storage, legacy=vault.name == DEFAULT_VAULT):
+        return False
+    if vault.storage.exists():
+        print("Database loaded from {}".format(vault.storage.path), file=sys.stderr)
+    else:
+        print("New database initiated", file=sys.stderr)
+    return True
+
+
+@instrument.timed("import")
+def run_import(pw_db, storage, path, fmt):
+    """Imports entries from path into pw_db and persists them once."""
+    from transfer import import_entries
+
+    # undecodable lines are reported with their line number by import_entries
+    if path == "-":
+        sys.stdin.reconfigure(errors="surrogateescape")
+        added, skipped, errors = import_entries(pw_db, sys.stdin, fmt)
+    else:
+        with open(path, newline="", errors="surrogateescape") as file:
+            added, skipped, errors = import_entries(pw_db, file, fmt)
     try:
-        with open("password_db.p", "rb") as file:
-            pw_db = pickle.load(file)
-        assert isinstance(pw_db, PasswordDB)
-        print("Database loaded from password_db.p")
-    except FileNotFoundError:
-        pw_db = PasswordDB()
-        print("New database initiated")
-
-    menu = Menu(pw_db)
-    menu.menu_choice()
-    exit()
+        storage.close(pw_db)
+    except ConflictError as e:
+        # entries another process added in the meantime
+        print(e, file=sys.stderr)
+    for line_num, message in errors:
+        print("Line {}: {}".format(line_num, message), file=sys.stderr)
+    print(
+        "{} entries imported, {} already listed, {} invalid.".format(
+            added, skipped, len(errors)
+        ),
+        file=sys.stderr,
+    )
+
+
+@instrument.timed("export")
+def run_export(pw_db, path, fmt):
+    """Exports all entries of pw_db to path."""
+    from transfer import export_entries
+
+    if path == "-":
+        exported = export_entries(pw_db, sys.stdout, fmt)
+    else:
+        with open(path, "w", newline="") as file:
+            exported = export_entries(pw_db, file, fmt)
+    print("{} entries exported.".format(exported), file=sys.stderr)
+
+
+def run_client(args):
+    """Sends a client command to the running agent and prints its result.
+
+    Returns:
+        status (int): Exit status, 1 if the agent reported an error.
+
+    """
+
+    import json
+    from agent import AgentClient, AgentError
+
+    request = {
+        name: getattr(args, name)
+        for name in ("website", "username", "field", "value", "n", "vault")
+        if getattr(args, name, None) is not None
+    }
+    if args.command == "add":
+        request["password"] = getpass("Password (leave blank for none): ") or None
+    if args.command == "update" and "value" not in request:
+        request["value"] = getpass("New value: ")
+    if getattr(args, "allow_breached", False):
+        request["allow_breached"] = True
+    if getattr(args, "all_vaults", False):
+        request["all_vaults"] = True
+    try:
+        with AgentClient(args.socket) as client:
+            if args.vault and args.command != "stop":
+                if not mount_agent_vault(client, args.vault):
+                    print("No tries left.", file=sys.stderr)
+                    return 1
+            result = client.request(args.command, **request)
+    except AgentError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if args.command == "get":
+        if args.json:
+            print(json.dumps(result))
+        elif result["password"] is not None:
+            print(result["password"])
+    elif args.command == "search":
+        for match in result:
+            if args.all_vaults:
+                print("{website} ({vault})".format(**match))
+            else:
+                print(match)
+    elif args.command == "history":
+        for n, version in enumerate(result, 1):
+            if args.json:
+                print(json.dumps(dict(version, n=n)))
+            else:
+                print(
+                    "{}: {} with username {} created/updated at {}.".format(
+                        n, version["website"], version["username"], version["created_at"]
+                    )
+                )
+    return 0
+
+
+def mount_agent_vault(client, name):
+    """Mounts a vault in the agent unless it is mounted, asking for its master password.
+
+    Args:
+        client (AgentClient): Connection to the agent.
+        name (str): Name of the vault.
+
+    Returns:
+        mounted (bool): True if the vault is mounted.
+
+    Raises:
+        AgentError: If the agent has no vault of the name.
+
+    """
+
+    from agent import AgentError
+
+    mounted = {vault["name"]: vault["mounted"] for vault in client.request("vaults")}
+    if name not in mounted:
+        raise AgentError("No vault named {}.".format(name))
+    if mounted[name]:
+        return True
+
+    def check(password):
+        try:
+            client.request("mount", vault=name, password=password)
+        except AgentError:
+            return False
+        return True
+
+    return ask_master_pw(check) is not None
+
+
+@instrument.timed("audit")
+def run_audit(manager, args):
+    """Prints the findings of an audit as they are found and a summary at the end."""
+    import json
+
+    counts = {"reused": 0, "weak": 0, "breached": 0, "stale": 0}
+    for finding in manager.audit(args.max_age, args.min_bits, args.processes):
+        counts[finding.kind] += 1
+        if args.json:
+            print(json.dumps(finding._asdict()), flush=True)
+            continue
+        if finding.kind == "reused":
+            detail = "same password as {} ({})".format(*finding.detail)
+        elif finding.kind == "weak":
+            detail = "about {} bits".format(finding.detail)
+        elif finding.kind == "breached":
+            detail = "listed in {}".format(manager.breach_corpus.filepath)
+        else:
+            detail = "{} days old".format(finding.detail)
+        print(
+            "{:<8} {} ({}): {}".format(finding.kind, finding.website, finding.username, detail),
+            flush=True,
+        )
+    print(
+        "{} entries audited: {reused} reused, {weak} weak, {breached} breached "
+        "and {stale} stale.".format(len(manager), **counts),
+        file=sys.stderr,
+    )
+
+
+def run_build_corpus(args):
+    """Builds the corpus of breached passwords from a text dump."""
+    from breach import build_corpus, format_from_line
+
+    if args.dump == "-":
+        file = sys.stdin
+    else:
+        file = open(args.dump, encoding="utf-8", errors="surrogateescape")
+    with file:
+        first = file.readline()
+        fmt = args.format or format_from_line(first)
+        try:
+            count = build_corpus(
+                itertools.chain([first], file), args.breach_corpus, fmt
+            )
+        except ValueError as e:
+            print("{}: {}".format(args.dump, e), file=sys.stderr)
+            return 1
+    print(
+        "{} breached passwords written to {}.".format(count, args.breach_corpus),
+        file=sys.stderr,
+    )
+
+
+def open_breach_corpus(path):
+    """Opens the corpus of breached passwords at path, None if there is none."""
+    if not os.path.exists(path):
+        return None
+    from breach import BreachCorpus
+
+    return BreachCorpus(path)
+
+
+def run_vault(args):
+    """Lists, creates or forgets the vaults of the catalog.
+
+    Returns:
+        status (int): Exit status, 1 if the vault name is not valid or unknown.
+
+    """
+
+    from exceptions import PasswordManagerError
+
+    catalog = Catalog()
+    try:
+        if args.action == "list":
+            default_path = STORAGE_BACKENDS[args.storage]().path
+            vaults = [(DEFAULT_VAULT, args.storage, default_path)]
+            vaults += [(name,) + catalog.record(name) for name in catalog.names()]
+            for name, storage, path in vaults:
+                print(
+                    "{:<20} {:<8} {}{}".format(
+                        name,
+                        storage,
+                        path,
+                        "" if STORAGE_BACKENDS[storage](path).exists() else " (empty)",
+                    )
+                )
+        elif args.action == "create":
+            path = catalog.add(args.name, args.storage)
+            unlock_storage(STORAGE_BACKENDS[args.storage](path), legacy=False)
+            print("Vault {} created in {}".format(args.name, path), file=sys.stderr)
+        else:
+            path = catalog.forget(args.name)
+            print(
+                "Vault {} removed from the catalog, its files are kept in {}".format(
+                    args.name, os.path.dirname(path)
+                ),
+                file=sys.stderr,
+            )
+    except PasswordManagerError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+def run_agent(manager, args, vaults):
+    """Serves manager, and vaults mounted later on, over the agent socket until the
+    agent is idle or stopped."""
+    from agent import Agent, AgentError
+
+    try:
+        agent = Agent(manager, args.socket, args.idle_timeout, vaults)
+        print("Agent listening on {}".format(agent.socket_path), file=sys.stderr)
+        agent.run()
+    except AgentError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print("Agent stopped, database locked", file=sys.stderr)
+    return 0
+
+
+def main():
+    """Asks for the master password and runs the menu or the given subcommand."""
+    args = parse_args()
+    if args.stats or args.profile:
+        instrument.enable(args.profile)
+    if args.command in CLIENT_COMMANDS:
+        return run_client(args)
+    if args.command == "build-corpus":
+        return run_build_corpus(args)
+    if args.command == "vault":
+        return run_vault(args)
+    from exceptions import VaultLockedError, VaultNotFoundError
+
+    # only the catalog is read here; a vault is unlocked and loaded on first access
+    vaults = VaultSet(
+        Catalog(),
+        mount_vault,
+        args.storage,
+        breach_corpus=open_breach_corpus(args.breach_corpus),
+    )
+    try:
+        vaults.vault(args.vault or DEFAULT_VAULT)
+    except VaultNotFoundError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print('+++++++++ Welcome to your password manager +++++++++', file=sys.stderr)
+    try:
+        manager = vaults.manager(args.vault or DEFAULT_VAULT)
+    except VaultLockedError:
+        print("No tries left. System exits.", file=sys.stderr)
+        return
+
+    if args.command == "import":
+        run_import(manager.pw_db, manager.storage, args.file, args.format)
+    elif args.command == "export":
+        run_export(manager.pw_db, args.file, args.format)
+    else:
+        if args.command == "agent":
+            return run_agent(manager, args, vaults)
+        if args.command == "audit":
+            return run_audit(manager, args)
+        from menu_class import Menu
+
+        menu = Menu(manager, args.delay)
+        menu.menu_choice()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
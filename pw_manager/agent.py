@@ -0,0 +1,541 @@
+"""Module agent -- long-running agent serving an unlocked PasswordDB over a Unix socket.
+
+The agent is started once with the master password and keeps the database in memory
+until it has been idle for idle_timeout seconds or is stopped. Clients send one JSON
+object per line and receive one JSON object per line, e.g.
+
+    {"op": "get", "website": "www.example.com", "username": "me"}
+    {"ok": true, "result": {"website": "www.example.com", "username": "me", ...}}
+
+Operations: get, find, add, update, history, rollback, delete, search, vaults, mount
+and stop (see Agent.handle_request). Requests act on the vault the agent was started
+with, or on the mounted vault named by their 'vault' argument.
+The socket is only accessible to the user running the agent.
+
+Function default_socket_path():
+    Path of the agent socket of the current user.
+Class Agent:
+    Serves requests on a PasswordManager over a Unix socket.
+Class AgentClient:
+    Connection to a running agent.
+Class AgentError:
+    Error reported by the agent, or raised if no agent is running.
+
+"""
+
+import asyncio
+from contextlib import AsyncExitStack
+import json
+import os
+import socket
+import stat
+import tempfile
+from manager import PasswordManager
+from pw_classes import format_timestamp
+from vaults import VaultSet
+
+# Seconds without a request after which the agent locks the database and exits
+IDLE_TIMEOUT = 15 * 60
+# Maximum length of a request line in bytes
+MAX_REQUEST = 64 * 1024
+
+
+def default_socket_path():
+    """Returns the path of the agent socket of the current user.
+
+    The socket lies in $XDG_RUNTIME_DIR if set, otherwise in a directory of the
+    temporary directory that only the user can access.
+
+    Returns:
+        path (str): Path of the socket.
+
+    Raises:
+        AgentError: If the directory in the temporary directory is not a directory
+                    of the user that only the user can access.
+
+    """
+
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if not runtime_dir:
+        runtime_dir = os.path.join(
+            tempfile.gettempdir(), "pw_manager-{}".format(os.getuid())
+        )
+        os.makedirs(runtime_dir, mode=0o700, exist_ok=True)
+        _check_private(runtime_dir)
+    return os.path.join(runtime_dir, "pw_manager-agent.sock")
+
+
+def _check_private(directory):
+    # Raises AgentError unless directory is a directory (not a symlink) of the user
+    # that no one else can access. Another user may have created it first, to
+    # replace the socket and read the passwords sent to it.
+    status = os.lstat(directory)
+    if (
+        not stat.S_ISDIR(status.st_mode)
+        or status.st_uid != os.getuid()
+        or status.st_mode & 0o077
+    ):
+        raise AgentError(
+            "{} is not a directory that only the current user can access.".format(
+                directory
+            )
+        )
+
+
+class AgentError(Exception):
+    """Error reported by the agent, or raised if no agent is running."""
+
+
+def _argument(request, name):
+    # Value of a required argument of a request.
+    if name not in request:
+        raise ValueError("Missing argument {}.".format(name))
+    return request[name]
+
+
+def _entry_dict(entry):
+    # JSON-serialisable representation of an Entry or a Version, as in exported files.
+    return {
+        "website": entry.website,
+        "username": entry.username,
+        "password": entry.password,
+        "created_at": format_timestamp(entry.created_at),
+    }
+
+
+class Agent:
+    """Serves requests on a PasswordManager over a Unix socket.
+
+    Requests of all connected clients are served concurrently by one event loop.
+    Requests on the same vault run one after the other, so every request sees and
+    leaves its database in a consistent state. Lookups run on the event loop; changes,
+    which are committed to the storage before they are acknowledged, and mounting a
+    vault run in a worker thread, so meanwhile requests on other vaults are served.
+
+    Args:
+        manager (PasswordManager): Password manager of the unlocked database, saving
+                                   every change.
+        socket_path (str): Path of the socket. Defaults to None (default_socket_path()).
+        idle_timeout (float): Seconds without a request after which the agent stops.
+                              Defaults to IDLE_TIMEOUT.
+        vaults (VaultSet): Vaults that requests may name, manager being the one of
+                           them requests act on by default. Further vaults are mounted
+                           by mount requests. Defaults to None (only manager).
+
+    Methods:
+        handle_request(request): Executes one request and returns the response.
+        run(): Serves requests until the agent is stopped or idle, then closes the storage.
+
+    Raises:
+        AgentError: If the directory of the default socket is not private
+                    (see default_socket_path).
+
+    """
+
+    def __init__(
+        self, manager, socket_path=None, idle_timeout=IDLE_TIMEOUT, vaults=None
+    ):
+        assert isinstance(manager, PasswordManager)
+        assert vaults is None or isinstance(vaults, VaultSet)
+        if socket_path is None:
+            socket_path = default_socket_path()
+        self.manager = manager
+        self.vaults = vaults
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self._stopped = None
+        self._idle_handle = None
+        # task serving a connection -> its writer, while the client is connected
+        self._clients = {}
+        # PasswordManager, or ('mount', vault name) -> asyncio.Lock serializing its requests
+        self._locks = {}
+
+    def _manager(self, request):
+        # Password manager of the vault named by the request, by default manager.
+        name = request.get("vault")
+        if name is None:
+            return self.manager
+        if self.vaults is None:
+            raise ValueError("The agent serves a single vault.")
+        return self.vaults.manager(name, mount=False)
+
+    def _get(self, request):
+        # Entry of the website-username combination, or the first entry of the website.
+        return _entry_dict(
+            self._manager(request).get(
+                _argument(request, "website"), request.get("username")
+            )
+        )
+
+    def _find(self, request):
+        # Entries matching username, creation time and domain criteria, in all
+        # mounted vaults if all_vaults is set.
+        criteria = {
+            "username": request.get("username"),
+            "since": request.get("since"),
+            "before": request.get("before"),
+            "domain": request.get("domain"),
+            "offset": request.get("offset", 0),
+            "limit": request.get("limit"),
+        }
+        if request.get("all_vaults") and self.vaults is not None:
+            return [
+                dict(_entry_dict(entry), vault=name)
+                for name, entry in self.vaults.find(**criteria)
+            ]
+        return [
+            _entry_dict(entry) for entry in self._manager(request).find(**criteria)
+        ]
+
+    def _add(self, request):
+        # Adds a new entry.
+        return _entry_dict(
+            self._manager(request).add(
+                request.get("website"),
+                request.get("username"),
+                request.get("password"),
+                bool(request.get("allow_breached")),
+            )
+        )
+
+    def _update(self, request):
+        # Sets the website ('w'), username ('u') or password ('p') of an entry.
+        return _entry_dict(
+            self._manager(request).update(
+                _argument(request, "website"),
+                _argument(request, "username"),
+                _argument(request, "field"),
+                _argument(request, "value"),
+                bool(request.get("allow_breached")),
+            )
+        )
+
+    def _history(self, request):
+        # Earlier versions of an entry, newest first.
+        return [
+            _entry_dict(version)
+            for version in self._manager(request).history(
+                _argument(request, "website"), _argument(request, "username")
+            )
+        ]
+
+    def _rollback(self, request):
+        # Restores an earlier version of an entry.
+        return _entry_dict(
+            self._manager(request).rollback(
+                _argument(request, "website"),
+                _argument(request, "username"),
+                request.get("n", 1),
+            )
+        )
+
+    def _delete(self, request):
+        # Removes an entry.
+        return _entry_dict(
+            self._manager(request).remove(
+                _argument(request, "website"), _argument(request, "username")
+            )
+        )
+
+    def _search(self, request):
+        # Websites similar to a (possibly misspelled) website name, in all mounted
+        # vaults as {'vault': name, 'website': website} if all_vaults is set.
+        website = _argument(request, "website")
+        if request.get("all_vaults") and self.vaults is not None:
+            return [
+                {"vault": name, "website": match}
+                for name, match in self.vaults.search(website, request.get("k", 3))
+            ]
+        return self._manager(request).suggest(website, request.get("k", 3))
+
+    def _vaults(self, request):
+        # Names of all vaults and whether they are mounted.
+        if self.vaults is None:
+            raise ValueError("The agent serves a single vault.")
+        mounted = set(self.vaults.mounted())
+        return [
+            {"name": name, "mounted": name in mounted} for name in self.vaults.names()
+        ]
+
+    def _mount(self, request):
+        # Unlocks and loads a vault with its master password.
+        if self.vaults is None:
+            raise ValueError("The agent serves a single vault.")
+        password = _argument(request, "password")
+        if not isinstance(password, str):
+            raise ValueError("Password must be a string.")
+        self.vaults.mount(
+            _argument(request, "vault"),
+            lambda vault: vault.storage.has_key() and vault.storage.unlock(password),
+        )
+        return None
+
+    def _stop(self, request):
+        # Stops the agent after answering.
+        self._stopped.set()
+        return None
+
+    OPERATIONS = {
+        "get": _get,
+        "find": _find,
+        "add": _add,
+        "update": _update,
+        "history": _history,
+        "rollback": _rollback,
+        "delete": _delete,
+        "search": _search,
+        "vaults": _vaults,
+        "mount": _mount,
+        "stop": _stop,
+    }
+
+    # operations that derive a key or commit to the storage, run in a worker thread
+    BLOCKING = frozenset(("add", "update", "rollback", "delete", "mount"))
+
+    def _lock(self, key):
+        # Lock serializing the requests on a vault, created on first use.
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    def _locks_of(self, request):
+        # Locks a request must hold: those of the vaults it reads or changes, in the
+        # order of VaultSet.mounted() if there are several.
+        if not isinstance(request, dict) or request.get("op") not in self.OPERATIONS:
+            return []
+        op = request["op"]
+        if op in ("vaults", "stop"):
+            return []
+        if op == "mount":
+            name = _argument(request, "vault")
+            if not isinstance(name, str):
+                raise ValueError("Vault must be a string.")
+            return [self._lock(("mount", name))]
+        if request.get("all_vaults") and self.vaults is not None:
+            return [
+                self._lock(self.vaults.manager(name, mount=False))
+                for name in self.vaults.mounted()
+            ]
+        return [self._lock(self._manager(request))]
+
+    async def _handle(self, request):
+        # Executes a request as handle_request does, holding the locks of its vaults;
+        # blocking requests run in a worker thread meanwhile.
+        try:
+            locks = self._locks_of(request)
+        except (AssertionError, TypeError, ValueError):
+            # the error is reported by handle_request
+            return self.handle_request(request)
+        async with AsyncExitStack() as stack:
+            for lock in locks:
+                await stack.enter_async_context(lock)
+            if isinstance(request, dict) and request.get("op") in self.BLOCKING:
+                return await asyncio.get_running_loop().run_in_executor(
+                    None, self.handle_request, request
+                )
+            return self.handle_request(request)
+
+    def handle_request(self, request):
+        """Executes one request and returns the response.
+
+        Args:
+            request (dict): Request with key 'op' and the arguments of the operation,
+                and optionally 'vault', the name of a mounted vault to act on:
+                get: website, optionally username
+                find: optionally username, since, before (seconds since the epoch or
+                      as displayed), domain, offset, limit and all_vaults (search all
+                      mounted vaults, every entry carrying its vault)
+                add: website, username, optionally password and allow_breached
+                update: website, username, field ('w', 'u' or 'p'), value,
+                        optionally allow_breached
+                history: website, username
+                rollback: website, username, optionally n (version to restore, default 1)
+                delete: website, username
+                search: website, optionally k (number of suggestions per vault) and
+                        all_vaults (search all mounted vaults)
+                vaults: none
+                mount: vault, password (master password of the vault)
+                stop: none
+
+        Returns:
+            response (dict): {'ok': True, 'result': ...} or {'ok': False, 'error': message}.
+
+        """
+
+        try:
+            if not isinstance(request, dict):
+                raise ValueError("Request must be a JSON object.")
+            operation = self.OPERATIONS.get(request.get("op"))
+            if operation is None:
+                raise ValueError(
+                    "Unknown operation, use one of {}.".format(", ".join(self.OPERATIONS))
+                )
+            return {"ok": True, "result": operation(self, request)}
+        except (AssertionError, TypeError, ValueError) as e:
+            return {"ok": False, "error": str(e) or "Invalid request."}
+
+    def _reset_idle_timer(self):
+        # Restarts the countdown after which an idle agent stops.
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+        if self.idle_timeout:
+            self._idle_handle = asyncio.get_running_loop().call_later(
+                self.idle_timeout, self._stopped.set
+            )
+
+    async def _serve_client(self, reader, writer):
+        # Answers the requests of one connection until the client disconnects
+        # or the agent stops.
+        task = asyncio.current_task()
+        self._clients[task] = writer
+        try:
+            while not self._stopped.is_set():
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # line longer than MAX_REQUEST
+                    break
+                if not line:
+                    break
+                self._reset_idle_timer()
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    response = {"ok": False, "error": "Request is not valid JSON."}
+                else:
+                    response = await self._handle(request)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            # cancelled if the agent stops while the client is still connected
+            pass
+        finally:
+            del self._clients[task]
+            writer.close()
+
+    async def _close_clients(self):
+        # Closes the connections of all clients still connected and waits until
+        # their tasks have ended, so none is left to be cancelled by the event loop.
+        tasks = list(self._clients)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _claim_socket(self):
+        # Removes a socket left behind by an agent that is no longer running.
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.remove(self.socket_path)
+        else:
+            raise AgentError("An agent is already running on {}".format(self.socket_path))
+        finally:
+            probe.close()
+
+    async def serve(self):
+        """Serves requests until the agent is stopped or has been idle for idle_timeout."""
+        self._claim_socket()
+        self._stopped = asyncio.Event()
+        # the socket is created accessible to the user only
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(
+                self._serve_client, path=self.socket_path, limit=MAX_REQUEST
+            )
+        finally:
+            os.umask(umask)
+        self._reset_idle_timer()
+        try:
+            async with server:
+                try:
+                    await self._stopped.wait()
+                finally:
+                    await self._close_clients()
+        finally:
+            if self._idle_handle is not None:
+                self._idle_handle.cancel()
+            try:
+                os.remove(self.socket_path)
+            except FileNotFoundError:
+                pass
+
+    def run(self):
+        """Serves requests until the agent is stopped or idle, then closes the storage."""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self.vaults is not None:
+                # manager is one of the vaults
+                self.vaults.close()
+            else:
+                self.manager.close()
+
+
+class AgentClient:
+    """Connection to a running agent. Can be used as a context manager.
+
+    Args:
+        socket_path (str): Path of the agent socket. Defaults to None (default_socket_path()).
+
+    Methods:
+        request(op, **args): Sends one request and returns its result.
+
+    Raises:
+        AgentError: If no agent is running, or the directory of the default socket
+                    is not private (see default_socket_path).
+
+    """
+
+    def __init__(self, socket_path=None):
+        if socket_path is None:
+            socket_path = default_socket_path()
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.connect(socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            self._socket.close()
+            raise AgentError("No agent is running on {}".format(socket_path))
+        self._file = self._socket.makefile("rwb")
+
+    def request(self, op, **args):
+        """Sends one request and returns its result.
+
+        Args:
+            op (str): Operation, see Agent.handle_request.
+            args: Arguments of the operation.
+
+        Returns:
+            result: Result of the operation, e.g. an entry as dict for get.
+
+        Raises:
+            AgentError: If the agent reports an error or closes the connection.
+
+        """
+
+        args["op"] = op
+        self._file.write(json.dumps(args).encode() + b"\n")
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise AgentError("The agent closed the connection")
+        response = json.loads(line)
+        if not response["ok"]:
+            raise AgentError(response["error"])
+        return response["result"]
+
+    def close(self):
+        """Closes the connection."""
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,255 @@
+"""Module audit -- health check of the passwords in a vault.
+
+An audit walks all entries once and reports, as soon as they are found,
+    reused passwords: entries sharing a password with an earlier entry, found through
+        an index of keyed password digests, so no two passwords are compared directly,
+    weak passwords: passwords whose estimated strength is below a number of bits,
+    breached passwords: passwords listed in a corpus of breached passwords (see module
+        breach), looked up a batch at a time,
+    stale entries: entries created or last updated longer ago than a maximum age.
+Scoring is spread across a process pool for large vaults.
+
+Function password_strength(password):
+    Estimates the strength of a password in bits.
+Function audit_entries(entries, max_age_days, min_bits, processes, now, corpus):
+    Yields the findings of an audit of entries as they are found.
+Class Finding:
+    A reused, weak or breached password or a stale entry found by an audit.
+
+"""
+
+from collections import deque, namedtuple
+import functools
+import hashlib
+import math
+import os
+import re
+import time
+from random_password import WORDLISTS, load_pw_components
+
+# Passwords estimated below this many bits are reported as weak
+WEAK_BITS = 40
+# Entries older than this many days are reported as stale
+MAX_AGE_DAYS = 365
+# Number of passwords scored per batch, and per task of the process pool
+AUDIT_BATCH = 5000
+# Runs of letters, of digits and of other characters
+_RUN = re.compile(r"[^\W\d_]+|\d+|[\W_]+")
+# Runs that are sequences when read forwards or backwards
+_SEQUENCES = "abcdefghijklmnopqrstuvwxyz 0123456789"
+# Bits per character of a run of digits, of lowercase letters, of mixed-case letters
+# and of other characters (the punctuation of generated passwords)
+_DIGIT_BITS = math.log2(10)
+_LOWER_BITS = math.log2(26)
+_MIXED_BITS = math.log2(52)
+_SYMBOL_BITS = math.log2(33)
+
+Finding = namedtuple("Finding", ["kind", "website", "username", "detail"])
+Finding.__doc__ = """A reused, weak or breached password or a stale entry found by an audit.
+
+    Attrs:
+        kind (str): 'reused', 'weak', 'breached' or 'stale'.
+        website (str): Website of the entry.
+        username (str): Username of the entry.
+        detail: (reused) (website, username) of another entry with the same password,
+                (weak) estimated strength in bits, (breached) None, (stale) age in days.
+
+    """
+
+
+@functools.lru_cache(maxsize=1)
+def _dictionary():
+    # Maps every word of the wordlists to the bits needed to pick it from its wordlist,
+    # since generated passwords contain exactly one such word.
+    dictionary = {}
+    for language in WORDLISTS:
+        words = load_pw_components(language=language)["words"]
+        bits = math.log2(len(words))
+        for word in words:
+            word = word.lower()
+            if bits < dictionary.get(word, math.inf):
+                dictionary[word] = bits
+    return dictionary
+
+
+def _run_bits(run, char_bits):
+    # Bits of a run of characters worth char_bits each; a repeated character or a
+    # sequence such as 'abcd' or '4321' only costs its first character and length.
+    if len(run) > 2 and (
+        run == run[0] * len(run) or run in _SEQUENCES or run[::-1] in _SEQUENCES
+    ):
+        return char_bits + math.log2(len(run))
+    return len(run) * char_bits
+
+
+def password_strength(password):
+    """Estimates the strength of a password in bits, the logarithm of the number of
+    guesses an attacker who knows the password's structure needs.
+
+    The password is split into runs of letters, digits and other characters. Letter
+    runs found in a wordlist, as in passwords of generate_random_pw, cost only the
+    choice of the word; repeated characters and sequences such as '1234' count little.
+    The order of the runs adds the bits of their number of arrangements.
+
+    Args:
+        password (str): Password to score.
+
+    Returns:
+        bits (float): Estimated strength, 0 for an empty password.
+
+    """
+
+    assert isinstance(password, str)
+    dictionary = _dictionary()
+    runs = _RUN.findall(password)
+    # log2 of the number of arrangements of the runs, len(runs)!
+    bits = math.lgamma(len(runs) + 1) / math.log(2)
+    for run in runs:
+        if run[0].isdigit():
+            bits += _run_bits(run, _DIGIT_BITS)
+        elif run[0].isalpha():
+            lower = run.lower()
+            # capitalized or uppercase words cost one more bit, mixed case doubles the pool
+            if run in (lower, lower.capitalize(), run.upper()):
+                case_bits = run != lower
+            else:
+                case_bits = None
+            if lower in dictionary:
+                bits += dictionary[lower] + bool(case_bits)
+            elif case_bits is None:
+                bits += _run_bits(run, _MIXED_BITS)
+            else:
+                bits += _run_bits(lower, _LOWER_BITS) + case_bits
+        else:
+            bits += _run_bits(run, _SYMBOL_BITS)
+    return bits
+
+
+def _weak(passwords, min_bits):
+    # Returns (index, bits) of the passwords scoring below min_bits. Top-level so that
+    # it can run in worker processes.
+    weak = []
+    for i, password in enumerate(passwords):
+        bits = password_strength(password)
+        if bits < min_bits:
+            weak.append((i, bits))
+    return weak
+
+
+def _weak_findings(batch, weak):
+    # Findings of a scored batch of entries.
+    for i, bits in weak:
+        yield Finding("weak", batch[i].website, batch[i].username, round(bits, 1))
+
+
+def _breached_findings(batch, passwords, corpus):
+    # Findings of the entries of a batch whose passwords are in corpus.
+    for entry, breached in zip(batch, corpus.contains_many(passwords)):
+        if breached:
+            yield Finding("breached", entry.website, entry.username, None)
+
+
+def audit_entries(
+    entries,
+    max_age_days=MAX_AGE_DAYS,
+    min_bits=WEAK_BITS,
+    processes=None,
+    now=None,
+    corpus=None,
+):
+    """Yields the findings of an audit of entries as they are found, in a single pass.
+
+    Passwords are indexed by a digest keyed with a random key of this audit, so the
+    index holds no passwords. The first reuse of a password is reported for both
+    entries, every further reuse for the new entry. Passwords are scored in batches
+    of AUDIT_BATCH; with several processes, batches are scored by a process pool
+    while the entries are read on, and findings of a batch follow once it is scored.
+
+    Args:
+        entries (iterable): Entries to audit, e.g. a PasswordDB.
+        max_age_days (float): Entries older than this are stale. Defaults to MAX_AGE_DAYS.
+                              None to not report stale entries.
+        min_bits (float): Passwords estimated below this are weak. Defaults to WEAK_BITS.
+        processes (int): Number of worker processes scoring passwords. Defaults to None
+                         (score in this process). The pool is only started once a
+                         full batch has been read.
+        now (int): Time to compute ages at, in seconds since the epoch. Defaults to None
+                   (the current time).
+        corpus (BreachCorpus): Corpus to look passwords up in. Defaults to None
+                               (breached passwords are not reported).
+
+    Returns:
+        findings (iterator): Iterator over Finding tuples.
+
+    """
+
+    if now is None:
+        now = int(time.time())
+    oldest = None if max_age_days is None else now - max_age_days * 86400
+    key = os.urandom(16)
+    # digest -> first entry with that password; entries are kept instead of their
+    # keys, so the index adds no objects for the garbage collector to track
+    seen = {}
+    # digests whose first entry has been reported as reused
+    reported = set()
+    batch, passwords = [], []
+    executor = None
+    # (batch, future) of batches being scored, oldest first
+    scoring = deque()
+    workers = processes or 1
+    try:
+        for entry in entries:
+            if oldest is not None and entry.created_at < oldest:
+                yield Finding(
+                    "stale",
+                    entry.website,
+                    entry.username,
+                    (now - entry.created_at) // 86400,
+                )
+            password = entry.password
+            if password is None:
+                continue
+            digest = hashlib.blake2b(
+                password.encode(), key=key, digest_size=16
+            ).digest()
+            first = seen.setdefault(digest, entry)
+            if first is not entry:
+                first_key = (first.website, first.username)
+                if digest not in reported:
+                    reported.add(digest)
+                    yield Finding(
+                        "reused",
+                        first.website,
+                        first.username,
+                        (entry.website, entry.username),
+                    )
+                yield Finding("reused", entry.website, entry.username, first_key)
+            batch.append(entry)
+            passwords.append(password)
+            if len(passwords) < AUDIT_BATCH:
+                continue
+            if corpus is not None:
+                yield from _breached_findings(batch, passwords, corpus)
+            if workers > 1:
+                if executor is None:
+                    # imported here, as it is only needed for large vaults and slow to import
+                    from concurrent.futures import ProcessPoolExecutor
+
+                    executor = ProcessPoolExecutor(max_workers=workers)
+                scoring.append((batch, executor.submit(_weak, passwords, min_bits)))
+                # stream findings of finished batches, and wait once all workers are busy
+                while scoring and (scoring[0][1].done() or len(scoring) > 2 * workers):
+                    scored, future = scoring.popleft()
+                    yield from _weak_findings(scored, future.result())
+            else:
+                yield from _weak_findings(batch, _weak(passwords, min_bits))
+            batch, passwords = [], []
+        while scoring:
+            scored, future = scoring.popleft()
+            yield from _weak_findings(scored, future.result())
+        if corpus is not None:
+            yield from _breached_findings(batch, passwords, corpus)
+        yield from _weak_findings(batch, _weak(passwords, min_bits))
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
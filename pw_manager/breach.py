@@ -0,0 +1,300 @@
+"""Module breach -- offline check of passwords against a corpus of breached passwords.
+
+A corpus is built once from a text dump, either of passwords (one per line) or of
+SHA-1 hashes in hexadecimal as published by Have I Been Pwned ('HASH' or 'HASH:COUNT'
+per line). It stores the first PREFIX_BYTES bytes of the SHA-1 hash of every password,
+sorted and deduplicated, as fixed-width records. Lookups memory-map the corpus and
+binary-search it, so checking a password touches a few pages of the file and the
+corpus is never read into memory. With 8-byte prefixes, a password is wrongly reported
+as breached with a probability of about (corpus size) / 2**64.
+
+Corpus layout: magic, little-endian uint64 record count, FANOUT little-endian uint64
+fanout entries (entry i is the number of records whose first two bytes are at most i),
+then the records as big-endian PREFIX_BYTES-byte integers in ascending order.
+
+Function build_corpus(lines, filepath, fmt):
+    Builds a corpus from the lines of a text dump.
+Function format_from_line(line):
+    Infers the format of a text dump from its first line.
+Class BreachCorpus:
+    Memory-mapped corpus of breached passwords.
+
+"""
+
+from array import array
+import hashlib
+import heapq
+import mmap
+import os
+import re
+import struct
+import sys
+
+CORPUS_MAGIC = b"PWBC\x00\x01"
+# Default path of the corpus, in the working directory like the database
+DEFAULT_CORPUS = "breached_passwords.bin"
+FORMATS = ("plain", "sha1")
+# Bytes of the SHA-1 hash stored per password
+PREFIX_BYTES = 8
+# Number of fanout entries, one per value of the first two bytes of a record
+FANOUT = 1 << 16
+# Records sorted in memory at once while building; sorted runs are merged from disk
+BUILD_CHUNK = 1 << 21
+_COUNT = struct.Struct("<Q")
+_RECORD = struct.Struct(">Q")
+_HEADER = len(CORPUS_MAGIC) + _COUNT.size
+_RECORDS = _HEADER + FANOUT * _COUNT.size
+_SHA1_LINE = re.compile(r"^[0-9A-Fa-f]{40}(:\d+)?$")
+
+
+def format_from_line(line):
+    """Infers the format of a text dump from its first line.
+
+    Args:
+        line (str): First line of the dump.
+
+    Returns:
+        fmt (str): 'sha1' if line is a hexadecimal SHA-1 hash, optionally followed by
+                   ':COUNT', else 'plain'.
+
+    """
+
+    return "sha1" if _SHA1_LINE.match(line.strip()) else "plain"
+
+
+def _prefix(password):
+    # Corpus record of a password: the first PREFIX_BYTES bytes of its SHA-1 hash.
+    # Undecodable bytes of a dump read with errors='surrogateescape' are hashed as they were.
+    return int.from_bytes(
+        hashlib.sha1(password.encode(errors="surrogateescape")).digest()[:PREFIX_BYTES],
+        "big",
+    )
+
+
+def _prefixes(lines, fmt):
+    # Yields the record of every non-empty line of a dump.
+    # raises ValueError naming the line if a line of a sha1 dump is not a hash.
+    if fmt == "sha1":
+        for line_num, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                if len(line) < 40:
+                    raise ValueError
+                yield int(line[: 2 * PREFIX_BYTES], 16)
+            except ValueError:
+                raise ValueError(
+                    "Line {}: {!r} is not a hexadecimal SHA-1 hash".format(
+                        line_num, line[:80]
+                    )
+                ) from None
+    elif fmt == "plain":
+        for line in lines:
+            line = line.rstrip("\r\n")
+            if line:
+                yield _prefix(line)
+    else:
+        raise ValueError("Unknown format {}, use one of {}".format(fmt, FORMATS))
+
+
+def _write_run(records, directory):
+    # Writes records sorted to a temporary file and returns its path.
+    # imported here, as it is only needed while building and slow to import
+    import tempfile
+
+    run = array("Q", sorted(records))
+    if sys.byteorder != "little":
+        run.byteswap()
+    fd, path = tempfile.mkstemp(dir=directory, suffix=".run")
+    with os.fdopen(fd, "wb") as file:
+        run.tofile(file)
+    return path
+
+
+def _read_run(path):
+    # Yields the records of a sorted run in blocks, so runs are merged in constant memory.
+    with open(path, "rb") as file:
+        while True:
+            block = array("Q", file.read(BUILD_CHUNK // 16 * 8))
+            if not block:
+                return
+            if sys.byteorder != "little":
+                block.byteswap()
+            yield from block
+
+
+def _write_records(file, block):
+    # Writes a block of records as big-endian integers and returns their number.
+    if sys.byteorder != "big":
+        block.byteswap()
+    file.write(block.tobytes())
+    return len(block)
+
+
+def build_corpus(lines, filepath=DEFAULT_CORPUS, fmt="plain"):
+    """Builds a corpus from the lines of a text dump and replaces filepath atomically.
+
+    Records are sorted in chunks of BUILD_CHUNK, written to temporary runs next to
+    filepath and merged, so dumps of any size are built in bounded memory.
+
+    Args:
+        lines (iterable): Lines of the dump (str), e.g. an open text file.
+        filepath (str): Path of the corpus. Defaults to DEFAULT_CORPUS.
+        fmt (str): 'plain' for passwords or 'sha1' for hexadecimal SHA-1 hashes,
+                   see format_from_line. Defaults to 'plain'.
+
+    Returns:
+        count (int): Number of distinct records in the corpus.
+
+    Raises:
+        ValueError: If fmt is unknown or a line of a 'sha1' dump is not a SHA-1 hash.
+                    filepath is left unchanged.
+
+    """
+
+    directory = os.path.dirname(os.path.abspath(filepath))
+    tmp_path = filepath + ".tmp"
+    runs = []
+    try:
+        chunk = array("Q")
+        for record in _prefixes(lines, fmt):
+            chunk.append(record)
+            if len(chunk) >= BUILD_CHUNK:
+                runs.append(_write_run(chunk, directory))
+                chunk = array("Q")
+        runs.append(_write_run(chunk, directory))
+
+        fanout = array("Q", bytes(FANOUT * 8))
+        count = 0
+        with open(tmp_path, "wb") as file:
+            file.write(bytes(_RECORDS))
+            block = array("Q")
+            previous = None
+            for record in heapq.merge(*(_read_run(run) for run in runs)):
+                if record == previous:
+                    continue
+                previous = record
+                block.append(record)
+                fanout[record >> (8 * PREFIX_BYTES - 16)] += 1
+                if len(block) >= BUILD_CHUNK // 16:
+                    count += _write_records(file, block)
+                    block = array("Q")
+            count += _write_records(file, block)
+            total = 0
+            for i, bucket in enumerate(fanout):
+                total += bucket
+                fanout[i] = total
+            if sys.byteorder != "little":
+                fanout.byteswap()
+            file.seek(0)
+            file.write(CORPUS_MAGIC)
+            file.write(_COUNT.pack(count))
+            file.write(fanout.tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, filepath)
+    finally:
+        for run in runs:
+            os.remove(run)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return count
+
+
+class BreachCorpus:
+    """Memory-mapped corpus of breached passwords. Can be used as a context manager.
+
+    Opening the corpus only maps the file. A lookup reads two fanout entries and
+    binary-searches the records sharing the first two bytes of the password's hash,
+    about 1/65536 of the corpus.
+
+    Args:
+        filepath (str): Path of a corpus written by build_corpus. Defaults to DEFAULT_CORPUS.
+
+    Methods:
+        contains_many(passwords): Checks many passwords at once.
+        close(): Unmaps the corpus.
+
+    Raises:
+        ValueError: If filepath is not a corpus.
+
+    """
+
+    def __init__(self, filepath=DEFAULT_CORPUS):
+        with open(filepath, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[: len(CORPUS_MAGIC)] != CORPUS_MAGIC:
+            self._map.close()
+            raise ValueError("{} is not a breached password corpus".format(filepath))
+        (self._count,) = _COUNT.unpack_from(self._map, len(CORPUS_MAGIC))
+        self.filepath = filepath
+
+    def __len__(self):
+        return self._count
+
+    def _bucket(self, record):
+        # Index range of the records sharing the first two bytes of record.
+        top = record >> (8 * PREFIX_BYTES - 16)
+        hi = _COUNT.unpack_from(self._map, _HEADER + top * _COUNT.size)[0]
+        if top == 0:
+            return 0, hi
+        return _COUNT.unpack_from(self._map, _HEADER + (top - 1) * _COUNT.size)[0], hi
+
+    def _find(self, record, lo, hi):
+        # Index of the first record >= record in [lo, hi).
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _RECORD.unpack_from(self._map, _RECORDS + mid * PREFIX_BYTES)[0] < record:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _contains_record(self, record, lo=None):
+        # True if record is in the corpus; lo is a known lower bound of its index.
+        start, end = self._bucket(record)
+        if lo is not None:
+            start = max(start, lo)
+        i = self._find(record, start, end)
+        found = (
+            i < end
+            and _RECORD.unpack_from(self._map, _RECORDS + i * PREFIX_BYTES)[0] == record
+        )
+        return found, i
+
+    def __contains__(self, password):
+        """True if password is in the corpus."""
+        assert isinstance(password, str)
+        return self._contains_record(_prefix(password))[0]
+
+    def contains_many(self, passwords):
+        """Checks many passwords at once.
+
+        The passwords are looked up in the order of their hashes, so the corpus is
+        read front to back and every search starts where the previous one ended.
+
+        Args:
+            passwords (sequence): Passwords to check.
+
+        Returns:
+            breached (list): For every password, True if it is in the corpus.
+
+        """
+
+        records = [_prefix(password) for password in passwords]
+        breached = [False] * len(records)
+        lo = 0
+        for i in sorted(range(len(records)), key=records.__getitem__):
+            breached[i], lo = self._contains_record(records[i], lo)
+        return breached
+
+    def close(self):
+        """Unmaps the corpus."""
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
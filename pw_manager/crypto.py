@@ -0,0 +1,248 @@
+"""Module crypto -- key derivation and encryption of the password database.
+
+The key is derived from the master password with scrypt, a memory-hard KDF whose
+cost is calibrated to a target unlock time on the current machine. Data is encrypted
+and authenticated with AES-256-GCM as implemented by the cryptography package.
+
+Function calibrate_kdf(target_seconds):
+    Finds scrypt parameters that take about target_seconds on this machine.
+Function create_key_record(password, kdf_params):
+    Creates a key record for a new master password.
+Function unlock(password, key_record):
+    Derives the key from the master password and checks it against a key record.
+Class VaultCipher:
+    Authenticated encryption with a key derived from the master password.
+Class SealedPassword:
+    Encrypted password that is only decrypted when it is revealed.
+
+"""
+
+import hashlib
+import hmac
+import os
+import time
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# scrypt cost parameters: n is doubled until unlocking takes the target time
+KDF_R = 8
+KDF_P = 1
+KDF_MIN_N = 2 ** 14
+KDF_MAX_N = 2 ** 20
+# AES-GCM nonce and tag sizes; a random 96-bit nonce per record is safe for far
+# more records than a vault ever writes under one key
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+
+def _scrypt(password, salt, n, r, p):
+    # Derives 64 bytes of key material from password with scrypt.
+    return hashlib.scrypt(
+        password.encode(),
+        salt=salt,
+        n=n,
+        r=r,
+        p=p,
+        maxmem=128 * r * (n + p + 2) + 1024 * 1024,
+        dklen=64,
+    )
+
+
+def calibrate_kdf(target_seconds=0.5):
+    """Finds scrypt parameters that take about target_seconds to derive a key on this machine.
+
+    Args:
+        target_seconds (float): Target time to unlock the database. Defaults to 0.5.
+
+    Returns:
+        kdf_params (dict): Dict with keys 'n', 'r' and 'p'.
+
+    """
+
+    n = KDF_MIN_N
+    salt = os.urandom(16)
+    while n < KDF_MAX_N:
+        start = time.perf_counter()
+        _scrypt("calibration", salt, n, KDF_R, KDF_P)
+        elapsed = time.perf_counter() - start
+        # doubling n doubles the time, stop if that would overshoot more than it gains
+        if elapsed * 1.5 >= target_seconds:
+            break
+        n *= 2
+    return {"n": n, "r": KDF_R, "p": KDF_P}
+
+
+def create_key_record(password, kdf_params):
+    """Creates a key record for a new master password.
+
+    The record holds the salt, the KDF parameters and a check value to recognise
+    the right password. It contains nothing that reveals the password or the key.
+
+    Args:
+        password (str): Master password.
+        kdf_params (dict): Parameters as returned by calibrate_kdf.
+
+    Returns:
+        key_record (dict): JSON-serialisable key record.
+        cipher (VaultCipher): Cipher with the derived key.
+
+    """
+
+    record = {
+        "version": 1,
+        "kdf": "scrypt",
+        "salt": os.urandom(16).hex(),
+        "n": kdf_params["n"],
+        "r": kdf_params["r"],
+        "p": kdf_params["p"],
+    }
+    cipher = VaultCipher(
+        _scrypt(password, bytes.fromhex(record["salt"]), record["n"], record["r"], record["p"])
+    )
+    record["check"] = cipher.check_value().hex()
+    return record, cipher
+
+
+def unlock(password, key_record):
+    """Derives the key from the master password and checks it against a key record.
+
+    Args:
+        password (str): Master password given by the user.
+        key_record (dict): Key record as created by create_key_record.
+
+    Returns:
+        cipher (VaultCipher): Cipher with the derived key, or None if the password is wrong.
+
+    """
+
+    cipher = VaultCipher(
+        _scrypt(
+            password,
+            bytes.fromhex(key_record["salt"]),
+            key_record["n"],
+            key_record["r"],
+            key_record["p"],
+        )
+    )
+    if hmac.compare_digest(cipher.check_value(), bytes.fromhex(key_record["check"])):
+        return cipher
+    return None
+
+
+class VaultCipher:
+    """Authenticated encryption with a key derived from the master password.
+
+    Data is sealed with AES-256-GCM under the first half of the key material, with a
+    random nonce per call. The second half keys the check value and blind indexes.
+
+    Args:
+        key_material (bytes): 64 bytes derived from the master password.
+
+    Methods:
+        seal(data, aad): Encrypts and authenticates data.
+        open(blob, aad): Checks and decrypts data sealed with seal.
+        blind_index(text): Keyed digest of text, usable to look up encrypted values.
+
+    """
+
+    def __init__(self, key_material):
+        assert isinstance(key_material, bytes) and len(key_material) == 64
+        self._aead = AESGCM(key_material[:32])
+        self._mac_key = key_material[32:]
+        self._index_key = hmac.new(self._mac_key, b"blind index", "sha256").digest()
+
+    def check_value(self):
+        """Returns a value that identifies the key without revealing it."""
+        return hmac.new(self._mac_key, b"key check", "sha256").digest()
+
+    def seal(self, data, aad=b""):
+        """Encrypts and authenticates data.
+
+        Args:
+            data (bytes): Data to encrypt.
+            aad (bytes): Associated data that is authenticated but not encrypted. Defaults to b''.
+
+        Returns:
+            blob (bytes): Nonce, ciphertext and tag.
+
+        """
+
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + self._aead.encrypt(nonce, data, aad)
+
+    def open(self, blob, aad=b""):
+        """Checks and decrypts data sealed with seal.
+
+        Args:
+            blob (bytes): Output of seal.
+            aad (bytes): Associated data given to seal. Defaults to b''.
+
+        Returns:
+            data (bytes): Decrypted data.
+
+        Raises:
+            ValueError: If blob was not sealed with this key and aad or has been modified.
+
+        """
+
+        if len(blob) < NONCE_SIZE + TAG_SIZE:
+            raise ValueError("Encrypted data is truncated")
+        try:
+            return self._aead.decrypt(blob[:NONCE_SIZE], blob[NONCE_SIZE:], aad)
+        except InvalidTag:
+            raise ValueError("Encrypted data is corrupt or the key is wrong") from None
+
+    def blind_index(self, text):
+        """Returns a keyed digest of text, so encrypted values can be looked up by equality.
+
+        Args:
+            text (str): Text to digest.
+
+        """
+
+        return hmac.new(self._index_key, text.encode(), "sha256").digest()[:16]
+
+
+class SealedPassword:
+    """Encrypted password that is only decrypted when it is revealed.
+
+    Args:
+        cipher (VaultCipher): Cipher the password is sealed with.
+        blob (bytes): Sealed password.
+        aad (bytes): Associated data the password is sealed with, e.g. identifying the
+                     stored row it belongs to, so it cannot be moved to another row.
+                     Defaults to AAD.
+
+    """
+
+    __slots__ = ("cipher", "blob", "aad")
+    AAD = b"password"
+
+    def __init__(self, cipher, blob, aad=AAD):
+        assert isinstance(cipher, VaultCipher)
+        assert isinstance(blob, bytes)
+        assert isinstance(aad, bytes)
+        self.cipher = cipher
+        self.blob = blob
+        self.aad = aad
+
+    @classmethod
+    def seal(cls, cipher, password, aad=AAD):
+        """Encrypts password with cipher.
+
+        Args:
+            cipher (VaultCipher): Cipher to encrypt with.
+            password (str): Password to encrypt.
+            aad (bytes): Associated data to bind the password to. Defaults to AAD.
+
+        """
+
+        return cls(cipher, cipher.seal(password.encode(), aad), aad)
+
+    def reveal(self):
+        """Returns the decrypted password."""
+        return self.cipher.open(self.blob, self.aad).decode()
+
+    def __reduce__(self):
+        # a sealed password is useless without its cipher, which is never pickled
+        raise TypeError("SealedPassword cannot be pickled")
@@ -0,0 +1,114 @@
+"""Module exceptions -- errors raised by the password manager.
+
+All errors derive from ValueError, so code that catches ValueError keeps working.
+
+Class PasswordManagerError:
+    Base class of all errors of the password manager.
+Class InvalidEntryError:
+    Raised if a website, username, password or field of an entry is not valid.
+Class BreachedPasswordError:
+    Raised if a password is listed in the corpus of breached passwords.
+Class DuplicateEntryError:
+    Raised if a website-username combination is already listed in the database.
+Class EntryNotFoundError:
+    Raised if no entry matches a website (and username).
+Class PasswordRulesError:
+    Raised if no password can satisfy the given generation rules.
+Class ConflictError:
+    Raised if changes could not be saved because another process changed the same entries.
+Class InvalidVaultNameError:
+    Raised if a vault name is not valid.
+Class DuplicateVaultError:
+    Raised if a vault name is already listed in the catalog.
+Class VaultNotFoundError:
+    Raised if no vault of a name is listed in the catalog.
+Class VaultLockedError:
+    Raised if a vault is not mounted and could not be unlocked.
+
+"""
+
+
+class PasswordManagerError(ValueError):
+    """Base class of all errors of the password manager."""
+
+
+class InvalidEntryError(PasswordManagerError):
+    """Raised if a website, username, password or field of an entry is not valid."""
+
+
+class BreachedPasswordError(InvalidEntryError):
+    """Raised if a password is listed in the corpus of breached passwords."""
+
+    def __init__(self, message="This password is listed in the breached password corpus."):
+        super().__init__(message)
+
+
+class DuplicateEntryError(PasswordManagerError):
+    """Raised if a website-username combination is already listed in the database."""
+
+    def __init__(
+        self,
+        message="This website-username combination is already listed in the database.",
+    ):
+        super().__init__(message)
+
+
+class EntryNotFoundError(PasswordManagerError):
+    """Raised if no entry matches a website (and username)."""
+
+    def __init__(self, message="No corresponding entry found."):
+        super().__init__(message)
+
+
+class PasswordRulesError(PasswordManagerError):
+    """Raised if no password can satisfy the given length, exclusion and language rules."""
+
+
+class ConflictError(PasswordManagerError):
+    """Raised by commit if some changes could not be saved because another process
+    changed or removed the same entries in the meantime. All other changes are saved.
+
+    Args:
+        records (list): Change records (see PasswordDB.apply_change) that were not saved.
+
+    """
+
+    def __init__(self, records):
+        self.records = records
+        super().__init__(
+            "{} change(s) could not be saved, another process changed the same entries.".format(
+                len(records)
+            )
+        )
+
+
+class InvalidVaultNameError(PasswordManagerError):
+    """Raised if a vault name is not valid."""
+
+    def __init__(
+        self,
+        message="Vault names consist of letters, digits, '_', '.' and '-' "
+        "and start with a letter or digit.",
+    ):
+        super().__init__(message)
+
+
+class DuplicateVaultError(PasswordManagerError):
+    """Raised if a vault name is already listed in the catalog."""
+
+    def __init__(self, name):
+        super().__init__("A vault named {} already exists.".format(name))
+
+
+class VaultNotFoundError(PasswordManagerError):
+    """Raised if no vault of a name is listed in the catalog."""
+
+    def __init__(self, name):
+        super().__init__("No vault named {}.".format(name))
+
+
+class VaultLockedError(PasswordManagerError):
+    """Raised if a vault is not mounted and could not be unlocked."""
+
+    def __init__(self, name):
+        super().__init__("Vault {} is locked.".format(name))
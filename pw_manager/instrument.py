@@ -0,0 +1,219 @@
+"""Module instrument -- optional timing instrumentation of the hot paths.
+
+Instrumentation is off by default and then costs a single check per call of a function
+decorated with timed(). It is turned on by the environment variable PW_MANAGER_STATS
+(any non-empty value), or by enable() at any later time; the wrappers check whether it
+is on whenever they are called, so references to decorated functions taken before
+enable() are timed as well. Each operation then counts its calls and records their
+latencies in a histogram with one bucket per power of two microseconds; observe()
+records other values, such as the number of retries of an operation. A summary is
+printed to stderr on exit. If a profile path is given (or PW_MANAGER_PROFILE is set),
+a cProfile trace of the whole run is written to it as well, to be read with pstats or
+snakeviz.
+
+Function timed(name):
+    Decorator measuring the calls of a function while instrumentation is enabled.
+Function observe(name, value):
+    Records a value of an operation while instrumentation is enabled.
+Function enable(profile_path):
+    Turns on instrumentation and prints a summary on exit.
+Function is_enabled():
+    Whether instrumentation is enabled.
+Function summary():
+    Returns the collected statistics.
+Function print_summary(file):
+    Prints the collected statistics as a table.
+
+"""
+
+import atexit
+import functools
+import os
+import sys
+import time
+
+# Environment variables enabling instrumentation and the cProfile trace
+STATS_VARIABLE = "PW_MANAGER_STATS"
+PROFILE_VARIABLE = "PW_MANAGER_PROFILE"
+
+# name -> _Stat, None while instrumentation is disabled
+_stats = None
+
+
+class _Stat:
+    # Count, total and log2 histogram of the values recorded for one operation.
+    __slots__ = ("unit", "count", "total", "maximum", "buckets")
+
+    def __init__(self, unit):
+        self.unit = unit
+        self.count = 0
+        self.total = 0
+        self.maximum = 0
+        # bucket i counts values below 2 ** i (values of 0 in bucket 0)
+        self.buckets = []
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+        i = int(value).bit_length()
+        try:
+            self.buckets[i] += 1
+        except IndexError:
+            self.buckets.extend([0] * (i + 1 - len(self.buckets)))
+            self.buckets[i] += 1
+
+    def percentile(self, p):
+        # Upper bound of the bucket holding the p-th percentile.
+        rank = p / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(2 ** i, self.maximum)
+        return self.maximum
+
+
+def _stat(name, unit):
+    # Statistics of name, created on first use.
+    stat = _stats.get(name)
+    if stat is None:
+        stat = _stats[name] = _Stat(unit)
+    return stat
+
+
+def timed(name):
+    """Decorator measuring the calls of a function while instrumentation is enabled.
+
+    Args:
+        name (str): Operation name in the summary, e.g. 'PasswordDB.select_entry'.
+
+    Returns:
+        decorator (function): Returns a wrapper that records the latency of every
+                              call in microseconds while instrumentation is enabled.
+
+    """
+
+    def decorator(func):
+        clock = time.perf_counter_ns
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _stats is None:
+                return func(*args, **kwargs)
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _stat(name, "us").add((clock() - start) / 1000)
+
+        return wrapper
+
+    return decorator
+
+
+def observe(name, value):
+    """Records a value of an operation, e.g. a number of retries, while instrumentation
+    is enabled. Does nothing otherwise.
+
+    Args:
+        name (str): Operation name in the summary.
+        value (int): Non-negative value to record.
+
+    """
+
+    if _stats is not None:
+        _stat(name, "").add(value)
+
+
+def is_enabled():
+    """Whether instrumentation is enabled."""
+    return _stats is not None
+
+
+def enable(profile_path=None):
+    """Turns on instrumentation and prints a summary to stderr on exit.
+    Does nothing if it is enabled already.
+
+    Args:
+        profile_path (str): Path to write a cProfile trace of the rest of the run to.
+                            Defaults to None (the value of PW_MANAGER_PROFILE, if set).
+
+    """
+
+    global _stats
+    if _stats is not None:
+        return
+    _stats = {}
+    profile_path = profile_path or os.environ.get(PROFILE_VARIABLE)
+    if profile_path:
+        # imported here, as it is only needed for profiling
+        import cProfile
+
+        profiler = cProfile.Profile()
+        atexit.register(profiler.dump_stats, profile_path)
+        profiler.enable()
+    atexit.register(print_summary)
+
+
+def summary():
+    """Returns the collected statistics.
+
+    Returns:
+        stats (dict): Operation name -> dict with keys 'count', 'unit' ('us' for
+                      latencies in microseconds, '' for observed values), 'total',
+                      'mean', 'p50', 'p99' and 'max'. Percentiles are upper bounds
+                      of histogram buckets. Empty if instrumentation is disabled.
+
+    """
+
+    if _stats is None:
+        return {}
+    return {
+        name: {
+            "count": stat.count,
+            "unit": stat.unit,
+            "total": stat.total,
+            "mean": stat.total / stat.count,
+            "p50": stat.percentile(50),
+            "p99": stat.percentile(99),
+            "max": stat.maximum,
+        }
+        for name, stat in sorted(_stats.items())
+        if stat.count
+    }
+
+
+def print_summary(file=None):
+    """Prints the collected statistics as a table, to stderr by default."""
+    file = file or sys.stderr
+    stats = summary()
+    if not stats:
+        return
+    width = max(len(name) for name in stats)
+    print(
+        "{:<{}} {:>9} {:>5} {:>12} {:>10} {:>10} {:>10} {:>10}".format(
+            "operation", width, "count", "unit", "total", "mean", "p50", "p99", "max"
+        ),
+        file=file,
+    )
+    for name, stat in stats.items():
+        print(
+            "{:<{}} {:>9} {:>5} {:>12.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+                name,
+                width,
+                stat["count"],
+                stat["unit"],
+                stat["total"],
+                stat["mean"],
+                stat["p50"],
+                stat["p99"],
+                stat["max"],
+            ),
+            file=file,
+        )
+
+
+if os.environ.get(STATS_VARIABLE) or os.environ.get(PROFILE_VARIABLE):
+    enable()
@@ -0,0 +1,470 @@
+"""Module manager -- programmatic interface of the password manager.
+
+PasswordManager offers what the menu offers as methods that return their results and
+raise the errors of module exceptions. It never prints, asks for input or waits, so
+scripts and the agent can run many operations per second through it.
+
+Class PasswordManager:
+    Service facade over a PasswordDB, its storage and the password generator.
+
+"""
+
+from contextlib import contextmanager
+from itertools import islice
+import time
+from audit import MAX_AGE_DAYS, WEAK_BITS, audit_entries
+from breach import BreachCorpus
+from exceptions import (
+    BreachedPasswordError,
+    EntryNotFoundError,
+    InvalidEntryError,
+    PasswordRulesError,
+)
+from instrument import observe
+from pw_classes import PasswordDB, Query, is_valid_website
+from random_password import generate_random_pw, generate_random_pws
+from storage import StorageBackend
+from transfer import entry_from_row
+
+# Fields of an entry that can be updated: website, username and password
+FIELDS = ("w", "u", "p")
+# Generated passwords drawn at most per requested password before giving up,
+# if all of them are breached
+GENERATION_TRIES = 100
+
+
+class PasswordManager:
+    """Service facade over a PasswordDB, its storage and the password generator.
+
+    Every change is committed to the storage before the method returns, unless
+    autosave is False; then changes are only saved by save() and close().
+
+    Args:
+        database (PasswordDB): Unlocked database to operate on.
+        storage (StorageBackend): Storage database was loaded from. Defaults to None
+                                  (changes are kept in memory only).
+        autosave (bool): Whether to commit after every change. Defaults to True.
+        breach_corpus (BreachCorpus): Corpus of breached passwords. If given, breached
+                                      passwords are rejected by add and update unless
+                                      allowed, and never generated. Defaults to None.
+
+    Methods:
+        get(website, username, parents): Returns an entry.
+        suggest(website, k): Returns stored websites similar to website.
+        entries(offset, limit, sort_by): Returns a page of entries.
+        websites(offset, limit, sort_by): Returns a page of distinct websites.
+        find(username, since, before, domain, offset, limit): Returns a page of the
+            entries matching all criteria.
+        count_websites(): Returns the number of distinct websites.
+        add(website, username, password, allow_breached): Adds an entry and returns it.
+        update(website, username, field, value, allow_breached): Updates an entry
+            and returns it.
+        history(website, username): Returns the earlier versions of an entry.
+        rollback(website, username, n): Restores an earlier version of an entry
+            and returns it.
+        remove(website, username): Removes an entry and returns it.
+        batch(): Context manager staging changes that are applied and saved together.
+        is_breached(password): Checks a password against the breached password corpus.
+        generate_password(...): Returns a random password.
+        generate_passwords(count, ...): Returns a list of random passwords.
+        audit(max_age_days, min_bits, processes): Yields reused, weak and breached passwords
+            and stale entries.
+        save(): Commits all changes to the storage.
+        close(): Commits all changes and releases the storage.
+
+    Raises:
+        ConflictError: From every method that saves, if some changes could not be saved
+                       because another process changed the same entries. The change of
+                       the method itself is kept in the database.
+
+    """
+
+    def __init__(self, database, storage=None, autosave=True, breach_corpus=None):
+        assert isinstance(database, PasswordDB)
+        assert storage is None or isinstance(storage, StorageBackend)
+        assert breach_corpus is None or isinstance(breach_corpus, BreachCorpus)
+        self.pw_db = database
+        self.storage = storage
+        self.autosave = autosave
+        self.breach_corpus = breach_corpus
+
+    def __len__(self):
+        return len(self.pw_db)
+
+    def _changed(self):
+        # Commits a change if autosave is set.
+        if self.autosave:
+            self.save()
+
+    def get(self, website, username=None, parents=True):
+        """Returns the entry of a website-username combination.
+
+        Websites match regardless of scheme, 'www.', case, port and path, and if no
+        entry of the host itself matches, entries of its parent domains do
+        (see PasswordDB.select_entry).
+
+        Args:
+            website (str): Website of the entry.
+            username (str): Username of the entry. Defaults to None (the first entry
+                            of website).
+            parents (bool): Whether entries of parent domains match. Defaults to True.
+
+        Returns:
+            entry (Entry): Matching entry.
+
+        Raises:
+            EntryNotFoundError: If no entry matches.
+
+        """
+
+        if not isinstance(website, str):
+            raise InvalidEntryError("Website must be a string.")
+        if username is not None and not isinstance(username, str):
+            raise InvalidEntryError("Username must be a string.")
+        entry = self.pw_db.select_entry(website, username, parents)
+        if entry is None:
+            raise EntryNotFoundError()
+        return entry
+
+    def suggest(self, website, k=3):
+        """Returns up to k stored websites similar to a (possibly misspelled) website."""
+        if not isinstance(website, str):
+            raise InvalidEntryError("Website must be a string.")
+        if not isinstance(k, int) or k < 1:
+            raise InvalidEntryError("Number of suggestions must be a positive integer.")
+        return self.pw_db.suggest_websites(website, k)
+
+    def entries(self, offset=0, limit=None, sort_by=None):
+        """Returns a page of entries, see PasswordDB.iter_entries."""
+        return list(self.pw_db.iter_entries(offset, limit, sort_by))
+
+    def websites(self, offset=0, limit=None, sort_by=None):
+        """Returns a page of distinct websites, see PasswordDB.iter_websites."""
+        return list(self.pw_db.iter_websites(offset, limit, sort_by))
+
+    def find(
+        self, username=None, since=None, before=None, domain=None, offset=0, limit=None
+    ):
+        """Returns a page of the entries matching all given criteria, see PasswordDB.query.
+
+        Args:
+            username (str): Username of the entries. Defaults to None (any).
+            since (int or str): Earliest creation time, in seconds since the epoch or as
+                                displayed. Defaults to None.
+            before (int or str): Creation times must be earlier, as since. Defaults to None.
+            domain (str): Entries of this website or host and its subdomains.
+                          Defaults to None (any).
+            offset (int): Number of matching entries to skip. Defaults to 0.
+            limit (int): Maximum number of entries. Defaults to None (all).
+
+        Returns:
+            entries (list): Matching entries.
+
+        Raises:
+            InvalidEntryError: If a criterion is not valid.
+
+        """
+
+        for name, value in (("Username", username), ("Domain", domain)):
+            if value is not None and not isinstance(value, str):
+                raise InvalidEntryError("{} must be a string.".format(name))
+        if not isinstance(offset, int) or offset < 0:
+            raise InvalidEntryError("Offset must be a non-negative integer.")
+        if limit is not None and (not isinstance(limit, int) or limit < 0):
+            raise InvalidEntryError("Limit must be a non-negative integer.")
+        try:
+            query = Query(username, since, before, domain)
+        except ValueError as e:
+            raise InvalidEntryError(str(e))
+        stop = None if limit is None else offset + limit
+        return list(islice(self.pw_db.query(query), offset, stop))
+
+    def count_websites(self):
+        """Returns the number of distinct websites."""
+        return self.pw_db.count_websites()
+
+    def add(self, website, username, password=None, allow_breached=False):
+        """Adds an entry; the same rules apply as to imported entries.
+
+        Args:
+            website (str): Website, e.g. 'https://example.com' or 'www.example.com'.
+            username (str): Username, must not be blank.
+            password (str): Password. Defaults to None (no password).
+            allow_breached (bool): Whether to accept a breached password. Defaults to False.
+
+        Returns:
+            entry (Entry): The new entry.
+
+        Raises:
+            InvalidEntryError: If website, username or password is not valid.
+            BreachedPasswordError: If password is breached and allow_breached is False.
+            DuplicateEntryError: If the website-username combination is already listed.
+
+        """
+
+        entry = entry_from_row(
+            {"website": website, "username": username, "password": password}
+        )
+        if entry.password is not None and not allow_breached:
+            self._check_breached(entry.password)
+        self.pw_db.add_entry(entry)
+        self._changed()
+        return entry
+
+    def update(self, website, username, field, value, allow_breached=False):
+        """Sets the website ('w'), username ('u') or password ('p') of an entry
+        and its creation date to now.
+
+        Args:
+            website (str): Website of the entry.
+            username (str): Username of the entry.
+            field (str): One of 'w', 'u' and 'p'.
+            value (str): New value, must be a string and not blank.
+            allow_breached (bool): Whether to accept a breached password. Defaults to False.
+
+        Returns:
+            entry (Entry): The updated entry.
+
+        Raises:
+            EntryNotFoundError: If no entry matches website and username.
+            InvalidEntryError: If field or value is not valid.
+            BreachedPasswordError: If the new password is breached and allow_breached
+                                   is False.
+            DuplicateEntryError: If the new website-username combination is already listed.
+
+        """
+
+        entry = self.get(website, username, parents=False)
+        if field not in FIELDS:
+            raise InvalidEntryError(
+                "Field must be one of w (website), u (username) or p (password)."
+            )
+        if not isinstance(value, str):
+            raise InvalidEntryError(
+                "Value must be a string, not {}.".format(type(value).__name__)
+            )
+        if len(value.strip()) == 0:
+            raise InvalidEntryError("Value must not be blank.")
+        if field == "w" and not is_valid_website(value):
+            raise InvalidEntryError("Not a valid website")
+        if field == "p" and not allow_breached:
+            self._check_breached(value)
+        self.pw_db.update_entry(entry, field, value, created_at=int(time.time()))
+        self._changed()
+        return entry
+
+    def history(self, website, username):
+        """Returns the earlier versions of an entry.
+
+        Args:
+            website (str): Website of the entry.
+            username (str): Username of the entry.
+
+        Returns:
+            versions (list): pw_classes.Version tuples, newest first, with decrypted
+                             passwords. Version n of rollback is versions[n - 1].
+
+        Raises:
+            EntryNotFoundError: If no entry matches website and username.
+
+        """
+
+        return self.get(website, username, parents=False).history
+
+    def rollback(self, website, username, n=1):
+        """Restores website, username and password of an earlier version of an entry
+        and sets its creation date to now. The current version is kept in the history.
+
+        Args:
+            website (str): Website of the entry.
+            username (str): Username of the entry.
+            n (int): Version to restore, 1 for the version before the last change.
+                     Defaults to 1.
+
+        Returns:
+            entry (Entry): The restored entry.
+
+        Raises:
+            EntryNotFoundError: If no entry matches website and username, or it has
+                                fewer than n earlier versions.
+            DuplicateEntryError: If the website-username combination of the version
+                                 is listed for another entry.
+
+        """
+
+        entry = self.get(website, username, parents=False)
+        self.pw_db.rollback_entry(entry, n, created_at=int(time.time()))
+        self._changed()
+        return entry
+
+    def remove(self, website, username):
+        """Removes an entry.
+
+        Args:
+            website (str): Website of the entry.
+            username (str): Username of the entry.
+
+        Returns:
+            entry (Entry): The removed entry.
+
+        Raises:
+            EntryNotFoundError: If no entry matches website and username.
+
+        """
+
+        entry = self.get(website, username, parents=False)
+        self.pw_db.remove_entry(entry)
+        self._changed()
+        return entry
+
+    @contextmanager
+    def batch(self):
+        """Context manager staging changes that are applied together and saved once,
+        e.g. to rename a domain across many entries:
+
+            with manager.batch() as batch:
+                for entry in manager.find(domain="old.example.com"):
+                    batch.update_entry(entry, "w", "https://new.example.com")
+
+        Changes are checked as they are staged (see pw_classes.Batch). If the block
+        completes, all of them are applied and committed with a single save; if it
+        raises, or applying one of them fails, none of them is.
+
+        Yields:
+            batch (Batch): Batch of the database to stage changes in.
+
+        Raises:
+            DuplicateEntryError, EntryNotFoundError, InvalidEntryError: From staging
+                                                                       a change.
+
+        """
+
+        with self.pw_db.batch() as batch:
+            yield batch
+        if len(batch):
+            self._changed()
+
+    def is_breached(self, password):
+        """Checks a password against the breached password corpus.
+
+        Args:
+            password (str): Password to check.
+
+        Returns:
+            breached (bool): True if password is in the corpus, False if it is not or
+                             there is no corpus.
+
+        """
+
+        if not isinstance(password, str):
+            raise InvalidEntryError("Password is not a string")
+        return self.breach_corpus is not None and password in self.breach_corpus
+
+    def _check_breached(self, password):
+        # Raises BreachedPasswordError if password is in the breached password corpus.
+        if self.is_breached(password):
+            raise BreachedPasswordError()
+
+    def generate_password(
+        self,
+        min_length=7,
+        max_length=25,
+        special_characters=True,
+        exclude_characters=None,
+        language="english",
+        wordlist=None,
+    ):
+        """Returns a random password that is not breached,
+        see random_password.generate_random_pw.
+
+        Raises:
+            PasswordRulesError: If no password can satisfy the rules, or GENERATION_TRIES
+                                generated passwords in a row were breached.
+
+        """
+
+        for retries in range(GENERATION_TRIES):
+            password = generate_random_pw(
+                min_length,
+                max_length,
+                special_characters,
+                exclude_characters,
+                language,
+                wordlist,
+            )
+            if not self.is_breached(password):
+                observe("generate_password.retries", retries)
+                return password
+        raise PasswordRulesError(
+            "All generated passwords were breached, relax the rules."
+        )
+
+    def generate_passwords(
+        self,
+        count,
+        min_length=7,
+        max_length=25,
+        special_characters=True,
+        exclude_characters=None,
+        language="english",
+        processes=None,
+        wordlist=None,
+    ):
+        """Returns a list of count random passwords that are not breached,
+        see random_password.generate_random_pws.
+
+        Breached passwords are checked in one batch and replaced by new ones.
+
+        Raises:
+            PasswordRulesError: If no password can satisfy the rules, or too many
+                                generated passwords were breached.
+
+        """
+
+        if not isinstance(count, int) or count < 1:
+            raise PasswordRulesError("Number of passwords must be a positive integer")
+        passwords = []
+        for retries in range(GENERATION_TRIES):
+            batch = generate_random_pws(
+                count - len(passwords),
+                min_length,
+                max_length,
+                special_characters,
+                exclude_characters,
+                language,
+                processes=processes,
+                wordlist=wordlist,
+            )
+            if self.breach_corpus is not None:
+                breached = self.breach_corpus.contains_many(batch)
+                batch = [password for password, b in zip(batch, breached) if not b]
+            passwords.extend(batch)
+            if len(passwords) == count:
+                observe("generate_passwords.retries", retries)
+                return passwords
+        raise PasswordRulesError(
+            "All generated passwords were breached, relax the rules."
+        )
+
+    def audit(self, max_age_days=MAX_AGE_DAYS, min_bits=WEAK_BITS, processes=None):
+        """Yields reused, weak and (given a breached password corpus) breached passwords
+        and stale entries as they are found, see audit.audit_entries.
+
+        Returns:
+            findings (iterator): Iterator over audit.Finding tuples.
+
+        """
+
+        return audit_entries(
+            self.pw_db, max_age_days, min_bits, processes, corpus=self.breach_corpus
+        )
+
+    def save(self):
+        """Commits all changes to the storage, if there is one."""
+        if self.storage is not None:
+            self.storage.commit(self.pw_db)
+
+    def close(self):
+        """Commits all changes and releases the storage, if there is one."""
+        if self.storage is not None:
+            self.storage.close(self.pw_db)
@@ -1,53 +1,94 @@
 """Module menu_class -- full menu for passwordmanager.
 
 Decorator function sleep(function):
-    Waits 4 seconds after function is executed, if and only if function does not return None
+    Waits for the menu's display delay after function is executed, if and only if function does not return None
+Function copy_to_clipboard(text):
+    Copies text to the clipboard.
 Class Menu:
     Full functionality of passwordmanager menu.
     
 """
 
-from pw_classes import Entry, PasswordDB
-from random_password import generate_random_pw
-import pyperclip as pc
-import re
-from datetime import datetime
+from exceptions import (
+    BreachedPasswordError,
+    ConflictError,
+    DuplicateEntryError,
+    EntryNotFoundError,
+    PasswordManagerError,
+)
+from instrument import timed
+from manager import PasswordManager
+from pw_classes import format_timestamp, is_valid_website
+from random_password import WORDLIST_FORMAT, WORDLISTS
 import time
 import functools
-import pickle
-import difflib
+import os
+
+# Number of entries or websites shown per page
+PAGE_SIZE = 20
+# Sort orders of pages: sort_by -> (menu key, menu label)
+SORT_ORDERS = {
+    "website": ("S", "sort by website"),
+    "created_at": ("D", "sort by date added"),
+}
+# Seconds a message stays on screen before the menu is shown again
+DISPLAY_DELAY = 4
+
+
+def copy_to_clipboard(text):
+    """Copies text to the clipboard. pyperclip is imported on first use, not at startup.
+
+    Args:
+        text (str): Text to copy.
+
+    """
+
+    import pyperclip
+
+    pyperclip.copy(text)
 
 
 def sleep(func):
-    # Decorator function; sleeps 4 seconds after function is called, only if function does not return None
+    # Decorator function for Menu methods; waits for the display delay after the method is
+    # called, only if it does not return None. Returns the result of the method.
     @functools.wraps(func)
-    def wrapper_sleep(*args, **kwargs):
-        if func(*args, **kwargs):
-            time.sleep(4)
-        return func
+    def wrapper_sleep(self, *args, **kwargs):
+        result = func(self, *args, **kwargs)
+        if result:
+            self._pause()
+        return result
 
     return wrapper_sleep
 
 
 class Menu:
-    """Menu for passwordmanager. 
+    """Menu for passwordmanager. Only asks for input and displays results;
+    all operations are carried out by a PasswordManager.
     
     Attrs:
-        database (PasswordDB): The database on the basis of which menu operates.
+        manager (PasswordManager): The password manager on the basis of which menu operates.
+                                   Saves the database after every change.
+        delay (float): Seconds a message stays on screen before the menu is shown again.
+                       Defaults to DISPLAY_DELAY.
 
     Methods: 
-        new_password(): Asks for user input and generates new password accordingly. 
+        new_password(ask_count): Asks for user input and generates new password(s) accordingly. 
         menu_choice(): Is called for full functionality of menu. 
 
     """
 
-    def __init__(self, database):
-        assert isinstance(database, PasswordDB)
-        self.pw_db = database
+    def __init__(self, manager, delay=DISPLAY_DELAY):
+        assert isinstance(manager, PasswordManager)
+        self.manager = manager
+        self.delay = delay
+
+    def _pause(self):
+        # Waits for the display delay, so that messages can be read.
+        if self.delay:
+            time.sleep(self.delay)
 
     def _website_choice(self, action_string):
         # Asks for website input and lists alternative options.
-        # pw_db (PasswordDB): Password database from which websites are listed.
         # action_string (String): string to be inserted into question: which website would you like to ...
         # returns entry of None if user returns to main menu
         entry = None
@@ -57,39 +98,38 @@ class Menu:
         while not entry:
             url = str(input(": "))
             if url == "V":
-                self.pw_db.list_websites()
+                self._browse(self._show_websites, self.manager.count_websites())
+                print("Which website would you like to {}?".format(action_string))
+                print("V: view options")
+                print("M: return to menu.")
             elif url == "M":
                 return None
             else:
-                entry = self.pw_db.select_entry(url)
-                if not entry:
-                    similar = difflib.get_close_matches(
-                        url, self.pw_db.list_websites(), n=1, cutoff=0
-                    )[0]
-                    print(
-                        "No corresponding entry found. Did you mean {}?".format(
-                            similar
-                        )
-                    )
+                try:
+                    entry = self.manager.get(url)
+                except EntryNotFoundError as e:
+                    print(e)
+                    similar = self.manager.suggest(url)
+                    if similar:
+                        print("Did you mean:")
+                        for website in similar:
+                            print("  {}".format(website))
                     print("V: view options")
                     print("M: return to menu.")
         return entry
 
+    @sleep
     def _create_entry(self):
-        # Creates a new Entry in PasswordDB from user inputs. Copies Entry's password to clipboard after creation.
-        # pw_db (PasswordDB): Password Database to add entry to.
+        # Creates a new Entry from user inputs. Copies Entry's password to clipboard after creation.
+        # returns the new entry, the error displayed or True if the entry was declined,
+        # or None if user returns to main menu
         new_entry_username = ""
         print("Provide website, or type M to return to menu")
         while True:
             new_entry_website = str(input(": "))
             if new_entry_website == "M":
                 return None
-            if bool(
-                re.search(
-                    "(https?:\/\/(?:www\.|(?!www))[a-zA-Z0-9][a-zA-Z0-9-]+[a-zA-Z0-9]\.[^\s]{2,}|www\.[a-zA-Z0-9][a-zA-Z0-9-]+[a-zA-Z0-9]\.[^\s]{2,}|https?:\/\/(?:www\.|(?!www))[a-zA-Z0-9]+\.[^\s]{2,}|www\.[a-zA-Z0-9]+\.[^\s]{2,})",
-                    new_entry_website,
-                )
-            ):
+            if is_valid_website(new_entry_website):
                 break
             else:
                 print("Not a valid website")
@@ -101,46 +141,116 @@ class Menu:
         new_entry_password = str(
             input("Provide the password or leave blank: ")
         )
-        new_entry = Entry(new_entry_website, new_entry_username)
-        if len(new_entry_password.strip()) > 0:
-            new_entry.password = new_entry_password
-        else:
+        if len(new_entry_password.strip()) == 0:
+            new_entry_password = None
             random_pw = input("Generate a random password? [y/n]")
             if random_pw == "y":
-                new_pw = self.new_password()
-                new_entry.password = new_pw
+                new_entry_password = self.new_password()
             else:
                 print("No password generated.")
-                pc.copy("[None]")
-        self.pw_db.add_entry(new_entry)
-        time.sleep(4)
+                copy_to_clipboard("[None]")
+        try:
+            new_entry = self._confirm_breached(
+                self.manager.add, new_entry_website, new_entry_username, new_entry_password
+            )
+        except DuplicateEntryError as e:
+            print(e, "Use 3. update an entry to update the entry.")
+            return e
+        except PasswordManagerError as e:
+            print(e)
+            return e
+        if new_entry is None:
+            print("No entry added.")
+            return True
+        print("Entry added to database.")
+        return new_entry
+
+    @staticmethod
+    def _confirm_breached(operation, *args):
+        # Calls operation(*args), an add or update of the manager. If the password is
+        # breached, asks whether to use it anyway and calls operation again if so.
+        # returns the result of operation, or None if the breached password was declined.
+        try:
+            return operation(*args)
+        except BreachedPasswordError as e:
+            print(e, "Use it anyway? [y/n]")
+            if input(": ") != "y":
+                return None
+            return operation(*args, allow_breached=True)
 
     def _view_all(self):
-        # Displays all entries in password database
-        # pw_db (PasswordDB): password database to display entries from.
-        self.pw_db.list_entries()
-        time.sleep(4)
+        # Displays all entries in password database, page by page
+        self._browse(self._show_entries, len(self.manager), ("website", "created_at"))
+
+    @timed("Menu.show_entries")
+    def _show_entries(self, offset, limit, sort_by):
+        # Displays a page of the entries currently listed in database.
+        print("The following entries are saved in database:\n")
+        if len(self.manager) == 0:
+            print("The database is currently empty.")
+        else:
+            for entry in self.manager.entries(offset, limit, sort_by):
+                print(entry)
+
+    @timed("Menu.show_websites")
+    def _show_websites(self, offset, limit, sort_by):
+        # Displays a page of the websites currently listed in database.
+        for website in self.manager.websites(offset, limit, sort_by):
+            print(website)
+
+    @staticmethod
+    def _browse(show_page, total, sort_orders=("website",)):
+        # Displays items page by page until the user goes back.
+        # show_page (callable): called as show_page(offset, limit, sort_by) to display one page.
+        # total (int): total number of items.
+        # sort_orders (tuple): sort_by values of SORT_ORDERS show_page supports.
+        keys = {SORT_ORDERS[order][0]: order for order in sort_orders}
+        offset = 0
+        sort_by = None
+        while True:
+            show_page(offset, PAGE_SIZE, sort_by)
+            print(
+                "\nShowing {}-{} of {}.".format(
+                    min(offset + 1, total), min(offset + PAGE_SIZE, total), total
+                )
+            )
+            print("N: next page")
+            print("P: previous page")
+            for order in sort_orders:
+                if order != sort_by:
+                    print("{}: {}".format(*SORT_ORDERS[order]))
+            if sort_by is not None:
+                print("U: unsorted")
+            print("B: back")
+            choice = input(": ")
+            if choice == "N" and offset + PAGE_SIZE < total:
+                offset += PAGE_SIZE
+            elif choice == "P":
+                offset = max(offset - PAGE_SIZE, 0)
+            elif choice in keys or choice == "U":
+                sort_by = keys.get(choice)
+                offset = 0
+            elif choice == "B":
+                return
 
     @sleep
     def _view_entry(self):
         # Displays a specific entry in password database given a user input.
         # Copies password to clipboard.
-        # pw_db (PasswordDB): Password Database to display entry from.
         # returns entry or None if user returns to main menu
         entry = self._website_choice("view")
         if entry:
             print(entry)
             if entry.password:
-                pc.copy(entry.password)
+                copy_to_clipboard(entry.password)
                 print("Password copied to clipboard.")
             else:
-                pc.copy("")
+                copy_to_clipboard("")
         return entry
 
     @sleep
     def _update_entry(self):
         # Updates an entry given user input (website name, which part to update, confirmations)
-        # pw_db (PasswordDB): Password Database to display entry from
         # returns entry or None if user returns to main menu
         entry = self._website_choice("update")
         if entry:
@@ -149,10 +259,14 @@ class Menu:
             print("w: website")
             print("u: username")
             print("p: password")
+            if entry.history_length():
+                print("r: restore an earlier version")
             print("M: cancel and return to menu")
             to_update = ""
             while to_update not in ["w", "u", "p", "M"]:
                 to_update = str(input(": "))
+                if to_update == "r" and entry.history_length():
+                    return self._restore_version(entry)
                 if to_update == "w":
                     value = str(input("New website? "))
                 elif to_update == "u":
@@ -161,14 +275,55 @@ class Menu:
                     value = str(input("New password? "))
                 elif to_update == "M":
                     return None
-            entry.created_at = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
-            self.pw_db.update_entry(entry, to_update, value)
+            try:
+                updated = self._confirm_breached(
+                    self.manager.update, entry.website, entry.username, to_update, value
+                )
+            except PasswordManagerError as e:
+                print(e)
+            else:
+                if updated is None:
+                    print("Password not updated.")
+                elif to_update == "w":
+                    print("Website updated.")
+                elif to_update == "u":
+                    print("Username updated.")
+                else:
+                    print("Password updated.")
         return entry
 
+    def _restore_version(self, entry):
+        # Lists the earlier versions of an entry and restores the one chosen by the user.
+        # returns entry
+        versions = self.manager.history(entry.website, entry.username)
+        print("\nWhich version should be restored?")
+        print("-" * 30)
+        for n, version in enumerate(versions, 1):
+            print(
+                "{}: {} with username {} created/updated at {}.".format(
+                    n,
+                    version.website,
+                    version.username,
+                    format_timestamp(version.created_at),
+                )
+            )
+        print("M: cancel and return to menu")
+        choice = ""
+        while choice != "M":
+            choice = str(input(": "))
+            if choice.isdigit() and 1 <= int(choice) <= len(versions):
+                try:
+                    self.manager.rollback(entry.website, entry.username, int(choice))
+                except PasswordManagerError as e:
+                    print(e)
+                else:
+                    print("Version restored.")
+                return entry
+        return None
+
     @sleep
     def _delete_entry(self):
         # Deletes a specific entry from password database given user input.
-        # pw_db (PasswordDB): Password Database to delete entry from.
         # returns entry of None if user returns to main menu
         entry = self._website_choice("remove")
         if entry:
@@ -177,18 +332,41 @@ class Menu:
             )
             sure = input(": ")
             if sure == "y":
-                self.pw_db.remove_entry(entry)
+                try:
+                    self.manager.remove(entry.website, entry.username)
+                except PasswordManagerError as e:
+                    print(e)
+                else:
+                    print("Entry removed from database.")
         return entry
 
-    @staticmethod
-    def new_password():
+    def new_password(self, ask_count=False):
         """Asks for user input and generates new password accordingly. 
+
+        Args:
+            ask_count (bool): Whether to ask how many passwords to generate. Defaults to False.
         
         Returns: 
-            password (string): a new randomly generated password
+            password (string): a new randomly generated password,
+                               or a list of passwords if more than one was requested.
+                               None if no password can satisfy the requirements.
             
         """
 
+        count = 1
+        if ask_count:
+            print("How many passwords? Leave blank for one")
+            while True:
+                count = input(": ")
+                if count == "":
+                    count = 1
+                try:
+                    count = int(count)
+                    if count < 1:
+                        raise ValueError
+                    break
+                except ValueError:
+                    print("Number of passwords must be a positive integer")
         print("Minimum length? Leave blank if no requirements")
         while True:
             min_length = input(": ")
@@ -223,12 +401,66 @@ class Menu:
         exclude = input(": ")
         exclude_list = []
         exclude_list[:0] = exclude
-        random_pw = generate_random_pw(
-            min_length, max_length, special_characters, exclude_list
+        print(
+            "Language of the word? Leave blank for english, choose from: {}".format(
+                ", ".join(WORDLISTS)
+            )
+            + " or type the path of a wordlist (.csv, .json or compiled .bin)"
         )
-        pc.copy(random_pw)
+        language = input(": ")
+        while (
+            language not in WORDLISTS
+            and language != ""
+            and not WORDLIST_FORMAT.search(language)
+        ):
+            print("Unknown language")
+            language = input(": ")
+        wordlist = None
+        if language == "":
+            language = "english"
+        elif language not in WORDLISTS:
+            wordlist, language = language, "english"
+        start = time.perf_counter()
+        try:
+            if count > 1:
+                random_pws = self.manager.generate_passwords(
+                    count,
+                    min_length,
+                    max_length,
+                    special_characters,
+                    exclude_list,
+                    language,
+                    processes=os.cpu_count(),
+                    wordlist=wordlist,
+                )
+            else:
+                random_pw = self.manager.generate_password(
+                    min_length,
+                    max_length,
+                    special_characters,
+                    exclude_list,
+                    language,
+                    wordlist,
+                )
+        except PasswordManagerError as e:
+            print(e)
+            print("No password generated.")
+            self._pause()
+            return None
+        if count > 1:
+            elapsed = time.perf_counter() - start
+            print(
+                "Generated {} passwords in {:.3f} seconds ({:.0f} passwords/s).".format(
+                    count, elapsed, count / elapsed if elapsed else float("inf")
+                )
+            )
+            copy_to_clipboard("\n".join(random_pws))
+            print("{} new passwords copied to clipboard.".format(count))
+            self._pause()
+            return random_pws
+        copy_to_clipboard(random_pw)
         print("New password copied to clipboard.")
-        time.sleep(4)
+        self._pause()
         return random_pw
 
     def menu_choice(self):
@@ -239,26 +471,21 @@ class Menu:
                 self._view_all()
             if choice == "1":
                 self._create_entry()
-                # save changes
-                with open("password_db.p", "wb") as file:
-                    pickle.dump(self.pw_db, file)
             if choice == "2":
                 self._view_entry()
             if choice == "3":
                 self._update_entry()
-                # save changes
-                with open("password_db.p", "wb") as file:
-                    pickle.dump(self.pw_db, file)
             if choice == "4":
                 self._delete_entry()
-                # save_changes
-                with open("password_db.p", "wb") as file:
-                    pickle.dump(self.pw_db, file)
             if choice == "5":
-                self.new_password()
+                self.new_password(ask_count=True)
             choice = self._print_menu()
-        with open("password_db.p", "wb") as file:
-            pickle.dump(self.pw_db, file)
+        # Other processes may have changed the database in the meantime;
+        # changes that no longer apply to their version are reported.
+        try:
+            self.manager.close()
+        except ConflictError as e:
+            print(e)
 
     @staticmethod
     def _print_menu():
@@ -271,7 +498,7 @@ class Menu:
         print("2. View an entry and copy password")
         print("3. Update an entry")
         print("4. Delete an entry")
-        print("5. Generate a random password")
+        print("5. Generate random passwords")
         print("Q. Exit")
         print("-" * 30)
         return input(": ")
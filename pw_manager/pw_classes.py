@@ -1,12 +1,364 @@
 """Module pw_classes -- Classes for PasswordDB (database) and Entry (an entry in the database)
 
+Function is_valid_website(website):
+    Checks whether a string is accepted as website of an entry.
+Function normalize_website(website):
+    Returns the host of a website without scheme and 'www.', in lowercase.
+Function format_timestamp(timestamp):
+    Formats a creation timestamp for display.
+Function parse_timestamp(value):
+    Converts a displayed or stored creation date to a timestamp.
+Class Version:
+    Earlier version of an entry, kept in its history.
 Class Entry:
     Entry in password database.
-Class PasswordDB: Database class, container for Entry instances. Enables basic CRUD functionality.
+Class EntryStore:
+    Interface of the store holding the entries of a PasswordDB.
+Class MemoryStore:
+    Entry store keeping all entries in dictionaries.
+Class DomainIndex:
+    Trie of websites keyed by the reversed labels of their normalized hosts.
+Class Query:
+    Filter over the entries of a PasswordDB by username, creation time and domain.
+Class Batch:
+    Changes to a PasswordDB staged to be applied together.
+Class PasswordDB: Database class, container for Entry instances. Enables basic CRUD functionality,
+    lookups by domain and suggestions for misspelled websites.
     
 """
 
-from datetime import datetime
+from bisect import bisect_left, insort
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import islice
+import heapq
+import re
+import sys
+import time
+import warnings
+from crypto import SealedPassword
+from exceptions import DuplicateEntryError, EntryNotFoundError, InvalidEntryError
+from instrument import timed
+
+
+WEBSITE_PATTERN = re.compile(
+    r"(https?:\/\/(?:www\.|(?!www))[a-zA-Z0-9][a-zA-Z0-9-]+[a-zA-Z0-9]\.[^\s]{2,}|www\.[a-zA-Z0-9][a-zA-Z0-9-]+[a-zA-Z0-9]\.[^\s]{2,}|https?:\/\/(?:www\.|(?!www))[a-zA-Z0-9]+\.[^\s]{2,}|www\.[a-zA-Z0-9]+\.[^\s]{2,})"
+)
+# Host of a website: after an optional scheme, user info and 'www.', up to a port or path
+HOST_PATTERN = re.compile(
+    r"^\s*(?:[a-z][a-z0-9+.-]*://)?(?:[^@/?#\s]*@)?(?:www\.)?([^:/?#\s]*)", re.IGNORECASE
+)
+# Trigrams shared by more websites than this are too common to find suggestions with.
+SUGGESTION_CANDIDATES = 1000
+# Format in which creation dates are displayed, imported and exported
+TIMESTAMP_FORMAT = "%d.%m.%Y %H:%M:%S"
+# Earlier versions kept per entry; the oldest version is evicted beyond this
+HISTORY_LIMIT = 10
+
+Version = namedtuple("Version", ["created_at", "website", "username", "password"])
+Version.__doc__ = """Earlier version of an entry, kept in its history.
+
+    Attrs:
+        created_at (int): Time the version was created, in seconds since the epoch.
+        website (str): Website of the version.
+        username (str): Username of the version.
+        password (str): Password of the version, or None. In the history of an entry
+                        it may be a SealedPassword; Entry.version decrypts it.
+
+    """
+
+
+def is_valid_website(website):
+    """Checks whether a string is accepted as website of an entry, e.g. 'https://example.com' or 'www.example.com'.
+
+    Args:
+        website (str): Website to check.
+
+    Returns:
+        valid (bool): True if website starts with a scheme or 'www.' followed by a domain.
+
+    """
+
+    return bool(WEBSITE_PATTERN.search(website))
+
+
+def normalize_website(website):
+    """Returns the host of a website without scheme, user info, 'www.', port and path,
+    in lowercase, e.g. 'example.com' for 'https://www.Example.com:443/login'.
+
+    Args:
+        website (str): Website as entered or stored.
+
+    Returns:
+        host (str): Normalized host, empty if website has none.
+
+    """
+
+    return HOST_PATTERN.match(website).group(1).lower().rstrip(".")
+
+
+def format_timestamp(timestamp):
+    """Formats a creation timestamp for display, e.g. '24.12.2021 18:30:00' (local time).
+
+    Args:
+        timestamp (int): Seconds since the epoch.
+
+    Returns:
+        date (str): timestamp in TIMESTAMP_FORMAT.
+
+    """
+
+    return time.strftime(TIMESTAMP_FORMAT, time.localtime(timestamp))
+
+
+def parse_timestamp(value):
+    """Converts a creation date to a timestamp.
+
+    Args:
+        value (int or str): Seconds since the epoch, or a date in TIMESTAMP_FORMAT
+                            (local time) as stored by earlier versions.
+
+    Returns:
+        timestamp (int): Seconds since the epoch.
+
+    Raises:
+        ValueError: If value is neither an integer nor a date in TIMESTAMP_FORMAT.
+
+    """
+
+    if isinstance(value, int):
+        return value
+    if not isinstance(value, str):
+        raise ValueError("created_at is not in '{}' format".format(TIMESTAMP_FORMAT))
+    try:
+        return int(time.mktime(time.strptime(value, TIMESTAMP_FORMAT)))
+    except ValueError:
+        raise ValueError("created_at is not in '{}' format".format(TIMESTAMP_FORMAT))
+
+
+def _remove_sorted(values, value):
+    # Removes value from the sorted list values.
+    del values[bisect_left(values, value)]
+
+
+def _page(values, offset, limit):
+    # Returns an iterator over limit values of values starting at offset.
+    # Lists are sliced directly; other iterables are skipped through up to offset.
+    assert isinstance(offset, int) and offset >= 0
+    stop = None if limit is None else offset + limit
+    if isinstance(values, list):
+        return iter(values[offset:stop])
+    return islice(values, offset, stop)
+
+
+def _check_update(to_update, value):
+    # Raises InvalidEntryError unless to_update is one of 'w', 'u', 'p' and value
+    # is a string that is not blank.
+    assert isinstance(to_update, str)
+    if to_update not in ["w", "u", "p"]:
+        raise InvalidEntryError(
+            "Field must be one of w (website), u (username) or p (password)."
+        )
+    if not isinstance(value, str):
+        raise InvalidEntryError(
+            "Value must be a string, not {}.".format(type(value).__name__)
+        )
+    if len(value.strip()) == 0:
+        raise InvalidEntryError("Value must not be blank.")
+
+
+def _trigrams(text):
+    # Set of lowercase character trigrams of text, padded so that short texts and word
+    # boundaries yield trigrams as well.
+    padded = "  " + text.lower() + " "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class _DomainNode:
+    # Node of a DomainIndex: children by domain label, and the stored websites whose
+    # host is the domain of this node (a dict used as an insertion-ordered set).
+    __slots__ = ("children", "websites")
+
+    def __init__(self):
+        self.children = {}
+        self.websites = {}
+
+
+class DomainIndex:
+    """Trie of websites keyed by the reversed labels of their normalized hosts, e.g.
+    'https://login.example.com' under 'com', 'example', 'login'.
+
+    Finding the websites of a domain, of its parent domains or of its subdomains walks
+    one node per label, so it costs time proportional to the depth of the domain (plus
+    the number of websites found), whatever the number of websites stored.
+
+    Methods:
+        add(website): Adds a website.
+        discard(website): Removes a website if it is indexed.
+        exact(website): Websites with the same host.
+        parents(website): Websites of the parent domains, closest first.
+        subdomains(website): Websites of all subdomains.
+
+    """
+
+    def __init__(self, websites=()):
+        self._root = _DomainNode()
+        for website in websites:
+            self.add(website)
+
+    @staticmethod
+    def _labels(website):
+        # Labels of the normalized host of website, top-level domain first.
+        host = normalize_website(website)
+        return host.split(".")[::-1] if host else []
+
+    def _node(self, labels):
+        # Node of the domain with labels, or None if nothing is stored under it.
+        node = self._root
+        for label in labels:
+            node = node.children.get(label)
+            if node is None:
+                return None
+        return node
+
+    def add(self, website):
+        """Adds a website."""
+        node = self._root
+        for label in self._labels(website):
+            child = node.children.get(label)
+            if child is None:
+                child = node.children[label] = _DomainNode()
+            node = child
+        node.websites[website] = None
+
+    def discard(self, website):
+        """Removes a website if it is indexed, and the nodes left empty."""
+        path = [self._root]
+        for label in self._labels(website):
+            node = path[-1].children.get(label)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].websites.pop(website, None)
+        labels = self._labels(website)
+        # prune nodes without websites and children, deepest first
+        for depth in range(len(labels), 0, -1):
+            node = path[depth]
+            if node.websites or node.children:
+                break
+            del path[depth - 1].children[labels[depth - 1]]
+
+    def exact(self, website):
+        """Returns the indexed websites with the same normalized host as website."""
+        labels = self._labels(website)
+        node = self._node(labels) if labels else None
+        return list(node.websites) if node is not None else []
+
+    def parents(self, website):
+        """Returns the indexed websites of the parent domains of website, closest first
+        (e.g. 'example.com' for 'login.example.com'). Top-level domains are left out."""
+        labels = self._labels(website)
+        found = []
+        node = self._root
+        for label in labels[:-1]:
+            node = node.children.get(label)
+            if node is None:
+                break
+            found.append(node.websites)
+        # the top-level domain alone is no parent worth matching
+        return [website for websites in found[:0:-1] for website in websites]
+
+    def subdomains(self, website):
+        """Returns the indexed websites of all subdomains of website
+        (e.g. 'login.example.com' for 'example.com'), shallowest first."""
+        labels = self._labels(website)
+        node = self._node(labels) if labels else None
+        if node is None:
+            return []
+        found = []
+        level = list(node.children.values())
+        while level:
+            for child in level:
+                found.extend(child.websites)
+            level = [grandchild for child in level for grandchild in child.children.values()]
+        return found
+
+
+def _duplicate_username(username, n):
+    # Username given to the n-th entry listed with the same website and username.
+    return "{} (duplicate {})".format(username, n)
+
+
+def _in_domain(website, domain):
+    # True if the normalized host of website is domain or one of its subdomains.
+    host = normalize_website(website)
+    return host == domain or host.endswith("." + domain)
+
+
+class Query:
+    """Filter over the entries of a PasswordDB, see PasswordDB.query.
+
+    Criteria left at None match every entry. Queries are combined with &, e.g.
+    Query(username="me") & Query(before="01.01.2024 00:00:00"), into a query
+    matching the entries that match both.
+
+    Args:
+        username (str): Username of the entries. Defaults to None.
+        since (int or str): Earliest creation time (inclusive), in seconds since the
+                            epoch or in TIMESTAMP_FORMAT. Defaults to None.
+        before (int or str): Creation times must be before this (exclusive), as since.
+                             Defaults to None.
+        domain (str): Website or host; entries of it and its subdomains match, regardless
+                      of scheme and 'www.' (see normalize_website). Defaults to None.
+        where (callable): Predicate called with every candidate Entry, applied after
+                          all other criteria. Defaults to None.
+
+    Raises:
+        ValueError: If since or before is not a valid time.
+
+    """
+
+    __slots__ = ("username", "since", "before", "domains", "predicates", "empty")
+
+    def __init__(self, username=None, since=None, before=None, domain=None, where=None):
+        assert username is None or isinstance(username, str)
+        assert domain is None or isinstance(domain, str)
+        assert where is None or callable(where)
+        self.username = username
+        self.since = None if since is None else parse_timestamp(since)
+        self.before = None if before is None else parse_timestamp(before)
+        self.domains = () if domain is None else (normalize_website(domain),)
+        self.predicates = () if where is None else (where,)
+        # True if the criteria contradict each other, e.g. two different usernames
+        self.empty = False
+
+    def __and__(self, other):
+        if not isinstance(other, Query):
+            return NotImplemented
+        query = Query()
+        query.username = self.username if other.username is None else other.username
+        query.empty = self.empty or other.empty or (
+            None not in (self.username, other.username)
+            and self.username != other.username
+        )
+        times = [t for t in (self.since, other.since) if t is not None]
+        query.since = max(times) if times else None
+        times = [t for t in (self.before, other.before) if t is not None]
+        query.before = min(times) if times else None
+        query.domains = self.domains + other.domains
+        query.predicates = self.predicates + other.predicates
+        return query
+
+    def matches(self, entry):
+        """Returns True if entry matches all criteria."""
+        return (
+            not self.empty
+            and (self.username is None or entry.username == self.username)
+            and (self.since is None or entry.created_at >= self.since)
+            and (self.before is None or entry.created_at < self.before)
+            and all(_in_domain(entry.website, domain) for domain in self.domains)
+            and all(predicate(entry) for predicate in self.predicates)
+        )
 
 
 class Entry:
@@ -16,35 +368,237 @@ class Entry:
         website (str): Name of the website this entry is for.
         username (str): Username for the website.
         password (str): Password for the website. Defaults to None. 
+                        May also be a SealedPassword, which is decrypted only when read.
     
     Attr:
-        created_at (str): Current date and time in '%d.%m.%Y %H:%M:%S' format. Also used for updating entries. 
+        created_at (int): Time of creation in seconds since the epoch, set to the current time.
+                          Also used for updating entries. Formatted only for display.
+
+    The history of earlier versions is a tuple of up to HISTORY_LIMIT Versions, oldest
+    first. Fields a change left alone are shared with the entry instead of copied, and
+    websites and usernames are interned, so a version costs little more than its tuple.
+    Entries that were never changed share one empty history.
 
     """
 
+    __slots__ = (
+        "_website",
+        "username",
+        "_password",
+        "created_at",
+        "_history",
+        "__weakref__",
+    )
+
     def __init__(self, website, username, password=None):
         assert isinstance(website, str)
         assert isinstance(username, str)
         if password:
-            assert isinstance(password, str)
+            assert isinstance(password, (str, SealedPassword))
         self.password = password
-        self.created_at = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+        self.created_at = int(time.time())
         self.website = website
         self.username = username
+        self._history = ()
+
+    @classmethod
+    def trusted(cls, website, username, password, created_at, history=()):
+        """Creates an Entry from values read from storage, without validating them again.
+
+        Args:
+            website (str): Name of the website.
+            username (str): Username for the website.
+            password (str): Password, a SealedPassword or None.
+            created_at (int): Time of creation in seconds since the epoch.
+            history (tuple): Earlier versions as Versions or plain tuples, oldest first.
+                             Defaults to () (no history).
+
+        Returns:
+            entry (Entry): New entry.
+
+        """
+
+        entry = cls.__new__(cls)
+        entry._website = website
+        entry.username = username
+        entry._password = password
+        entry.created_at = created_at
+        entry._history = tuple(Version._make(version) for version in history)
+        return entry
+
+    def __getstate__(self):
+        # Entries without history keep the state of earlier versions.
+        state = self._website, self.username, self._password, self.created_at
+        if self._history:
+            state += (self._history,)
+        return state
+
+    def __setstate__(self, state):
+        # Also accepts entries pickled by earlier versions as an attribute dict
+        # with a formatted creation date.
+        if isinstance(state, dict):
+            state = (
+                state["_website"],
+                state["username"],
+                state.get("_password"),
+                parse_timestamp(state["created_at"]),
+            )
+        self._website, self.username, self._password, self.created_at = state[:4]
+        self._history = state[4] if len(state) > 4 else ()
 
     @property
     def password(self):
+        """Password of the entry, decrypted on every access if it is sealed."""
+        if isinstance(self._password, SealedPassword):
+            return self._password.reveal()
         return self._password
 
     @password.setter
     def password(self, value):
         """Setter for password property. Checks that password is not empty string or only whitespaces."""
-        if value:
+        if value and not isinstance(value, SealedPassword):
             assert isinstance(value, str)
             if len(value.strip()) == 0:
-                raise ValueError
+                raise InvalidEntryError("Password must not be blank.")
         self._password = value
 
+    def seal_password(self, cipher, aad=SealedPassword.AAD):
+        """Returns the password encrypted with cipher and from then on keeps only the encrypted form.
+
+        Args:
+            cipher (VaultCipher): Cipher to encrypt the password with.
+            aad (bytes): Associated data to bind the password to, e.g. identifying the
+                         stored row. Defaults to SealedPassword.AAD.
+
+        Returns:
+            blob (bytes): Sealed password, or None if the entry has no password.
+
+        """
+
+        if self._password is None:
+            return None
+        if not (
+            isinstance(self._password, SealedPassword)
+            and self._password.cipher is cipher
+            and self._password.aad == aad
+        ):
+            self._password = SealedPassword.seal(cipher, self.password, aad)
+        return self._password.blob
+
+    @property
+    def history(self):
+        """Earlier versions of the entry, newest first, with decrypted passwords."""
+        return [self.version(n) for n in range(1, len(self._history) + 1)]
+
+    def history_length(self):
+        """Returns the number of earlier versions kept."""
+        return len(self._history)
+
+    def _version(self, n):
+        # Version n of the history, still sealed.
+        if not isinstance(n, int) or not 1 <= n <= len(self._history):
+            raise EntryNotFoundError(
+                "No version {} in the history of this entry.".format(n)
+            )
+        return self._history[-n]
+
+    def version(self, n=1):
+        """Returns an earlier version of the entry without copying the history.
+
+        Args:
+            n (int): 1 for the version before the last change, 2 for the one before, ...
+                     Defaults to 1.
+
+        Returns:
+            version (Version): Earlier version, with its password decrypted.
+
+        Raises:
+            EntryNotFoundError: If the entry has fewer than n earlier versions.
+
+        """
+
+        version = self._version(n)
+        if isinstance(version.password, SealedPassword):
+            return version._replace(password=version.password.reveal())
+        return version
+
+    def push_version(self):
+        """Adds the current website, username, password and creation time to the history,
+        evicting the oldest version if HISTORY_LIMIT versions are kept already."""
+        version = Version(
+            self.created_at,
+            sys.intern(self._website),
+            sys.intern(self.username),
+            self._password,
+        )
+        history = self._history
+        if len(history) >= HISTORY_LIMIT:
+            history = history[len(history) - HISTORY_LIMIT + 1 :]
+        self._history = history + (version,)
+
+    def restore_version(self, n, created_at=None):
+        """Sets website, username and password to those of an earlier version, after adding
+        the current version to the history. Done in constant time, as at most HISTORY_LIMIT
+        versions are kept. Callers are responsible for the indexes of the database.
+
+        Args:
+            n (int): Version to restore, see version.
+            created_at (int): New creation time. Defaults to None (the current time).
+
+        Raises:
+            EntryNotFoundError: If the entry has fewer than n earlier versions.
+
+        """
+
+        version = self._version(n)
+        self.push_version()
+        self._website = version.website
+        self.username = version.username
+        self._password = version.password
+        self.created_at = int(time.time()) if created_at is None else created_at
+
+    def seal_history(self, cipher):
+        """Returns the history with every password encrypted with cipher, and from then on
+        keeps only the encrypted passwords. Equal passwords are encrypted once.
+
+        Args:
+            cipher (VaultCipher): Cipher to encrypt the passwords with.
+
+        Returns:
+            history (tuple): (created_at, website, username, blob) per version, oldest first,
+                             where blob is the sealed password (bytes) or None.
+
+        """
+
+        sealed = {}
+        history = []
+        for version in self._history:
+            password = version.password
+            if password is not None and not (
+                isinstance(password, SealedPassword)
+                and password.cipher is cipher
+                and password.aad == SealedPassword.AAD
+            ):
+                plain = (
+                    password.reveal()
+                    if isinstance(password, SealedPassword)
+                    else password
+                )
+                if plain not in sealed:
+                    sealed[plain] = SealedPassword.seal(cipher, plain)
+                version = version._replace(password=sealed[plain])
+            history.append(version)
+        self._history = tuple(history)
+        return tuple(
+            (
+                version.created_at,
+                version.website,
+                version.username,
+                None if version.password is None else version.password.blob,
+            )
+            for version in self._history
+        )
+
     @property
     def website(self):
         return self._website
@@ -54,102 +608,810 @@ class Entry:
         """Setter for website property. Checks that website is not empty string or only whitespaces."""
         assert isinstance(value, str)
         if len(value.strip()) == 0:
-            raise ValueError
+            raise InvalidEntryError("Website must not be blank.")
         self._website = value
 
     def __str__(self):
         """String representation of Entry"""
         return "{} with username {} created/updated at {}.".format(
-            self.website, self.username, self.created_at
+            self.website, self.username, format_timestamp(self.created_at)
         )
 
 
+class EntryStore:
+    """Interface of the store holding the entries of a PasswordDB.
+
+    A store keeps entries keyed by (website, username) in insertion order and answers
+    lookups by website. PasswordDB keeps all other indexes itself, so a store may load
+    entries lazily, e.g. from a database file.
+
+    Methods:
+        get(website, username): Entry with the exact combination, or None.
+        first(website): First entry of a website, or None.
+        has_website(website): Whether any entry of a website is stored.
+        count_websites(): Number of distinct websites.
+        insert(item): Stores a new entry.
+        delete(item): Removes a stored entry.
+        save(item): Persists changed password or created_at of a stored entry.
+        keys(): Iterator over (website, username) pairs in insertion order.
+        usernames(website): Iterator over the usernames of a website in insertion order.
+        websites(): Iterator over distinct websites in order of their first entry.
+        domain_index(): Index of the websites by domain that the store keeps itself,
+            or None (the default) if PasswordDB is to build a DomainIndex.
+        savepoint(): Context manager undoing all inserts, deletes and saves made in
+            its block if the block raises, restoring entries at their positions.
+        __iter__(): Iterator over entries in insertion order.
+        __len__(): Number of entries.
+
+    """
+
+    def get(self, website, username):
+        raise NotImplementedError
+
+    def first(self, website):
+        raise NotImplementedError
+
+    def has_website(self, website):
+        raise NotImplementedError
+
+    def count_websites(self):
+        raise NotImplementedError
+
+    def insert(self, item):
+        raise NotImplementedError
+
+    def delete(self, item):
+        raise NotImplementedError
+
+    def save(self, item):
+        raise NotImplementedError
+
+    def keys(self):
+        raise NotImplementedError
+
+    def usernames(self, website):
+        raise NotImplementedError
+
+    def websites(self):
+        raise NotImplementedError
+
+    def domain_index(self):
+        return None
+
+    def savepoint(self):
+        raise NotImplementedError
+
+    def __iter__(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class MemoryStore(EntryStore):
+    """Entry store keeping all entries in dictionaries."""
+
+    def __init__(self):
+        # (website, username) -> Entry, kept in insertion order
+        self._entries = {}
+        # website -> {username: Entry}
+        self._websites = {}
+        # while a savepoint is open, the keys inserted since and copies of _entries
+        # and _websites taken before the first delete since, else None
+        self._inserted = None
+        self._copies = None
+
+    def get(self, website, username):
+        return self._entries.get((website, username))
+
+    def first(self, website):
+        usernames = self._websites.get(website)
+        if usernames:
+            return next(iter(usernames.values()))
+
+    def has_website(self, website):
+        return website in self._websites
+
+    def count_websites(self):
+        return len(self._websites)
+
+    def insert(self, item):
+        self._entries[(item.website, item.username)] = item
+        self._websites.setdefault(item.website, {})[item.username] = item
+        if self._inserted is not None and self._copies is None:
+            self._inserted.append((item.website, item.username))
+
+    def delete(self, item):
+        if self._inserted is not None and self._copies is None:
+            # entries after a deleted one cannot be put back in place one by one
+            self._copies = (
+                dict(self._entries),
+                {website: dict(users) for website, users in self._websites.items()},
+            )
+        self._remove(item.website, item.username)
+
+    def _remove(self, website, username):
+        # Removes the entry with the website-username combination from the dictionaries.
+        del self._entries[(website, username)]
+        usernames = self._websites[website]
+        del usernames[username]
+        if not usernames:
+            del self._websites[website]
+
+    def save(self, item):
+        # entries are the stored objects themselves, nothing to write
+        pass
+
+    def keys(self):
+        return iter(self._entries)
+
+    def usernames(self, website):
+        return iter(self._websites.get(website, ()))
+
+    def websites(self):
+        return iter(self._websites)
+
+    @contextmanager
+    def savepoint(self):
+        assert self._inserted is None
+        self._inserted = []
+        try:
+            yield
+        except BaseException:
+            if self._copies is not None:
+                self._entries, self._websites = self._copies
+            # entries inserted at the end before the copies were taken, if any
+            for key in reversed(self._inserted):
+                self._remove(*key)
+            raise
+        finally:
+            self._inserted = self._copies = None
+
+    def __iter__(self):
+        return iter(self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class Batch:
+    """Changes to a PasswordDB staged to be applied together, see PasswordDB.batch.
+    Can be used as a context manager, which commits the batch if the block completes
+    and discards it if the block raises.
+
+    Every change is checked when it is staged, against the database as changed by the
+    changes staged before it, so duplicates within the batch are found before anything
+    is applied. The database and its entries are left untouched until commit; then all
+    changes are applied and listeners (e.g. a storage journal) are notified of them,
+    or, if applying fails, none of them is.
+
+    Args:
+        db (PasswordDB): Database to change.
+
+    Methods:
+        get_entry(website, username): Entry at a website-username combination once the
+            staged changes are applied.
+        add_entry(item), update_entry(item, to_update, value, created_at),
+        remove_entry(item): Stage a change, as the methods of PasswordDB.
+        commit(): Applies all staged changes.
+        discard(): Drops all staged changes.
+
+    """
+
+    def __init__(self, db):
+        assert isinstance(db, PasswordDB)
+        self._db = db
+        # staged changes in order, as (op, item, *args)
+        self._changes = []
+        # (website, username) -> Entry staged at that combination, or None if freed
+        self._keys = {}
+        # Entry -> (website, username) staged for it
+        self._moved = {}
+        self._closed = False
+
+    def __len__(self):
+        return len(self._changes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+    def _check_open(self):
+        # Raises ValueError once the batch has been committed or discarded.
+        if self._closed:
+            raise ValueError("The batch has been committed or discarded already.")
+
+    def get_entry(self, website, username):
+        """Returns the Entry at a website-username combination once the staged changes
+        are applied, or None."""
+        key = (website, username)
+        if key in self._keys:
+            return self._keys[key]
+        return self._db.get_entry(website, username)
+
+    def _key(self, item):
+        # (website, username) of item once the staged changes are applied.
+        return self._moved.get(item, (item.website, item.username))
+
+    def add_entry(self, item):
+        """Stages adding an entry, see PasswordDB.add_entry.
+
+        Raises:
+            DuplicateEntryError: If the website-username combination is listed,
+                                 or staged to be, once the staged changes are applied.
+
+        """
+
+        self._check_open()
+        assert isinstance(item, Entry), "item must be of class Entry"
+        key = (item.website, item.username)
+        if self.get_entry(*key) is not None:
+            raise DuplicateEntryError()
+        self._keys[key] = item
+        self._changes.append(("add", item))
+
+    def update_entry(self, item, to_update, value, created_at=None):
+        """Stages updating an entry, see PasswordDB.update_entry.
+
+        Raises:
+            InvalidEntryError: If to_update is not one of 'w', 'u', 'p'
+                               or value is not a string or blank.
+            EntryNotFoundError: If item is not stored, or staged to be, once the staged
+                                changes are applied.
+            DuplicateEntryError: If the new website-username combination is listed,
+                                 or staged to be, once the staged changes are applied.
+
+        """
+
+        self._check_open()
+        _check_update(to_update, value)
+        assert isinstance(item, Entry)
+        key = self._key(item)
+        if self.get_entry(*key) is not item:
+            raise EntryNotFoundError()
+        if to_update != "p":
+            new_key = (value, key[1]) if to_update == "w" else (key[0], value)
+            if self.get_entry(*new_key) not in (None, item):
+                raise DuplicateEntryError()
+            self._keys[key] = None
+            self._keys[new_key] = item
+            self._moved[item] = new_key
+        self._changes.append(("update", item, to_update, value, created_at))
+
+    def remove_entry(self, item):
+        """Stages removing an entry, see PasswordDB.remove_entry.
+
+        Raises:
+            EntryNotFoundError: If item is not stored, or staged to be, once the staged
+                                changes are applied.
+
+        """
+
+        self._check_open()
+        assert isinstance(item, Entry)
+        key = self._key(item)
+        if self.get_entry(*key) is not item:
+            raise EntryNotFoundError()
+        self._keys[key] = None
+        self._changes.append(("remove", item))
+
+    def commit(self):
+        """Applies all staged changes to the database, or none of them if one fails."""
+        self._check_open()
+        self._closed = True
+        self._db._apply_batch(self._changes)
+
+    def discard(self):
+        """Drops all staged changes; the database is left as it is."""
+        self._closed = True
+        self._changes = []
+
+
 class PasswordDB:
     """Database class, container for Entry instances.
     Enables basic CRUD functionality.
+
+    Entries are kept in an EntryStore indexed by website and by the exact (website, username)
+    pair, so lookups, duplicate checks, updates and removals take constant time.
+    A character-trigram index over the websites serves suggestions for misspelled websites.
+    Entries and websites can be iterated page by page, in insertion order or sorted by website.
+    Entries can be queried by username, creation time and domain (see query).
     
     Args:
-        entries (list): List of entries. Defaults to None.
+        entries (list): List of entries. Defaults to None. An entry whose website-username
+                        combination is already taken by an earlier one is kept under
+                        a free username, e.g. 'me (duplicate 2)', with a warning.
+        store (EntryStore): Store holding the entries. Defaults to None (a new MemoryStore).
         
     """
 
-    def __init__(self, entries=None):
+    def __init__(self, entries=None, store=None):
         if not entries:
             entries = []
         assert isinstance(entries, list)
-        if entries:
-            for entry in entries:
-                assert isinstance(entry, Entry)
-        self.entries = entries
+        if store is None:
+            store = MemoryStore()
+        assert isinstance(store, EntryStore)
+        self._store = store
+        # trigram -> set of websites containing it, built on first use
+        self._trigrams = None
+        # sorted (website, username) pairs and sorted websites, built on first use
+        self._sorted_pairs = None
+        self._sorted_websites = None
+        # DomainIndex of all websites, built on first use
+        self._domains = None
+        # username -> {website: None} and sorted (created_at, website, username),
+        # built on first use
+        self._usernames = None
+        self._by_time = None
+        # callables notified of every change, e.g. a storage journal
+        self._listeners = []
+        # change records held back while a batch is applied, None otherwise
+        self._held = None
+        for entry in entries:
+            assert isinstance(entry, Entry)
+            if self._store.get(entry.website, entry.username) is not None:
+                self._rename_duplicate(entry)
+            self._index(entry)
+
+    @property
+    def entries(self):
+        """List of all entries in insertion order."""
+        return list(self._store)
+
+    @property
+    def store(self):
+        """EntryStore holding the entries."""
+        return self._store
+
+    def __len__(self):
+        return len(self._store)
+
+    def __iter__(self):
+        return iter(self._store)
+
+    def __getstate__(self):
+        # Pickle only the entries; indexes are rebuilt on load.
+        return {"entries": self.entries}
+
+    def __setstate__(self, state):
+        # Also accepts databases pickled before indexes were introduced.
+        self.__init__(state.get("entries"))
+
+    def _rename_duplicate(self, item):
+        # Gives item, whose website-username combination is taken by an earlier entry
+        # (update_entry of earlier versions allowed that), a free username instead of
+        # dropping it, and warns about it.
+        n = 2
+        while (
+            self._store.get(item.website, _duplicate_username(item.username, n))
+            is not None
+        ):
+            n += 1
+        username = _duplicate_username(item.username, n)
+        warnings.warn(
+            "{} with username {} is listed twice, the second entry is kept with "
+            "username {}.".format(item.website, item.username, username),
+            stacklevel=3,
+        )
+        item.username = username
+
+    def _index(self, item):
+        # Adds item to the store and the trigram, sorted, domain, username and time indexes.
+        new_website = not self._store.has_website(item.website)
+        self._store.insert(item)
+        if self._sorted_pairs is not None:
+            insort(self._sorted_pairs, (item.website, item.username))
+        if self._usernames is not None:
+            self._usernames.setdefault(item.username, {})[item.website] = None
+        if self._by_time is not None:
+            insort(self._by_time, (item.created_at, item.website, item.username))
+        if new_website:
+            if self._trigrams is not None:
+                self._add_trigrams(item.website)
+            if self._sorted_websites is not None:
+                insort(self._sorted_websites, item.website)
+            if self._domains is not None:
+                self._domains.add(item.website)
+
+    def _unindex(self, item):
+        # Removes item from the store and the trigram, sorted, domain, username and
+        # time indexes.
+        self._store.delete(item)
+        if self._sorted_pairs is not None:
+            _remove_sorted(self._sorted_pairs, (item.website, item.username))
+        if self._usernames is not None:
+            websites = self._usernames[item.username]
+            del websites[item.website]
+            if not websites:
+                del self._usernames[item.username]
+        if self._by_time is not None:
+            _remove_sorted(self._by_time, (item.created_at, item.website, item.username))
+        if not self._store.has_website(item.website):
+            if self._sorted_websites is not None:
+                _remove_sorted(self._sorted_websites, item.website)
+            if self._domains is not None:
+                self._domains.discard(item.website)
+            if self._trigrams is not None:
+                for trigram in _trigrams(item.website):
+                    websites = self._trigrams[trigram]
+                    websites.discard(item.website)
+                    if not websites:
+                        del self._trigrams[trigram]
+
+    def _add_trigrams(self, website):
+        # Adds website to the trigram index.
+        for trigram in _trigrams(website):
+            websites = self._trigrams.get(trigram)
+            if websites is None:
+                websites = self._trigrams[trigram] = set()
+            websites.add(website)
+
+    def _build_trigrams(self):
+        # Builds the trigram index from all stored websites.
+        self._trigrams = {}
+        for website in self._store.websites():
+            self._add_trigrams(website)
+
+    def _set_created_at(self, item, created_at):
+        # Sets the creation time of a stored item and re-keys the time index.
+        if self._by_time is not None:
+            _remove_sorted(self._by_time, (item.created_at, item.website, item.username))
+            insort(self._by_time, (created_at, item.website, item.username))
+        item.created_at = created_at
+        self._store.save(item)
+
+    def _notify(self, op, *args):
+        # Passes a change record to all listeners, or holds it back while a batch
+        # is applied.
+        if self._held is not None:
+            self._held.append((op,) + args)
+            return
+        for listener in self._listeners:
+            listener(op, *args)
+
+    def _set_field(self, item, to_update, value):
+        # Sets website ('w'), username ('u') or password ('p') of a stored item and re-keys the indexes.
+        # returns False if the new website-username combination is already taken.
+        # The previous version is added to the history of item.
+        if to_update == "p":
+            item.push_version()
+            item.password = value
+            self._store.save(item)
+            return True
+        if to_update == "w":
+            new_key = (value, item.username)
+        else:
+            new_key = (item.website, value)
+        if self._store.get(*new_key) not in (None, item):
+            return False
+        item.push_version()
+        self._unindex(item)
+        try:
+            if to_update == "w":
+                item.website = value
+            else:
+                item.username = value
+        finally:
+            self._index(item)
+        return True
+
+    def _contains(self, item):
+        # True if item itself (not merely an equal key) is stored in the database.
+        return self._store.get(item.website, item.username) is item
+
+    @timed("PasswordDB.get_entry")
+    def get_entry(self, website_name, username):
+        """Searches for the Entry with the exact website-username combination.
+        
+        Args:
+            website_name (str): Website name of the entry.
+            username (str): Username of the entry.
+            
+        Returns:
+            entry (Entry): Matching entry, or None if there is none.
+            
+        """
+
+        return self._store.get(website_name, username)
+
+    def batch(self):
+        """Starts a batch of changes that are applied together, e.g.
+
+            with pw_db.batch() as batch:
+                for entry in pw_db.query(domain="old.example.com"):
+                    batch.update_entry(entry, "w", "https://new.example.com")
+
+        Changes are checked as they are staged, including duplicates within the batch,
+        and applied on commit; if one of them fails, the changes applied before it are
+        rolled back. Listeners are notified of the changes only once all are applied,
+        so a storage persists the whole batch with its next commit.
+
+        Returns:
+            batch (Batch): New batch of this database.
+
+        """
+
+        return Batch(self)
+
+    @timed("PasswordDB.apply_batch")
+    def _apply_batch(self, changes):
+        # Applies the changes of a batch, or rolls back the applied ones if one fails.
+        # Listeners are notified of all changes after the last one is applied.
+        held = self._held = []
+        # (item, state of item before the change) of the changes applied so far
+        states = []
+        try:
+            with self._store.savepoint():
+                for op, item, *args in changes:
+                    states.append((item, item.__getstate__()))
+                    if op == "add":
+                        self.add_entry(item)
+                    elif op == "update":
+                        self.update_entry(item, *args)
+                    else:
+                        self.remove_entry(item)
+        except BaseException:
+            # the store has put its entries back in place; the other indexes are
+            # rebuilt on next use
+            for item, state in reversed(states):
+                item.__setstate__(state)
+            self._trigrams = self._domains = None
+            self._sorted_pairs = self._sorted_websites = None
+            self._usernames = self._by_time = None
+            raise
+        finally:
+            self._held = None
+        for record in held:
+            self._notify(*record)
+
+    def add_listener(self, listener):
+        """Registers a callable that is notified of every change to the database.
+
+        Args:
+            listener (callable): Called as listener(op, *args) with the same arguments
+                                 that apply_change accepts.
+
+        """
+
+        assert callable(listener)
+        self._listeners.append(listener)
+
+    @timed("PasswordDB.apply_change")
+    def apply_change(self, op, *args):
+        """Applies a change record silently and without notifying listeners. Used to replay journals.
+
+        Records that no longer apply (e.g. adding an existing combination) are ignored.
+
+        Args:
+            op (str): One of 'add', 'update', 'rollback' or 'remove'.
+            args: ('add') website, username, password, created_at
+                  ('update') website, username, to_update, value, created_at
+                  ('rollback') website, username, n, created_at, followed by the
+                  restored Version (created_at, website, username, password)
+                  ('remove') website, username
+
+        Returns:
+            applied (bool): False if the record no longer applied and was ignored.
+
+        """
+
+        if op == "add":
+            website, username, password, created_at = args
+            if self._store.get(website, username) is not None:
+                return False
+            self._index(
+                Entry.trusted(website, username, password, parse_timestamp(created_at))
+            )
+        elif op == "update":
+            website, username, to_update, value, created_at = args
+            entry = self._store.get(website, username)
+            if entry is None or not self._set_field(entry, to_update, value):
+                return False
+            self._set_created_at(entry, parse_timestamp(created_at))
+        elif op == "rollback":
+            website, username, _, created_at, *version = args
+            entry = self._store.get(website, username)
+            if entry is None:
+                return False
+            # the version restored, wherever it is in the stored history now
+            n = self._find_version(entry, Version(*version))
+            if not 1 <= n <= entry.history_length():
+                return False
+            return self._restore(entry, n, parse_timestamp(created_at))
+        elif op == "remove":
+            entry = self._store.get(*args)
+            if entry is None:
+                return False
+            self._unindex(entry)
+        else:
+            raise ValueError
+        return True
+
+    def reload(self, entries):
+        """Replaces all entries silently and without notifying listeners,
+        e.g. by the entries another process has stored in the meantime.
+
+        Args:
+            entries (iterable): New entries.
+
+        """
+
+        # indexes are rebuilt on next use instead of being updated entry by entry
+        self._trigrams = None
+        self._sorted_pairs = None
+        self._sorted_websites = None
+        self._domains = None
+        self._usernames = None
+        self._by_time = None
+        for entry in list(self._store):
+            self._store.delete(entry)
+        for entry in entries:
+            assert isinstance(entry, Entry)
+            self._index(entry)
+
+    @timed("PasswordDB.add_entries")
+    def add_entries(self, items):
+        """Adds many entries to DB entries in one call. Entries whose
+        website-username combination is already listed are skipped.
+
+        Args:
+            items (iterable): Entries to add. Consumed lazily, so it may be a generator.
 
+        Returns:
+            added (int): Number of entries added.
+
+        """
+
+        added = 0
+        for item in items:
+            assert isinstance(item, Entry), "item must be of class Entry"
+            if self._store.get(item.website, item.username) is not None:
+                continue
+            self._index(item)
+            self._notify(
+                "add", item.website, item.username, item.password, item.created_at
+            )
+            added += 1
+        return added
+
+    @timed("PasswordDB.add_entry")
     def add_entry(self, item):
         """Adds entry to DB entries
         
         Args:
             item (Entry): Entry to add to entries.
+
+        Raises:
+            DuplicateEntryError: If the website-username combination is already listed.
             
         """
 
         assert isinstance(item, Entry), "item must be of class Entry"
-        if (item.website in [entry.website for entry in self.entries]) and (
-            item.username in [entry.username for entry in self.entries]
-        ):
-            print(
-                "This website-username combination is already listed in the database. Use 3. update an entry to update the entry."
-            )
-        else:
-            self.entries.append(item)
-            print("Entry added to database.")
+        if self._store.get(item.website, item.username) is not None:
+            raise DuplicateEntryError()
+        self._index(item)
+        self._notify("add", item.website, item.username, item.password, item.created_at)
 
+    @timed("PasswordDB.remove_entry")
     def remove_entry(self, item):
         """Removes entry from DB entries
         
         Args:
             item (Entry): Entry to remove from entries.
+
+        Raises:
+            EntryNotFoundError: If item is not stored in the database.
             
         """
 
         assert isinstance(item, Entry)
-        if item not in self.entries:
-            raise ValueError
-        self.entries.remove(item)
-        print("Entry removed from database.")
+        if not self._contains(item):
+            raise EntryNotFoundError()
+        self._unindex(item)
+        self._notify("remove", item.website, item.username)
 
-    def update_entry(self, item, to_update, value):
-        """Updates selected part of an entry in DB.
+    @timed("PasswordDB.update_entry")
+    def update_entry(self, item, to_update, value, created_at=None):
+        """Updates selected part of an entry in DB. The previous version is kept in
+        the history of the entry.
         
         Args:
             item (Entry): Entry to update.
             to_update (str): String defining which part of Entry to update. 
                              Must be in ('w','u','p').
             value (str): Value to use for updating.
+            created_at (int): New creation time of the entry. Defaults to None
+                              (the creation time is kept).
+
+        Raises:
+            InvalidEntryError: If to_update is not one of 'w', 'u', 'p'
+                               or value is not a string or blank.
+            EntryNotFoundError: If item is not stored in the database.
+            DuplicateEntryError: If the new website-username combination is already listed.
         
         """
 
-        assert isinstance(to_update, str)
-        if to_update not in ["w", "u", "p"]:
-            raise ValueError
-        assert isinstance(value, str)
-        if len(value.strip()) == 0:
-            raise ValueError
+        _check_update(to_update, value)
         assert isinstance(item, Entry)
-        if item not in self.entries:
-            raise ValueError
-        if to_update == "w":
-            self.entries[self.entries.index(item)].website = value
-            print("Website updated.")
-        elif to_update == "u":
-            self.entries[self.entries.index(item)].username = value
-            print("Username updated.")
-        else:
-            self.entries[self.entries.index(item)].password = value
-            print("Password updated.")
+        if not self._contains(item):
+            raise EntryNotFoundError()
+        website, username = item.website, item.username
+        if not self._set_field(item, to_update, value):
+            raise DuplicateEntryError()
+        if created_at is not None:
+            self._set_created_at(item, created_at)
+        self._notify("update", website, username, to_update, value, item.created_at)
+
+    @timed("PasswordDB.rollback_entry")
+    def rollback_entry(self, item, n=1, created_at=None):
+        """Restores website, username and password of an earlier version of an entry.
+        The current version is kept in the history, so a rollback can be rolled back.
+
+        Args:
+            item (Entry): Entry to roll back.
+            n (int): Version to restore, 1 for the version before the last change.
+                     Defaults to 1.
+            created_at (int): New creation time of the entry. Defaults to None
+                              (the current time).
+
+        Raises:
+            EntryNotFoundError: If item is not stored in the database or has fewer
+                                than n earlier versions.
+            DuplicateEntryError: If the website-username combination of the version
+                                 is listed for another entry.
 
-    def select_entry(self, website_name):
+        """
+
+        assert isinstance(item, Entry)
+        if not self._contains(item):
+            raise EntryNotFoundError()
+        website, username = item.website, item.username
+        version = item.version(n)
+        if not self._restore(item, n, created_at):
+            raise DuplicateEntryError()
+        self._notify("rollback", website, username, n, item.created_at, *version)
+
+    @staticmethod
+    def _find_version(item, version):
+        # Number of the version of item equal to version (with its password revealed),
+        # 0 if there is none.
+        for n in range(1, item.history_length() + 1):
+            if item.version(n) == version:
+                return n
+        return 0
+
+    def _restore(self, item, n, created_at):
+        # Restores version n of a stored item and re-keys the indexes.
+        # returns False if its website-username combination is taken by another entry.
+        version = item._version(n)
+        if self._store.get(version.website, version.username) not in (None, item):
+            return False
+        self._unindex(item)
+        try:
+            item.restore_version(n, created_at)
+        finally:
+            self._index(item)
+        return True
+
+    @timed("PasswordDB.select_entry")
+    def select_entry(self, website_name, username=None, parents=True):
         """Searches for an Entry given a website name.
+
+        A website stored exactly as website_name is preferred. Otherwise websites with the
+        same host are tried, regardless of scheme, 'www.', case, port and path, and then
+        the websites of its parent domains, closest first (so 'login.example.com' finds
+        the entry of 'https://example.com'). See find_websites.
         
         Args:
             website_name (str): Website name to search entries for.
+            username (str): Username the entry must have. Defaults to None (any).
+            parents (bool): Whether to try parent domains. Defaults to True.
             
         Returns:
             entry (Entry): Entry with website matching website name.
@@ -158,22 +1420,244 @@ class PasswordDB:
         """
 
         assert isinstance(website_name, str)
-        for entry in self.entries:
-            if entry.website == website_name:
+        if username is None:
+            entry = self._store.first(website_name)
+        else:
+            entry = self._store.get(website_name, username)
+        if entry is not None:
+            return entry
+        for website in self.find_websites(website_name, parents, subdomains=False):
+            if username is None:
+                entry = self._store.first(website)
+            else:
+                entry = self._store.get(website, username)
+            if entry is not None:
                 return entry
+        return None
 
-    def list_entries(self):
-        """Displays all entries currently listed in database"""
-        print("The following entries are saved in database:\n")
-        if len(self.entries) == 0:
-            print("The database is currently empty.")
-        else:
-            for entry in self.entries:
-                print(entry)
-
-    def list_websites(self):
-        """Displays all websites currently listed in database"""
-        entry_websites = [entry.website for entry in self.entries]
-        for website in entry_websites:
-            print(website)
-        return entry_websites
+    def find_websites(self, website_name, parents=True, subdomains=True):
+        """Finds stored websites by domain, in time proportional to the depth of the domain.
+
+        The domain index is built on first use and kept up to date afterwards, unless
+        the store keeps one itself (see EntryStore.domain_index).
+
+        Args:
+            website_name (str): Website or host, e.g. 'https://www.example.com/login'
+                                or 'example.com'.
+            parents (bool): Whether to include websites of parent domains. Defaults to True.
+            subdomains (bool): Whether to include websites of subdomains. Defaults to True.
+
+        Returns:
+            websites (list): Stored websites with the same host as website_name, followed
+                             by those of its parent domains (closest first) and of its
+                             subdomains (shallowest first).
+
+        """
+
+        assert isinstance(website_name, str)
+        if self._domains is None:
+            self._domains = self._store.domain_index()
+            if self._domains is None:
+                self._domains = DomainIndex(self._store.websites())
+        websites = self._domains.exact(website_name)
+        if parents:
+            websites += self._domains.parents(website_name)
+        if subdomains:
+            websites += self._domains.subdomains(website_name)
+        return websites
+
+    @timed("PasswordDB.suggest_websites")
+    def suggest_websites(self, website_name, k=3):
+        """Suggests stored websites similar to a (possibly misspelled) website name.
+
+        Websites of the same domain, its parent domains and its subdomains come first
+        (see find_websites). Other candidates are looked up in the trigram index, starting
+        with the rarest trigrams of website_name, and ranked by the overlap of their
+        trigrams with website_name.
+        Trigrams shared by more than SUGGESTION_CANDIDATES websites (such as those of '.com')
+        are skipped unless website_name has no rarer ones, so the cost does not grow with
+        the number of stored websites. The index is built on first use and kept up to date
+        afterwards.
+
+        Args:
+            website_name (str): Website name to find similar websites for.
+            k (int): Maximum number of suggestions. Defaults to 3.
+
+        Returns:
+            websites (list): Up to k stored websites, most similar first.
+                             Empty if no website shares a domain or a trigram with
+                             website_name.
+
+        """
+
+        assert isinstance(website_name, str)
+        related = self.find_websites(website_name)[:k]
+        if len(related) == k:
+            return related
+        if self._trigrams is None:
+            self._build_trigrams()
+        query = _trigrams(website_name)
+        postings = sorted(
+            (self._trigrams[trigram] for trigram in query if trigram in self._trigrams),
+            key=len,
+        )
+        shared = {}
+        for i, websites in enumerate(postings):
+            if i > 0 and len(websites) > SUGGESTION_CANDIDATES:
+                break
+            for website in websites:
+                shared[website] = shared.get(website, 0) + 1
+
+        def similarity(website):
+            # Jaccard similarity of the trigram sets; a padded website of length n has
+            # at most n + 1 distinct trigrams
+            count = shared[website]
+            return count / (len(query) + len(website) + 1 - count)
+
+        for website in related:
+            shared.pop(website, None)
+        return related + heapq.nlargest(k - len(related), shared, key=similarity)
+
+    def count_websites(self):
+        """Returns the number of distinct websites in the database."""
+        return self._store.count_websites()
+
+    def iter_entries(self, offset=0, limit=None, sort_by=None):
+        """Iterates over a page of entries.
+
+        In insertion order, skipping to offset costs time proportional to offset.
+        Sorted by website or creation time, a page costs time proportional to limit;
+        the sort order is built on first use and kept up to date afterwards.
+
+        Args:
+            offset (int): Number of entries to skip. Defaults to 0.
+            limit (int): Maximum number of entries. Defaults to None (all remaining entries).
+            sort_by (str): None for insertion order, 'website' for alphabetical order
+                           of website and username or 'created_at' for chronological
+                           order. Defaults to None.
+
+        Returns:
+            entries (iterator): Iterator over the entries of the page.
+
+        """
+
+        if sort_by is None:
+            return _page(iter(self._store), offset, limit)
+        if sort_by == "created_at":
+            return (
+                self._store.get(website, username)
+                for _, website, username in _page(self._time_index(), offset, limit)
+            )
+        if sort_by != "website":
+            raise ValueError
+        if self._sorted_pairs is None:
+            self._sorted_pairs = sorted(self._store.keys())
+        return (
+            self._store.get(website, username)
+            for website, username in _page(self._sorted_pairs, offset, limit)
+        )
+
+    def _username_index(self):
+        # username -> {website: None}, built on first use.
+        if self._usernames is None:
+            self._usernames = {}
+            for website, username in self._store.keys():
+                self._usernames.setdefault(username, {})[website] = None
+        return self._usernames
+
+    def _time_index(self):
+        # Sorted (created_at, website, username) of all entries, built on first use.
+        if self._by_time is None:
+            self._by_time = sorted(
+                (entry.created_at, entry.website, entry.username) for entry in self._store
+            )
+        return self._by_time
+
+    def _time_range(self, since, before):
+        # Start and end of the entries created in [since, before) in the time index.
+        by_time = self._time_index()
+        start = 0 if since is None else bisect_left(by_time, (since,))
+        end = len(by_time) if before is None else bisect_left(by_time, (before,))
+        return start, max(start, end)
+
+    @timed("PasswordDB.query")
+    def query(self, query=None, **criteria):
+        """Iterates over the entries matching a query.
+
+        The candidates come from the most selective of the username index, the time
+        index (searched with bisect) and the domain index, and only they are checked
+        against the other criteria, so selective queries do not scan the database.
+        The username and time indexes are built on first use and kept up to date.
+
+        Args:
+            query (Query): Query to match. Defaults to None (match criteria only).
+            criteria: Arguments of Query (username, since, before, domain, where),
+                      combined with query.
+
+        Returns:
+            entries (iterator): Iterator over the matching entries; ordered by creation
+                                time if the time index is used, else by insertion.
+
+        Raises:
+            ValueError: If since or before is not a valid time.
+
+        """
+
+        if query is None:
+            query = Query(**criteria)
+        elif criteria:
+            assert isinstance(query, Query)
+            query = query & Query(**criteria)
+        assert isinstance(query, Query)
+        if query.empty:
+            return iter(())
+        # (number of candidates, candidate (website, username) pairs) per usable index
+        plans = [(len(self._store), None)]
+        if query.username is not None:
+            websites = self._username_index().get(query.username, {})
+            plans.append(
+                (len(websites), ((website, query.username) for website in websites))
+            )
+        if query.since is not None or query.before is not None:
+            start, end = self._time_range(query.since, query.before)
+            by_time = self._by_time
+            plans.append(
+                (end - start, (by_time[i][1:] for i in range(start, end)))
+            )
+        for domain in query.domains:
+            websites = self.find_websites(domain, parents=False)
+            plans.append((len(websites), self._pairs_of(websites)))
+        candidates = min(plans, key=lambda plan: plan[0])[1]
+        if candidates is None:
+            return filter(query.matches, iter(self._store))
+        entries = (self._store.get(website, username) for website, username in candidates)
+        return (entry for entry in entries if entry is not None and query.matches(entry))
+
+    def _pairs_of(self, websites):
+        # Yields the (website, username) pairs of the entries of websites, reading
+        # only those websites from the store.
+        for website in websites:
+            for username in sorted(self._store.usernames(website)):
+                yield website, username
+
+    def iter_websites(self, offset=0, limit=None, sort_by=None):
+        """Iterates over a page of distinct websites.
+
+        Args:
+            offset (int): Number of websites to skip. Defaults to 0.
+            limit (int): Maximum number of websites. Defaults to None (all remaining websites).
+            sort_by (str): None for insertion order or 'website' for alphabetical order.
+                           Defaults to None.
+
+        Returns:
+            websites (iterator): Iterator over the websites of the page.
+
+        """
+
+        if sort_by is None:
+            return _page(self._store.websites(), offset, limit)
+        if sort_by != "website":
+            raise ValueError
+        if self._sorted_websites is None:
+            self._sorted_websites = sorted(self._store.websites())
+        return _page(self._sorted_websites, offset, limit)
@@ -1,85 +1,601 @@
 """Module random_password -- functions for random password generation.
 
-Function load_pw_components(filepath, col): 
-    Loads lists of English and German words as well as punctuation for password generation.
-Function generate_random_pw(min_length, max_length, special_characters, exclude_characters): 
+Function load_pw_components(filepath, col, language):
+    Loads a list of words (English, German, French or Spanish) as well as punctuation for password generation.
+    Results are cached, so every wordlist is read only once per process.
+Function compile_wordlist(words, filepath):
+    Writes words to a compiled binary wordlist that can be memory-mapped by load_pw_components.
+Class MappedWordlist:
+    Read-only sequence of words backed by a memory-mapped compiled wordlist.
+Class WordIndex:
+    Index of a wordlist by word length and by a per-word character bitmask.
+Class MappedWordIndex:
+    WordIndex stored in a compiled wordlist, read from the memory-mapped file.
+Function word_index(language, wordlist):
+    Returns the cached WordIndex of a language's or a wordlist file's words.
+Class BufferedSystemRandom:
+    Cryptographically secure random generator drawing from os.urandom in large buffered chunks.
+Function generate_random_pw(min_length, max_length, special_characters, exclude_characters, language, wordlist):
     Generates random password string from given parameters and components_dict.
+Function generate_random_pws(n, min_length, max_length, special_characters, exclude_characters, language, processes, report, wordlist):
+    Generates n random passwords in one call, optionally spread across a process pool.
 
 """
 
-from string import punctuation
+from array import array
+from collections.abc import Sequence
+from string import punctuation, digits as digits_string
 import csv
+import functools
+import gzip
+import json
+import mmap
+import os
 import re
 import random
+import struct
+import time
+from exceptions import PasswordRulesError
+from instrument import timed
 
+WORDLIST_DIR = os.path.dirname(os.path.abspath(__file__))
+WORDLISTS = {
+    "english": "eng_words.csv",
+    "german": "ger_words.csv",
+    "french": "fre_words.csv",
+    "spanish": "spa_words.csv",
+}
+# Compiled wordlist layout: magic, word count n, n + 1 little-endian uint32 offsets
+# into the blob that follows, blob of utf-8 encoded words, followed by the WordIndex
+# of the words: byte size and utf-8 encoded characters in the order of their bits,
+# mask width w in bytes, number of word lengths and for every word length the length,
+# its number of words k, k uint32 positions of the words and k w-byte masks.
+WORDLIST_MAGIC = b"PWWL\x00\x01"
+# File names load_pw_components can read words from.
+WORDLIST_FORMAT = re.compile(r"\.(csv|json)(\.gz)?$|\.bin$")
+_COUNT = struct.Struct("<I")
+# Batches smaller than this are not worth spreading across processes.
+MIN_BATCH_PER_PROCESS = 10000
+
+
+class BufferedSystemRandom(random.Random):
+    """Cryptographically secure random generator drawing from os.urandom in large buffered chunks.
+
+    Behaves like random.SystemRandom, but reads chunk_size bytes from the operating system
+    at once instead of calling os.urandom for every number drawn.
+
+    Args:
+        chunk_size (int): Number of random bytes read per os.urandom call. Defaults to 64 KiB.
+
+    """
+
+    def __init__(self, chunk_size=64 * 1024):
+        assert isinstance(chunk_size, int) and chunk_size > 0
+        self._chunk_size = chunk_size
+        self._buffer = b""
+        self._pos = 0
+        super().__init__()
+
+    def seed(self, *args, **kwargs):
+        """Has no effect; entropy always comes from os.urandom."""
+
+    def reset(self):
+        """Discards buffered bytes, e.g. in a forked child that must not reuse its parent's."""
+        self._buffer = b""
+        self._pos = 0
+
+    def _read(self, n):
+        # Returns n random bytes from the buffer, refilling it from os.urandom when exhausted.
+        if self._pos + n > len(self._buffer):
+            self._buffer = os.urandom(max(self._chunk_size, n))
+            self._pos = 0
+        data = self._buffer[self._pos : self._pos + n]
+        self._pos += n
+        return data
+
+    def getrandbits(self, k):
+        """Returns a non-negative int with k random bits."""
+        if k < 0:
+            raise ValueError("number of bits must be non-negative")
+        nbytes = (k + 7) // 8
+        value = int.from_bytes(self._read(nbytes), "big")
+        return value >> (nbytes * 8 - k)
+
+    def random(self):
+        """Returns a random float in [0.0, 1.0)."""
+        return (int.from_bytes(self._read(7), "big") >> 3) * 2 ** -53
+
+    def getstate(self, *args, **kwargs):
+        raise NotImplementedError("BufferedSystemRandom has no state")
+
+    setstate = getstate
+
+
+_rng = BufferedSystemRandom()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_rng.reset)
+
+
+class MappedWordlist:
+    """Read-only sequence of words backed by a memory-mapped compiled wordlist.
+
+    Opening the wordlist only maps the file; words are decoded when they are accessed.
+    The WordIndex stored in the file is read by MappedWordIndex.
+
+    Args:
+        filepath (str): Path to a wordlist written by compile_wordlist.
+
+    """
+
+    def __init__(self, filepath):
+        with open(filepath, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[: len(WORDLIST_MAGIC)] != WORDLIST_MAGIC:
+            raise ValueError("{} is not a compiled wordlist".format(filepath))
+        (self._count,) = _COUNT.unpack_from(self._map, len(WORDLIST_MAGIC))
+        self._offsets = len(WORDLIST_MAGIC) + _COUNT.size
+        self._blob = self._offsets + (self._count + 1) * _COUNT.size
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("wordlist index out of range")
+        start, end = struct.unpack_from(
+            "<2I", self._map, self._offsets + index * _COUNT.size
+        )
+        return self._map[self._blob + start : self._blob + end].decode()
+
+
+def compile_wordlist(words, filepath):
+    """Writes words to a compiled binary wordlist that can be memory-mapped by load_pw_components.
+
+    Args:
+        words (iterable): Words to write.
+        filepath (str): Path of the compiled wordlist. Should end in '.bin'.
+
+    """
+
+    words = list(words)
+    encoded = [word.encode() for word in words]
+    offsets = [0]
+    for word in encoded:
+        offsets.append(offsets[-1] + len(word))
+    index = WordIndex(words)
+    alphabet = "".join(index._bits).encode()
+    width = (len(index._bits) + 7) // 8
+    with open(filepath, "wb") as file:
+        file.write(WORDLIST_MAGIC)
+        file.write(_COUNT.pack(len(encoded)))
+        file.write(struct.pack("<{}I".format(len(offsets)), *offsets))
+        file.write(b"".join(encoded))
+        file.write(_COUNT.pack(len(alphabet)) + alphabet)
+        file.write(struct.pack("<2I", width, len(index._positions)))
+        for length, positions in index._positions.items():
+            file.write(struct.pack("<2I", length, len(positions)))
+            file.write(struct.pack("<{}I".format(len(positions)), *positions))
+            masks = index._masks[length]
+            file.write(b"".join(mask.to_bytes(width, "little") for mask in masks))
+
+
+class WordIndex:
+    """Index of a wordlist by word length and by a per-word character bitmask.
+
+    Every character occurring in the wordlist is assigned a bit; a word's mask has
+    the bits of all its characters set. Words that avoid a set of characters are
+    therefore found with a single bitwise AND per word, without building candidates.
 
-def load_pw_components(filepath="eng_words.csv", col=1):
-    """Loads lists of English and German words as well as punctuation for password generation.
-    
     Args:
-        filepath (str): Path to csv or json file with english words. Defaults to 'eng_words.csv'. 
+        words (sequence): Words to index.
+
+    Methods:
+        candidates(min_length, max_length, exclude_characters): Words satisfying the constraints.
+
+    """
+
+    def __init__(self, words):
+        self._bits = {}
+        # word length -> list of words, list of their positions and list of their masks
+        self._words = {}
+        self._positions = {}
+        self._masks = {}
+        for position, word in enumerate(words):
+            mask = 0
+            for char in word:
+                bit = self._bits.get(char)
+                if bit is None:
+                    bit = self._bits[char] = 1 << len(self._bits)
+                mask |= bit
+            self._words.setdefault(len(word), []).append(word)
+            self._positions.setdefault(len(word), []).append(position)
+            self._masks.setdefault(len(word), []).append(mask)
+
+    def mask(self, characters):
+        """Returns the bitmask of characters. Characters not in any word are ignored.
+
+        Args:
+            characters (iterable): Characters to build the mask of.
+
+        """
+
+        mask = 0
+        for char in characters:
+            mask |= self._bits.get(char, 0)
+        return mask
+
+    def candidates(self, min_length, max_length, exclude_characters=None):
+        """Returns all words of min_length to max_length characters that contain none of exclude_characters.
+
+        Args:
+            min_length (int): Minimum word length.
+            max_length (int): Maximum word length.
+            exclude_characters (iterable): Characters the words must not contain. Defaults to None.
+
+        Returns:
+            words (list): Matching words.
+
+        """
+
+        excluded = self.mask(exclude_characters or ())
+        words = []
+        for length in range(max(min_length, 0), max_length + 1):
+            if length not in self._words:
+                continue
+            if not excluded:
+                words.extend(self._words[length])
+            else:
+                words.extend(
+                    word
+                    for word, mask in zip(self._words[length], self._masks[length])
+                    if not mask & excluded
+                )
+        return words
+
+
+class MappedWordIndex(WordIndex):
+    """WordIndex stored in a compiled wordlist, read from the memory-mapped file.
+
+    Opening the index decodes no words. Candidates are found from the stored positions
+    and masks and returned as a sequence that decodes a word when it is accessed.
+
+    Args:
+        wordlist (MappedWordlist): Compiled wordlist to read the index of.
+
+    """
+
+    def __init__(self, wordlist):
+        assert isinstance(wordlist, MappedWordlist)
+        self._wordlist = wordlist
+        self._map = wordlist._map
+        (blob_size,) = _COUNT.unpack_from(
+            self._map, wordlist._offsets + len(wordlist) * _COUNT.size
+        )
+        offset = wordlist._blob + blob_size
+        (size,) = _COUNT.unpack_from(self._map, offset)
+        offset += _COUNT.size
+        alphabet = self._map[offset : offset + size].decode()
+        self._bits = {char: 1 << i for i, char in enumerate(alphabet)}
+        self._width, n_lengths = struct.unpack_from("<2I", self._map, offset + size)
+        offset += size + 2 * _COUNT.size
+        # word length -> (number of words, offset of their positions)
+        self._groups = {}
+        for _ in range(n_lengths):
+            length, count = struct.unpack_from("<2I", self._map, offset)
+            offset += 2 * _COUNT.size
+            self._groups[length] = count, offset
+            offset += count * (_COUNT.size + self._width)
+
+    def candidates(self, min_length, max_length, exclude_characters=None):
+        """Returns all words of min_length to max_length characters that contain none of exclude_characters.
+
+        Args:
+            min_length (int): Minimum word length.
+            max_length (int): Maximum word length.
+            exclude_characters (iterable): Characters the words must not contain. Defaults to None.
+
+        Returns:
+            words (sequence): Matching words, decoded when accessed.
+
+        """
+
+        excluded = self.mask(exclude_characters or ())
+        width = self._width
+        positions = array("I")
+        for length in range(max(min_length, 0), max_length + 1):
+            if length not in self._groups:
+                continue
+            count, offset = self._groups[length]
+            found = struct.unpack_from("<{}I".format(count), self._map, offset)
+            if excluded:
+                masks = offset + count * _COUNT.size
+                found = [
+                    position
+                    for i, position in enumerate(found)
+                    if not excluded
+                    & int.from_bytes(
+                        self._map[masks + i * width : masks + (i + 1) * width], "little"
+                    )
+                ]
+            positions.extend(found)
+        return _Selection(self._wordlist, positions)
+
+
+class _Selection(Sequence):
+    # Words of a wordlist at the given positions, looked up when accessed.
+
+    def __init__(self, words, positions):
+        self._words = words
+        self._positions = positions
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __getitem__(self, index):
+        return self._words[self._positions[index]]
+
+
+@functools.lru_cache(maxsize=None)
+def word_index(language="english", wordlist=None):
+    """Returns the WordIndex of a wordlist, built once per process. The index of a
+    compiled wordlist is read from the file (see MappedWordIndex).
+
+    Args:
+        language (str): One of WORDLISTS. Defaults to 'english'.
+        wordlist (str): Path to a wordlist file as read by load_pw_components, used
+                        instead of the bundled wordlist of language. Defaults to None.
+
+    """
+
+    words = load_pw_components(wordlist, language=language)["words"]
+    if isinstance(words, MappedWordlist):
+        return MappedWordIndex(words)
+    return WordIndex(words)
+
+
+def _resolve_path(filepath):
+    # Paths that do not exist relative to the working directory are looked up next to this module.
+    if os.path.exists(filepath) or os.path.isabs(filepath):
+        return filepath
+    return os.path.join(WORDLIST_DIR, filepath)
+
+
+def _open_text(filepath):
+    # Opens a plain or gzip-compressed text file.
+    if filepath.endswith(".gz"):
+        return gzip.open(filepath, "rt", newline="")
+    return open(filepath, "r", newline="")
+
+
+@timed("load_pw_components")
+@functools.lru_cache(maxsize=None)
+def load_pw_components(filepath=None, col=1, language="english"):
+    """Loads a list of words as well as punctuation for password generation.
+
+    Results are cached per (filepath, col, language), so repeated calls do not read the file again.
+
+    Args:
+        filepath (str): Path to csv, json (optionally gzip-compressed, ending in '.gz')
+                        or compiled '.bin' wordlist. Defaults to None, in which case
+                        the bundled wordlist of language is used.
         col (int): If csv file, indicate column with words. Defaults to 1.
+        language (str): One of WORDLISTS ('english', 'german', 'french', 'spanish').
+                        Only used if filepath is None. Defaults to 'english'.
     Returns:
-        components_dict (dict): Dict with keys = ['special_characters', 'eng_words']
-                                and their corresponding lists as values.
-                                
+        components_dict (dict): Dict with keys = ['special_characters', 'words']
+                                and their corresponding sequences as values.
+
     """
 
+    if filepath is None:
+        if language not in WORDLISTS:
+            raise ValueError("Unknown language {}".format(language))
+        filepath = WORDLISTS[language]
     assert isinstance(filepath, str)
-    is_csv = bool(re.search(".csv$", filepath))
-    is_json = bool(re.search(".csv$", filepath))
-    assert is_csv or is_json
+    filepath = _resolve_path(filepath)
+    match = WORDLIST_FORMAT.search(filepath)
+    if match is None:
+        raise ValueError("Unknown wordlist format of {}".format(filepath))
+    is_csv = match.group(1) == "csv"
+    is_json = match.group(1) == "json"
     components = {}
     punct = [str(s) for s in punctuation]
     if is_csv:
-        with open(filepath, "r") as csv_file:
+        with _open_text(filepath) as csv_file:
             reader = csv.reader(csv_file)
-            eng_words = [entry[col] for entry in list(reader)]
+            # skip the unnamed header row written by pandas (',0')
+            words = [row[col] for row in reader if row and row[0] != ""]
+    elif is_json:
+        with _open_text(filepath) as json_file:
+            words = json.load(json_file)
+        assert isinstance(words, list)
     else:
-        with open(filepath) as json_file:
-            eng_words = json.load(json_file)
-    components["eng_words"] = eng_words
+        words = MappedWordlist(filepath)
+    components["words"] = words
     components["special_characters"] = punct
     return components
 
 
+@timed("generate_random_pw")
 def generate_random_pw(
     min_length=7,
     max_length=25,
     special_characters=True,
     exclude_characters=None,
+    language="english",
+    wordlist=None,
 ):
     """Generates random password string from given parameters and components_dict.
-    
+
     Args:
         min_length (int): Minimum character length of generated password. Defaults to 7.
         max_length (int): Maximum character length of generated password. Defaults to 25.
         special_characters (bool): Whether to include special characters. Defaults to True.
         exclude_characters (list): List of characters to exclude from password generation.
                                    Defaults to None.
-    
+        language (str): Language of the word in the password. Defaults to 'english'.
+        wordlist (str): Path to a csv, json or compiled '.bin' wordlist to draw the word
+                        from instead of the bundled wordlist of language. Defaults to None.
+
     Returns:
-        password (str): Randomly generated password string containing letters, 
+        password (str): Randomly generated password string containing letters,
                         integers and special characters (unless excluded).
-    
+
+    Raises:
+        PasswordRulesError: If no password can satisfy the given length, exclusion
+                            and language rules, or wordlist cannot be read.
+
     """
 
-    search_dict = load_pw_components()
-    while True:
-        words = []
-        words.append(str(random.randrange(0, 10)))
-        words.append(random.choice(search_dict["eng_words"]))
-        if special_characters:
-            words.append(random.choice(search_dict["special_characters"]))
-        random.shuffle(words)
-        random_pw = "".join(words)
-        if len(random_pw) >= min_length and len(random_pw) <= max_length:
-            if not exclude_characters:
-                return random_pw
-            else:
-                assert isinstance(exclude_characters, list)
-                not_allowed = [
-                    entry for entry in exclude_characters if entry in random_pw
-                ]
-                if not not_allowed:
-                    return random_pw
+    pools = _password_pools(
+        min_length, max_length, special_characters, exclude_characters, language, wordlist
+    )
+    return _generate_one(pools, _rng)
+
+
+@timed("generate_random_pws")
+def generate_random_pws(
+    n,
+    min_length=7,
+    max_length=25,
+    special_characters=True,
+    exclude_characters=None,
+    language="english",
+    processes=None,
+    report=False,
+    wordlist=None,
+):
+    """Generates n random passwords in one call.
+
+    All randomness is drawn from a buffered cryptographic source. Large batches
+    can be spread across a process pool.
+
+    Args:
+        n (int): Number of passwords to generate.
+        min_length, max_length, special_characters, exclude_characters, language, wordlist:
+            See generate_random_pw.
+        processes (int): Number of worker processes. Defaults to None (generate in this process).
+                         Batches are only split if every worker gets at least
+                         MIN_BATCH_PER_PROCESS passwords.
+        report (bool): Whether to print the achieved throughput. Defaults to False.
+
+    Returns:
+        passwords (list): List of n randomly generated password strings.
+
+    Raises:
+        PasswordRulesError: If no password can satisfy the given length, exclusion
+                            and language rules, or wordlist cannot be read.
+
+    """
+
+    assert isinstance(n, int) and n >= 0
+    start = time.perf_counter()
+    # fail before starting any workers if the rules cannot be satisfied
+    options = (
+        min_length,
+        max_length,
+        special_characters,
+        exclude_characters,
+        language,
+        wordlist,
+    )
+    _password_pools(*options)
+    workers = min(processes or 1, n // MIN_BATCH_PER_PROCESS)
+    if workers > 1:
+        # imported here, as it is only needed for large batches and slow to import
+        from concurrent.futures import ProcessPoolExecutor
+
+        sizes = [n // workers + (i < n % workers) for i in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            passwords = []
+            for chunk in executor.map(_generate_chunk, [(size,) + options for size in sizes]):
+                passwords.extend(chunk)
+    else:
+        passwords = _generate_chunk((n,) + options)
+    if report:
+        elapsed = time.perf_counter() - start
+        print(
+            "Generated {} passwords in {:.3f} seconds ({:.0f} passwords/s).".format(
+                n, elapsed, n / elapsed if elapsed else float("inf")
+            )
+        )
+    return passwords
+
+
+def _generate_chunk(args):
+    # Generates a list of passwords; args = (n, min_length, max_length, special_characters,
+    # exclude_characters, language, wordlist). Top-level so that it can run in worker processes.
+    n = args[0]
+    pools = _password_pools(*args[1:])
+    return [_generate_one(pools, _rng) for _ in range(n)]
+
+
+def _password_pools(
+    min_length, max_length, special_characters, exclude_characters, language, wordlist=None
+):
+    # Returns (words, digits, specials) to draw password components from, such that every
+    # combination satisfies the length and exclusion rules. specials is None if not used.
+    # raises PasswordRulesError if the rules cannot be satisfied.
+    if exclude_characters:
+        assert isinstance(exclude_characters, list)
+    return _cached_pools(
+        min_length,
+        max_length,
+        bool(special_characters),
+        frozenset(exclude_characters or ()),
+        language,
+        wordlist,
+    )
+
+
+@functools.lru_cache(maxsize=128)
+def _cached_pools(
+    min_length, max_length, special_characters, excluded, language, wordlist
+):
+    # Cached implementation of _password_pools; excluded is a frozenset of characters.
+    if wordlist is None and language not in WORDLISTS:
+        raise PasswordRulesError("Unknown language {}".format(language))
+    try:
+        components = load_pw_components(wordlist, language=language)
+        index = word_index(language, wordlist)
+    except (OSError, ValueError) as e:
+        raise PasswordRulesError("Cannot read wordlist {}: {}".format(wordlist, e))
+    digits = [d for d in digits_string if d not in excluded]
+    if not digits:
+        raise PasswordRulesError("Passwords contain a digit, but all digits are excluded.")
+    specials = None
+    if special_characters:
+        specials = [
+            c
+            for c in components["special_characters"]
+            if c not in excluded
+        ]
+        if not specials:
+            raise PasswordRulesError(
+                "Passwords contain a special character, but all special characters are excluded."
+            )
+    # one digit and, if requested, one special character are added to the word
+    extra = 1 + special_characters
+    words = index.candidates(min_length - extra, max_length - extra, excluded)
+    if not words:
+        raise PasswordRulesError(
+            "No {} word yields a password of {} to {} characters{}.".format(
+                language if wordlist is None else "wordlist",
+                min_length,
+                max_length,
+                " without the excluded characters" if excluded else "",
+            )
+        )
+    return words, digits, specials
+
+
+def _generate_one(pools, rng):
+    # Draws one password from pools as returned by _password_pools.
+    words, digits, specials = pools
+    components = [rng.choice(digits), rng.choice(words)]
+    if specials is not None:
+        components.append(rng.choice(specials))
+    rng.shuffle(components)
+    return "".join(components)
@@ -0,0 +1,965 @@
+"""Module storage -- persistence of a PasswordDB on disk.
+
+Once a storage is initialized or unlocked with the master password, everything it
+writes is encrypted (see module crypto). The key record with the KDF parameters is
+kept in a small JSON file next to the database (path + '.key'). Passwords are
+encrypted one by one and only decrypted when they are read.
+
+Several processes may use the same PickleStorage or JournalStorage files at once.
+Loading takes a shared lock and committing an exclusive lock on path + '.lock', so
+readers proceed in parallel and only wait while a commit writes. Files are replaced
+atomically and flushed to disk. Before writing, a commit checks whether another process
+has stored changes since the database was read; if so, it reloads the stored database
+and replays its own changes on top instead of overwriting the other changes.
+
+Class StorageBackend:
+    Interface of all storage backends, handles the master password and key record.
+Class PickleStorage:
+    Stores the whole PasswordDB as a single snapshot on every commit.
+Class JournalStorage:
+    Appends every change to a journal next to the snapshot and compacts the
+    journal into a new snapshot once it grows past a size threshold.
+Class SQLiteStore:
+    Entry store reading and writing single encrypted entries in an SQLite database.
+Class SQLiteDomainIndex:
+    Lookups of the websites of an SQLiteStore by domain.
+Class SQLiteStorage:
+    Stores the PasswordDB in an SQLite database, loading entries on demand.
+
+"""
+
+from contextlib import contextmanager
+import json
+import os
+import pickle
+import struct
+import weakref
+from crypto import SealedPassword, create_key_record, unlock
+from exceptions import ConflictError
+from instrument import timed
+from pw_classes import (
+    Entry,
+    EntryStore,
+    PasswordDB,
+    normalize_website,
+    parse_timestamp,
+)
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory file locks on this platform (e.g. Windows); access is not coordinated
+    fcntl = None
+
+SNAPSHOT_MAGIC = b"PWDBSNP1"
+JOURNAL_MAGIC = b"PWDBJRN1"
+# flag following the magic: contents encrypted or plain
+ENCRYPTED = b"E"
+PLAIN = b"P"
+_LENGTH = struct.Struct(">I")
+# seconds an SQLite connection waits for the write lock held by another process
+SQLITE_TIMEOUT = 30
+
+
+def _fsync_directory(path):
+    # Flushes the directory holding path to disk, so a rename survives a crash.
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_atomic(path, data):
+    # Writes data to a temporary file, flushes it to disk and moves it over path, so
+    # neither an interrupted write nor a crash leaves a truncated file behind.
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    _fsync_directory(path)
+
+
+def _signature(path):
+    # Identifies the version of a file that is only ever replaced as a whole, None if missing.
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _open_history(cipher, history):
+    # History of an entry as stored by _rows or SQLiteStore, with sealed passwords
+    # (bytes) wrapped in SealedPasswords of cipher.
+    return tuple(
+        (created_at, website, username, SealedPassword(cipher, password))
+        if isinstance(password, bytes)
+        else (created_at, website, username, password)
+        for created_at, website, username, password in history
+    )
+
+
+class StorageBackend:
+    """Interface of all storage backends.
+
+    Before loading, a storage is either initialized with a new master password or
+    unlocked with the existing one. A storage that is neither (only possible for
+    PickleStorage and JournalStorage) reads and writes unencrypted data.
+
+    Args:
+        path (str): Path of the stored database.
+
+    Methods:
+        exists(): Whether a stored database exists.
+        has_key(): Whether a master password has been set for the database.
+        initialize(password, kdf_params): Sets the master password of the database.
+        unlock(password): Checks the master password and derives the key.
+        load(): Loads the stored database, or a new one if none exists.
+        commit(db): Persists all changes made to db.
+        close(db): Persists db and releases open files.
+
+    """
+
+    def __init__(self, path):
+        assert isinstance(path, str)
+        self.path = path
+        self.key_path = path + ".key"
+        self.lock_path = path + ".lock"
+        self._cipher = None
+
+    def exists(self):
+        """Returns True if a stored database exists."""
+        return os.path.exists(self.path)
+
+    def has_key(self):
+        """Returns True if a master password has been set for the database."""
+        return os.path.exists(self.key_path)
+
+    def initialize(self, password, kdf_params):
+        """Sets the master password and writes the key record.
+
+        Unencrypted data already stored is encrypted when it is next loaded.
+
+        Args:
+            password (str): New master password.
+            kdf_params (dict): KDF parameters as returned by crypto.calibrate_kdf.
+
+        """
+
+        assert isinstance(password, str)
+        record, self._cipher = create_key_record(password, kdf_params)
+        with self._lock():
+            _write_atomic(self.key_path, json.dumps(record).encode())
+
+    @timed("storage.unlock")
+    def unlock(self, password):
+        """Checks the master password against the key record and derives the key.
+
+        Args:
+            password (str): Master password given by the user.
+
+        Returns:
+            unlocked (bool): True if the password is correct.
+
+        """
+
+        with open(self.key_path) as file:
+            record = json.load(file)
+        cipher = unlock(password, record)
+        if cipher is None:
+            return False
+        self._cipher = cipher
+        return True
+
+    def load(self):
+        raise NotImplementedError
+
+    def commit(self, db):
+        raise NotImplementedError
+
+    def close(self, db):
+        raise NotImplementedError
+
+    @contextmanager
+    def _lock(self, shared=False):
+        # Holds a shared or exclusive lock on the lock file while the block runs.
+        # Locks are not reentrant: the block must not take the lock again.
+        with open(self.lock_path, "ab") as file:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            yield
+
+    def _flag(self):
+        # Flag of the data written by this storage.
+        return ENCRYPTED if self._cipher is not None else PLAIN
+
+    def _encode(self, obj, aad):
+        # Pickles obj and encrypts it if the storage is unlocked.
+        data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        if self._cipher is not None:
+            data = self._cipher.seal(data, aad)
+        return data
+
+    def _decode(self, data, flag, aad):
+        # Decrypts data if flag says it is encrypted and unpickles it.
+        if flag == ENCRYPTED:
+            if self._cipher is None:
+                raise ValueError("The database is encrypted, unlock it first")
+            data = self._cipher.open(data, aad)
+        elif flag != PLAIN:
+            raise ValueError("Unknown storage format")
+        return pickle.loads(data)
+
+    def _rows(self, db):
+        # Yields (website, username, created_at, password) of all entries, followed by
+        # their history if they have one; passwords are sealed (bytes) if the storage
+        # is unlocked.
+        for entry in db:
+            if self._cipher is not None:
+                row = (
+                    entry.website,
+                    entry.username,
+                    entry.created_at,
+                    entry.seal_password(self._cipher),
+                )
+                if entry.history_length():
+                    row += (entry.seal_history(self._cipher),)
+            else:
+                row = entry.website, entry.username, entry.created_at, entry.password
+                if entry.history_length():
+                    row += (tuple(map(tuple, entry.history[::-1])),)
+            yield row
+
+    def _entry(self, website, username, created_at, password, history=()):
+        # Creates an Entry from a row as yielded by _rows; rows written by earlier
+        # versions carry a formatted creation date.
+        if isinstance(password, bytes):
+            password = SealedPassword(self._cipher, password)
+        return Entry.trusted(
+            website,
+            username,
+            password,
+            parse_timestamp(created_at),
+            _open_history(self._cipher, history),
+        )
+
+
+class PickleStorage(StorageBackend):
+    """Stores the whole PasswordDB as a single snapshot.
+
+    Every snapshot carries a generation number that is increased with every write.
+
+    Args:
+        path (str): Path of the snapshot file. Defaults to 'password_db.p'.
+
+    """
+
+    def __init__(self, path="password_db.p"):
+        super().__init__(path)
+        self._generation = 0
+        # signature of the snapshot as last read or written by this storage
+        self._version = None
+        # changes made since the last commit, replayed if another process stored changes
+        self._pending = []
+
+    @timed("storage.load")
+    def load(self):
+        """Loads the stored database and starts recording its changes.
+
+        Snapshots that are unencrypted, although the storage is unlocked, or that were
+        written by an earlier version are rewritten right away.
+
+        Returns:
+            pw_db (PasswordDB): The stored database, or a new empty one if none exists.
+
+        """
+
+        with self._lock(shared=True):
+            pw_db, outdated = self._read()
+        if outdated:
+            with self._lock():
+                pw_db, outdated = self._read(repair=True)
+                if outdated:
+                    self._compact(pw_db)
+        pw_db.add_listener(self._record)
+        return pw_db
+
+    @timed("storage.commit")
+    def commit(self, db):
+        """Persists all changes made to db by writing a new snapshot.
+
+        If another process has stored changes since db was read, db is first reloaded
+        with the stored entries and the changes made to db are applied on top.
+
+        Args:
+            db (PasswordDB): Database returned by load().
+
+        Raises:
+            ConflictError: If some changes no longer applied to the stored entries.
+                           All other changes are saved.
+
+        """
+
+        self._save(db, self._write)
+
+    def close(self, db):
+        """Persists db and releases open files.
+
+        Args:
+            db (PasswordDB): Database returned by load().
+
+        """
+
+        self.commit(db)
+
+    def _record(self, *record):
+        # Listener registered on the loaded PasswordDB; keeps change records until the next commit.
+        self._pending.append(record)
+
+    def _save(self, db, write):
+        # Calls write(db) while holding the exclusive lock, after merging the changes
+        # other processes have stored in the meantime.
+        with self._lock():
+            conflicts = self._merge(db) if self._changed() else []
+            write(db)
+            self._pending = []
+        if conflicts:
+            raise ConflictError(conflicts)
+
+    def _merge(self, db):
+        # Reloads db with the stored entries and applies the pending changes on top.
+        # Returns the changes that no longer applied; they are dropped.
+        stored, _ = self._read(repair=True)
+        db.reload(list(stored))
+        applied, conflicts = [], []
+        for record in self._pending:
+            (applied if db.apply_change(*record) else conflicts).append(record)
+        self._pending = applied
+        return conflicts
+
+    def _changed(self):
+        # True if another process has written the stored database since it was read or written.
+        return _signature(self.path) != self._version
+
+    def _read(self, repair=False):
+        # Returns the stored PasswordDB and whether it should be rewritten.
+        # repair is only allowed while holding the exclusive lock.
+        pw_db, self._generation, outdated = self._read_snapshot()
+        self._version = _signature(self.path)
+        return pw_db, outdated
+
+    def _write(self, db):
+        # Writes all changes made to db.
+        self._compact(db)
+
+    def _compact(self, db):
+        # Writes db as a new snapshot of the next generation.
+        self._generation += 1
+        self._write_snapshot(db, self._generation)
+        self._version = _signature(self.path)
+
+    @timed("storage.read_snapshot")
+    def _read_snapshot(self):
+        # Returns the stored PasswordDB, its generation and whether the snapshot should
+        # be rewritten (earlier format, or unencrypted although the storage is unlocked).
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return PasswordDB(), 0, False
+        header = len(SNAPSHOT_MAGIC) + 1
+        if data[: len(SNAPSHOT_MAGIC)] == SNAPSHOT_MAGIC:
+            flag = data[len(SNAPSHOT_MAGIC) : header]
+            generation, rows = self._decode(data[header:], flag, data[:header])
+            pw_db = PasswordDB([self._entry(*row) for row in rows])
+            return pw_db, generation, flag != self._flag()
+        # PasswordDB pickled by earlier versions
+        pw_db = pickle.loads(data)
+        assert isinstance(pw_db, PasswordDB)
+        return pw_db, 0, True
+
+    @timed("storage.write_snapshot")
+    def _write_snapshot(self, db, generation):
+        # Writes db with its generation as a new snapshot.
+        assert isinstance(db, PasswordDB)
+        header = SNAPSHOT_MAGIC + self._flag()
+        body = self._encode((generation, list(self._rows(db))), header)
+        _write_atomic(self.path, header + body)
+
+
+class JournalStorage(PickleStorage):
+    """Stores the PasswordDB as a snapshot plus an append-only journal of changes.
+
+    Each change is appended to the journal as a small (encrypted) record, so the cost
+    of a commit depends on the size of the change and not on the size of the database.
+    On load the journal is replayed on top of the snapshot. Once the journal
+    grows past compact_threshold bytes it is folded into a new snapshot.
+    The journal carries the generation of its snapshot, so a journal that was already
+    folded into the snapshot is never replayed twice.
+
+    Args:
+        path (str): Path of the snapshot file. Defaults to 'password_db.p'.
+                    The journal is stored at path + '.journal'.
+        compact_threshold (int): Journal size in bytes after which it is compacted.
+                                 Defaults to 1 MiB.
+
+    """
+
+    def __init__(self, path="password_db.p", compact_threshold=1024 * 1024):
+        super().__init__(path)
+        assert isinstance(compact_threshold, int)
+        self.journal_path = path + ".journal"
+        self.compact_threshold = compact_threshold
+        # end of the last complete journal record read or written by this storage
+        self._journal_end = 0
+
+    def exists(self):
+        """Returns True if a stored snapshot or journal exists."""
+        return super().exists() or os.path.exists(self.journal_path)
+
+    @timed("storage.commit")
+    def commit(self, db):
+        """Appends all changes made to db to the journal and flushes it to disk.
+
+        Compacts the journal if it has grown past the threshold. Changes stored by
+        other processes in the meantime are merged as in PickleStorage.commit.
+
+        Args:
+            db (PasswordDB): Database returned by load().
+
+        Raises:
+            ConflictError: If some changes no longer applied to the stored entries.
+                           All other changes are saved.
+
+        """
+
+        self._save(db, self._write)
+
+    def compact(self, db):
+        """Writes db as a new snapshot and empties the journal.
+
+        Args:
+            db (PasswordDB): Database returned by load().
+
+        Raises:
+            ConflictError: See commit.
+
+        """
+
+        self._save(db, self._compact)
+
+    def _changed(self):
+        # True if another process has written the snapshot or the journal since they were
+        # read or written.
+        return super()._changed() or self._journal_size() != self._journal_end
+
+    def _read(self, repair=False):
+        # Returns the stored PasswordDB with the journal replayed and whether it should be
+        # rewritten. A damaged journal is only repaired with repair, which is only allowed
+        # while holding the exclusive lock.
+        pw_db, outdated = super()._read()
+        for record in self._read_journal(repair):
+            if record is None:
+                # unencrypted although the storage is unlocked
+                outdated = True
+                continue
+            pw_db.apply_change(*record)
+        return pw_db, outdated
+
+    def _write(self, db):
+        # Appends the pending changes to the journal and flushes it to disk.
+        if self._pending:
+            mode = "r+b" if os.path.exists(self.journal_path) else "w+b"
+            with open(self.journal_path, mode) as file:
+                # cuts off whatever follows the last complete record, e.g. a record
+                # cut short by a crash or a journal of another generation
+                file.seek(self._journal_end)
+                file.truncate()
+                if self._journal_end == 0:
+                    file.write(JOURNAL_MAGIC + self._flag())
+                    file.write(self._frame(self._generation))
+                file.write(b"".join(self._frame(record) for record in self._pending))
+                file.flush()
+                os.fsync(file.fileno())
+                self._journal_end = file.tell()
+        if self._journal_end > self.compact_threshold:
+            self._compact(db)
+
+    def _compact(self, db):
+        # Writes db as a new snapshot and empties the journal.
+        super()._compact(db)
+        # a crash before the journal is emptied leaves a journal of the previous
+        # generation behind, which is recognised and discarded
+        with open(self.journal_path, "wb"):
+            pass
+        self._journal_end = 0
+
+    def _frame(self, obj):
+        # obj as a length-prefixed (encrypted) journal record.
+        data = self._encode(obj, JOURNAL_MAGIC)
+        return _LENGTH.pack(len(data)) + data
+
+    def _read_journal(self, repair):
+        # Yields the records stored in the journal and sets _journal_end to the end of the
+        # last complete record. A journal of another generation than the snapshot is
+        # discarded, and a record cut short by a crash ends the journal; with repair, both
+        # are cut off the file. The records of a journal that is unencrypted although
+        # the storage is unlocked are followed by None.
+        self._journal_end = 0
+        try:
+            file = open(self.journal_path, "r+b" if repair else "rb")
+        except FileNotFoundError:
+            return
+        with file:
+            magic = file.read(len(JOURNAL_MAGIC))
+            if magic != JOURNAL_MAGIC:
+                # an empty journal, or one cut short by a crash while it was started
+                if not JOURNAL_MAGIC.startswith(magic):
+                    raise ValueError("Unknown storage format")
+                return
+            flag = file.read(1)
+            if flag == ENCRYPTED and self._cipher is None:
+                raise ValueError("The database is encrypted, unlock it first")
+            frames = self._read_frames(file, flag)
+            if next(frames, None) != self._generation:
+                self._journal_end = 0
+                if repair:
+                    file.truncate(0)
+                return
+            yield from frames
+            if repair:
+                file.truncate(self._journal_end)
+            if flag != self._flag():
+                yield None
+
+    def _read_frames(self, file, flag):
+        # Yields the decoded records of the journal until the first incomplete one and
+        # sets _journal_end after each. A record that fails authentication counts as incomplete.
+        while True:
+            length = file.read(_LENGTH.size)
+            if len(length) < _LENGTH.size:
+                return
+            data = file.read(_LENGTH.unpack(length)[0])
+            if len(data) < _LENGTH.unpack(length)[0]:
+                return
+            try:
+                obj = self._decode(data, flag, JOURNAL_MAGIC)
+            except (EOFError, pickle.UnpicklingError, ValueError):
+                return
+            self._journal_end = file.tell()
+            yield obj
+
+    def _journal_size(self):
+        # Size of the journal in bytes, 0 if it does not exist.
+        try:
+            return os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return 0
+
+
+class SQLiteStore(EntryStore):
+    """Entry store reading and writing single encrypted entries in an SQLite database.
+
+    Website, username and creation date of an entry are encrypted together and its
+    password separately, so reading an entry never decrypts its password. Rows are
+    found by keyed digests (blind indexes) of website and username, and by those of
+    the domains of the normalized host of their website (see SQLiteDomainIndex).
+    Record and password are both bound to the blind indexes of their row, so neither
+    can be moved to another row without failing authentication.
+    Entries are only loaded when they are accessed. While an entry is in use,
+    every lookup of its website-username combination returns the same object.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the database. The entries
+                                         table and its indexes are created if missing.
+        cipher (VaultCipher): Cipher of the unlocked database.
+
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sealed_entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            website_index BLOB NOT NULL,
+            username_index BLOB NOT NULL,
+            record BLOB NOT NULL,
+            password BLOB,
+            UNIQUE (website_index, username_index)
+        );
+        CREATE INDEX IF NOT EXISTS sealed_entries_username
+            ON sealed_entries (username_index);
+        CREATE TABLE IF NOT EXISTS sealed_domains (
+            domain_index BLOB NOT NULL,
+            host_labels INTEGER NOT NULL,
+            entry_id INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS sealed_domains_domain
+            ON sealed_domains (domain_index, host_labels);
+        CREATE INDEX IF NOT EXISTS sealed_domains_entry
+            ON sealed_domains (entry_id);
+    """
+    COLUMNS = "website_index, username_index, record, password"
+
+    def __init__(self, connection, cipher):
+        assert cipher is not None
+        self._conn = connection
+        self._cipher = cipher
+        self._conn.executescript(self.SCHEMA)
+        # (website, username) -> Entry for all entries currently in use
+        self._loaded = weakref.WeakValueDictionary()
+        # while a savepoint is open, (key, entry loaded before) of every insert and
+        # delete since, else None
+        self._undo = None
+
+    def _indexes(self, website, username):
+        # Blind indexes of a website-username combination.
+        return self._cipher.blind_index(website), self._cipher.blind_index(username)
+
+    def _domain_index(self, domain):
+        # Blind index of a domain, distinct from those of websites and usernames.
+        return self._cipher.blind_index("domain " + domain)
+
+    def _domain_rows(self, website, entry_id):
+        # (domain_index, host_labels, entry_id) rows of the normalized host of website
+        # and all its parent domains, e.g. 'login.example.com', 'example.com', 'com'.
+        host = normalize_website(website)
+        labels = host.split(".") if host else []
+        return [
+            (self._domain_index(".".join(labels[i:])), len(labels), entry_id)
+            for i in range(len(labels))
+        ]
+
+    @staticmethod
+    def _password_aad(indexes):
+        # Associated data binding a sealed password to the row of its blind indexes.
+        return SealedPassword.AAD + b"".join(indexes)
+
+    def _seal_record(self, item):
+        # Encrypted website, username and creation date of item, followed by its history
+        # with sealed passwords if it has one, bound to its blind indexes.
+        record = item.website, item.username, item.created_at
+        if item.history_length():
+            record += (item.seal_history(self._cipher),)
+        return self._cipher.seal(
+            pickle.dumps(record), b"".join(self._indexes(item.website, item.username))
+        )
+
+    def _open_record(self, row):
+        # Decrypts (website, username, created_at[, history]) of a row starting with
+        # website_index, username_index, record.
+        return pickle.loads(self._cipher.open(row[2], row[0] + row[1]))
+
+    def _entry(self, row):
+        # Returns the Entry of a (website_index, username_index, record, password) row.
+        record = self._open_record(row)
+        website, username, created_at = record[:3]
+        entry = self._loaded.get((website, username))
+        if entry is None:
+            password = row[3]
+            if password is not None:
+                password = SealedPassword(
+                    self._cipher, password, self._password_aad(row[:2])
+                )
+            entry = Entry.trusted(
+                website,
+                username,
+                password,
+                parse_timestamp(created_at),
+                _open_history(self._cipher, record[3] if len(record) > 3 else ()),
+            )
+            self._loaded[(website, username)] = entry
+        return entry
+
+    def get(self, website, username):
+        entry = self._loaded.get((website, username))
+        if entry is not None:
+            return entry
+        row = self._conn.execute(
+            "SELECT {} FROM sealed_entries "
+            "WHERE website_index = ? AND username_index = ?".format(self.COLUMNS),
+            self._indexes(website, username),
+        ).fetchone()
+        if row is not None:
+            return self._entry(row)
+
+    def first(self, website):
+        row = self._conn.execute(
+            "SELECT {} FROM sealed_entries WHERE website_index = ? "
+            "ORDER BY id LIMIT 1".format(self.COLUMNS),
+            (self._cipher.blind_index(website),),
+        ).fetchone()
+        if row is not None:
+            return self._entry(row)
+
+    def has_website(self, website):
+        return (
+            self._conn.execute(
+                "SELECT 1 FROM sealed_entries WHERE website_index = ? LIMIT 1",
+                (self._cipher.blind_index(website),),
+            ).fetchone()
+            is not None
+        )
+
+    def count_websites(self):
+        return self._conn.execute(
+            "SELECT COUNT(DISTINCT website_index) FROM sealed_entries"
+        ).fetchone()[0]
+
+    def insert(self, item):
+        indexes = self._indexes(item.website, item.username)
+        cursor = self._conn.execute(
+            "INSERT INTO sealed_entries ({}) VALUES (?, ?, ?, ?)".format(self.COLUMNS),
+            indexes
+            + (
+                self._seal_record(item),
+                item.seal_password(self._cipher, self._password_aad(indexes)),
+            ),
+        )
+        self._conn.executemany(
+            "INSERT INTO sealed_domains VALUES (?, ?, ?)",
+            self._domain_rows(item.website, cursor.lastrowid),
+        )
+        self._track((item.website, item.username))
+        self._loaded[(item.website, item.username)] = item
+
+    def delete(self, item):
+        indexes = self._indexes(item.website, item.username)
+        self._conn.execute(
+            "DELETE FROM sealed_domains WHERE entry_id IN (SELECT id FROM sealed_entries "
+            "WHERE website_index = ? AND username_index = ?)",
+            indexes,
+        )
+        self._conn.execute(
+            "DELETE FROM sealed_entries WHERE website_index = ? AND username_index = ?",
+            indexes,
+        )
+        self._track((item.website, item.username))
+        self._loaded.pop((item.website, item.username), None)
+
+    def _track(self, key):
+        # Remembers the entry loaded for key before an insert or delete, to put it back
+        # if the open savepoint is rolled back.
+        if self._undo is not None:
+            self._undo.append((key, self._loaded.get(key)))
+
+    def save(self, item):
+        indexes = self._indexes(item.website, item.username)
+        self._conn.execute(
+            "UPDATE sealed_entries SET record = ?, password = ? "
+            "WHERE website_index = ? AND username_index = ?",
+            (
+                self._seal_record(item),
+                item.seal_password(self._cipher, self._password_aad(indexes)),
+            )
+            + indexes,
+        )
+
+    def keys(self):
+        rows = self._conn.execute(
+            "SELECT website_index, username_index, record FROM sealed_entries ORDER BY id"
+        )
+        return (tuple(self._open_record(row)[:2]) for row in rows)
+
+    def usernames(self, website):
+        rows = self._conn.execute(
+            "SELECT website_index, username_index, record FROM sealed_entries "
+            "WHERE website_index = ? ORDER BY id",
+            (self._cipher.blind_index(website),),
+        )
+        return (self._open_record(row)[1] for row in rows)
+
+    def websites(self):
+        # with MIN(id), SQLite takes the other columns from the first row of each website
+        rows = self._conn.execute(
+            "SELECT website_index, username_index, record, MIN(id) FROM sealed_entries "
+            "GROUP BY website_index ORDER BY MIN(id)"
+        )
+        return (self._open_record(row)[0] for row in rows)
+
+    def domain_websites(self, domain, subdomains=False):
+        """Returns the websites whose normalized host is domain, or with subdomains
+        those of its subdomains instead, shallowest first. Only the rows of these
+        websites are read.
+
+        Args:
+            domain (str): Normalized host, e.g. 'example.com'.
+            subdomains (bool): Whether to find the websites of the subdomains.
+                               Defaults to False.
+
+        Returns:
+            websites (list): Websites in order of their first entry.
+
+        """
+
+        # with MIN(id), SQLite takes the other columns from the first row of each website
+        rows = self._conn.execute(
+            "SELECT website_index, username_index, record, MIN(id) "
+            "FROM sealed_domains JOIN sealed_entries ON id = entry_id "
+            "WHERE domain_index = ? AND host_labels {} ? "
+            "GROUP BY website_index ORDER BY host_labels, MIN(id)".format(
+                ">" if subdomains else "="
+            ),
+            (self._domain_index(domain), len(domain.split("."))),
+        )
+        return [self._open_record(row)[0] for row in rows]
+
+    def domain_index(self):
+        return SQLiteDomainIndex(self)
+
+    @contextmanager
+    def savepoint(self):
+        assert self._undo is None
+        # within the transaction committed by the storage, which is begun here if no
+        # change has been made since the last commit
+        if not self._conn.in_transaction:
+            self._conn.execute("BEGIN")
+        self._conn.execute("SAVEPOINT batch")
+        self._undo = []
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK TO batch")
+            for key, entry in reversed(self._undo):
+                if entry is None:
+                    self._loaded.pop(key, None)
+                else:
+                    self._loaded[key] = entry
+            raise
+        finally:
+            self._undo = None
+            self._conn.execute("RELEASE batch")
+
+    def __iter__(self):
+        rows = self._conn.execute(
+            "SELECT {} FROM sealed_entries ORDER BY id".format(self.COLUMNS)
+        )
+        return map(self._entry, rows)
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM sealed_entries").fetchone()[0]
+
+
+class SQLiteDomainIndex:
+    """Lookups of the websites of an SQLiteStore by domain, with the methods of
+    pw_classes.DomainIndex.
+
+    The store keeps a blind index of the normalized host of every entry and of each
+    of its parent domains, so every lookup is answered by the index and only reads
+    the rows of the websites found. The store keeps the index up to date itself.
+
+    Args:
+        store (SQLiteStore): Store to look up websites in.
+
+    """
+
+    def __init__(self, store):
+        assert isinstance(store, SQLiteStore)
+        self._store = store
+
+    def add(self, website):
+        """Does nothing, the store indexes every entry it inserts."""
+
+    def discard(self, website):
+        """Does nothing, the store removes every entry it deletes from the index."""
+
+    def exact(self, website):
+        """Returns the stored websites with the same normalized host as website."""
+        host = normalize_website(website)
+        return self._store.domain_websites(host) if host else []
+
+    def parents(self, website):
+        """Returns the stored websites of the parent domains of website, closest first.
+        Top-level domains are left out."""
+        labels = normalize_website(website).split(".")
+        return [
+            found
+            for i in range(1, len(labels) - 1)
+            for found in self._store.domain_websites(".".join(labels[i:]))
+        ]
+
+    def subdomains(self, website):
+        """Returns the stored websites of the subdomains of website, shallowest first."""
+        host = normalize_website(website)
+        return self._store.domain_websites(host, subdomains=True) if host else []
+
+
+class SQLiteStorage(StorageBackend):
+    """Stores the PasswordDB in an SQLite database, loading entries on demand.
+
+    Opening the database does not read any entries. Lookups touch only the rows they
+    need via the indexes on website and username, and every change writes single rows.
+    The storage must be initialized or unlocked before it is loaded.
+
+    Args:
+        path (str): Path of the database file. Defaults to 'password_db.sqlite'.
+
+    """
+
+    def __init__(self, path="password_db.sqlite"):
+        super().__init__(path)
+        self._conn = None
+
+    @timed("storage.load")
+    def load(self):
+        """Opens the database.
+
+        Returns:
+            pw_db (PasswordDB): Database backed by the SQLite file, created if it does not exist.
+
+        """
+
+        # imported here, so the other backends start without loading sqlite3
+        import sqlite3
+
+        if self._cipher is None:
+            raise ValueError("The database is encrypted, unlock it first")
+        # SQLite coordinates concurrent processes itself; a writer waits up to
+        # SQLITE_TIMEOUT seconds for another one to finish. The connection may be used
+        # by other threads, one at a time (e.g. by the worker threads of the agent).
+        self._conn = sqlite3.connect(
+            self.path, timeout=SQLITE_TIMEOUT, check_same_thread=False
+        )
+        # switching to WAL does not wait for other connections, so processes opening
+        # a new database at the same time take turns
+        with self._lock():
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            store = SQLiteStore(self._conn, self._cipher)
+        return PasswordDB(store=store)
+
+    @timed("storage.commit")
+    def commit(self, db):
+        """Commits all changes made to db.
+
+        Args:
+            db (PasswordDB): Database returned by load().
+
+        """
+
+        self._conn.commit()
+
+    def close(self, db):
+        """Commits all changes made to db and closes the database.
+
+        Args:
+            db (PasswordDB): Database returned by load().
+
+        """
+
+        self._conn.commit()
+        self._conn.close()
+        self._conn = None
+
+
+# Storage backend classes by name, as chosen with --storage
+BACKENDS = {
+    "journal": JournalStorage,
+    "pickle": PickleStorage,
+    "sqlite": SQLiteStorage,
+}
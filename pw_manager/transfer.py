@@ -0,0 +1,240 @@
+"""Module transfer -- streaming import and export of entries as CSV or JSONL.
+
+Rows are processed one at a time through generators, so neither importing
+nor exporting holds the whole file in memory.
+
+Function format_from_path(path):
+    Infers 'csv' or 'jsonl' from a file extension.
+Function read_rows(file, fmt, errors):
+    Yields (line number, row dict) pairs read from a CSV or JSONL file.
+Function entry_from_row(row):
+    Creates an Entry from a row, applying the same rules as the menu does.
+Function entries_from_rows(rows, errors):
+    Yields an Entry for every valid row, collecting invalid rows in errors.
+Function import_entries(pw_db, file, fmt):
+    Adds all valid entries of a CSV or JSONL file to a PasswordDB.
+Function export_entries(pw_db, file, fmt):
+    Writes all entries of a PasswordDB to a CSV or JSONL file.
+
+"""
+
+import csv
+import json
+from exceptions import InvalidEntryError
+from pw_classes import (
+    Entry,
+    PasswordDB,
+    format_timestamp,
+    is_valid_website,
+    parse_timestamp,
+)
+
+FORMATS = ("csv", "jsonl")
+FIELDS = ("website", "username", "password", "created_at")
+
+
+def format_from_path(path):
+    """Infers the format of a file from its extension.
+
+    Args:
+        path (str): Path of the file.
+
+    Returns:
+        fmt (str): 'csv' or 'jsonl'.
+
+    """
+
+    if path.endswith(".csv"):
+        return "csv"
+    if path.endswith(".jsonl") or path.endswith(".json"):
+        return "jsonl"
+    raise ValueError("Cannot infer format of {}, use one of {}".format(path, FORMATS))
+
+
+def read_rows(file, fmt, errors=None):
+    """Yields (line number, row dict) pairs read from a CSV or JSONL file.
+
+    Malformed CSV rows are skipped. Reading stops at the first line that cannot be
+    decoded; open the file with errors='surrogateescape' to have such lines rejected
+    one by one by entry_from_row instead.
+
+    Args:
+        file (file): Text file to read. CSV files need a header row naming the columns.
+        fmt (str): 'csv' or 'jsonl'.
+        errors (list): (line number, message) is appended for every line that cannot
+                       be read. Defaults to None (raise InvalidEntryError instead).
+
+    """
+
+    if fmt == "csv":
+        reader = csv.DictReader(file)
+        # DictReader.line_num is only updated for rows read successfully,
+        # so errors are located by the line number of the underlying reader
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                line_num = reader.reader.line_num
+                _read_error(errors, line_num, "Not valid CSV: {}".format(e))
+                continue
+            except UnicodeDecodeError:
+                _read_error(errors, reader.reader.line_num + 1, "Not valid UTF-8")
+                return
+            yield reader.line_num, row
+    elif fmt == "jsonl":
+        line_num = 0
+        while True:
+            try:
+                line = next(file, None)
+            except UnicodeDecodeError:
+                _read_error(errors, line_num + 1, "Not valid UTF-8")
+                return
+            if line is None:
+                return
+            line_num += 1
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_num, row
+    else:
+        raise ValueError("Unknown format {}".format(fmt))
+
+
+def _read_error(errors, line_num, message):
+    # Appends (line_num, message) to errors, raises InvalidEntryError if errors is None.
+    if errors is None:
+        raise InvalidEntryError("Line {}: {}".format(line_num, message))
+    errors.append((line_num, message))
+
+
+def entry_from_row(row):
+    """Creates an Entry from a row, applying the same rules as the menu does.
+
+    Args:
+        row (dict): Row with keys 'website', 'username' and optionally 'password' and 'created_at'.
+
+    Returns:
+        entry (Entry): Entry created from row.
+
+    Raises:
+        InvalidEntryError: If the row is not a valid entry.
+
+    """
+
+    if not isinstance(row, dict):
+        raise InvalidEntryError("Not a row of named fields")
+    website = row.get("website")
+    username = row.get("username")
+    password = row.get("password")
+    created_at = row.get("created_at")
+    if not isinstance(website, str) or not is_valid_website(website):
+        raise InvalidEntryError("Not a valid website")
+    if not isinstance(username, str) or len(username.strip()) == 0:
+        raise InvalidEntryError("Username is missing")
+    if password is not None and not isinstance(password, str):
+        raise InvalidEntryError("Password is not a string")
+    try:
+        # undecodable bytes of a file read with errors='surrogateescape'
+        (website + username + (password or "")).encode()
+    except UnicodeEncodeError:
+        raise InvalidEntryError("Not valid UTF-8") from None
+    if password is not None and len(password.strip()) == 0:
+        password = None
+    entry = Entry(website, username, password)
+    if created_at:
+        entry.created_at = parse_timestamp(created_at)
+    return entry
+
+
+def entries_from_rows(rows, errors):
+    """Yields an Entry for every valid row.
+
+    Args:
+        rows (iterable): (line number, row) pairs as yielded by read_rows.
+        errors (list): (line number, message) is appended for every invalid row.
+
+    """
+
+    for line_num, row in rows:
+        try:
+            yield entry_from_row(row)
+        except ValueError as e:
+            errors.append((line_num, str(e)))
+
+
+def import_entries(pw_db, file, fmt):
+    """Adds all valid entries of a CSV or JSONL file to a PasswordDB.
+
+    Rows whose website-username combination is already listed are skipped.
+    The caller persists the database once afterwards.
+
+    Args:
+        pw_db (PasswordDB): Database to add entries to.
+        file (file): Text file to read.
+        fmt (str): 'csv' or 'jsonl'.
+
+    Returns:
+        added (int): Number of entries added.
+        skipped (int): Number of valid entries skipped as duplicates.
+        errors (list): (line number, message) for every invalid or unreadable row.
+
+    """
+
+    assert isinstance(pw_db, PasswordDB)
+    errors = []
+    valid = 0
+
+    def count(entries):
+        nonlocal valid
+        for entry in entries:
+            valid += 1
+            yield entry
+
+    added = pw_db.add_entries(
+        count(entries_from_rows(read_rows(file, fmt, errors), errors))
+    )
+    return added, valid - added, errors
+
+
+def export_entries(pw_db, file, fmt):
+    """Writes all entries of a PasswordDB to a CSV or JSONL file, one row at a time.
+
+    Args:
+        pw_db (PasswordDB): Database to export.
+        file (file): Text file to write.
+        fmt (str): 'csv' or 'jsonl'.
+
+    Returns:
+        exported (int): Number of entries written.
+
+    """
+
+    assert isinstance(pw_db, PasswordDB)
+    rows = (
+        {
+            "website": entry.website,
+            "username": entry.username,
+            "password": entry.password,
+            "created_at": format_timestamp(entry.created_at),
+        }
+        for entry in pw_db
+    )
+    exported = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(file, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            exported += 1
+    elif fmt == "jsonl":
+        for row in rows:
+            file.write(json.dumps(row) + "\n")
+            exported += 1
+    else:
+        raise ValueError("Unknown format {}".format(fmt))
+    return exported
@@ -0,0 +1,428 @@
+"""Module vaults -- named vaults, each stored as a shard of its own, and their catalog.
+
+The default vault is the database the password manager has always used
+(password_db.p, or password_db.sqlite with --storage sqlite, in the working directory).
+Further vaults are listed by name in a small catalog (vaults.json) and stored in a
+directory of their own (vaults/NAME/), with their own master password, key record and
+lock file, so each of them can be mounted, i.e. unlocked and loaded, independently.
+Reading the catalog touches none of the vaults: a vault is only mounted when it is
+first accessed, so starting the password manager costs the same with one vault as with
+fifty. Searches across vaults run on all mounted vaults, one after the other.
+
+Class Catalog:
+    Names, storage backends and paths of the vaults besides the default vault.
+Class Vault:
+    One vault: its storage and, once mounted, its PasswordManager.
+Class VaultSet:
+    The default vault and the vaults of a catalog, mounted on first access.
+
+"""
+
+from contextlib import contextmanager
+import json
+import os
+import re
+from exceptions import (
+    ConflictError,
+    DuplicateVaultError,
+    InvalidVaultNameError,
+    VaultLockedError,
+    VaultNotFoundError,
+)
+from instrument import timed
+from storage import BACKENDS
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory file locks on this platform (e.g. Windows); access is not coordinated
+    fcntl = None
+
+CATALOG = "vaults.json"
+# directory next to the catalog holding one directory per vault
+VAULT_DIRECTORY = "vaults"
+DEFAULT_VAULT = "default"
+NAME_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,63}")
+
+
+class Catalog:
+    """Names, storage backends and paths of the vaults besides the default vault,
+    kept in a JSON file:
+
+        {"vaults": {"work": {"storage": "sqlite",
+                             "path": "vaults/work/password_db.sqlite"}}}
+
+    Paths are relative to the directory of the catalog. A missing file is an empty
+    catalog. Changes are written atomically while holding a lock on path + '.lock',
+    so processes changing the catalog at the same time do not lose each other's changes.
+
+    Args:
+        path (str): Path of the catalog. Defaults to CATALOG.
+
+    Methods:
+        names(): Returns the names of the listed vaults.
+        record(name): Returns storage backend and path of a vault.
+        add(name, storage): Lists a new vault and creates its directory.
+        forget(name): Removes a vault from the catalog, keeping its files.
+        reload(): Reads the catalog again.
+
+    """
+
+    def __init__(self, path=CATALOG):
+        assert isinstance(path, str)
+        self.path = path
+        self.lock_path = path + ".lock"
+        self._vaults = self._read()
+
+    def __contains__(self, name):
+        return name in self._vaults
+
+    def __len__(self):
+        return len(self._vaults)
+
+    def _read(self):
+        # Vault records of the catalog file by name, empty if there is none.
+        try:
+            with open(self.path) as file:
+                return json.load(file)["vaults"]
+        except FileNotFoundError:
+            return {}
+
+    @contextmanager
+    def _lock(self):
+        # Holds an exclusive lock on the lock file while the block runs.
+        with open(self.lock_path, "ab") as file:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def _write(self):
+        # Replaces the catalog file atomically.
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump({"vaults": self._vaults}, file, indent=2, sort_keys=True)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+
+    def reload(self):
+        """Reads the catalog again, e.g. to see vaults added by another process."""
+        self._vaults = self._read()
+
+    def names(self):
+        """Returns the names of the listed vaults, sorted."""
+        return sorted(self._vaults)
+
+    def record(self, name):
+        """Returns storage backend and path of a vault.
+
+        Args:
+            name (str): Name of the vault.
+
+        Returns:
+            storage (str): Name of the storage backend, a key of storage.BACKENDS.
+            path (str): Path of the stored database.
+
+        Raises:
+            VaultNotFoundError: If no vault of the name is listed.
+
+        """
+
+        try:
+            record = self._vaults[name]
+        except KeyError:
+            raise VaultNotFoundError(name) from None
+        path = os.path.join(os.path.dirname(self.path), record["path"])
+        return record["storage"], path
+
+    def add(self, name, storage="journal"):
+        """Lists a new vault and creates its directory, accessible to the user only.
+        Its database is created once it is mounted.
+
+        Args:
+            name (str): Name of the vault.
+            storage (str): Name of the storage backend. Defaults to 'journal'.
+
+        Returns:
+            path (str): Path of the database of the vault.
+
+        Raises:
+            InvalidVaultNameError: If the name is not valid.
+            DuplicateVaultError: If the name is the default vault or already listed.
+
+        """
+
+        assert storage in BACKENDS
+        if not isinstance(name, str) or not NAME_PATTERN.fullmatch(name):
+            raise InvalidVaultNameError()
+        if name == DEFAULT_VAULT:
+            raise DuplicateVaultError(name)
+        # default file name of the backend, e.g. password_db.p
+        filename = os.path.basename(BACKENDS[storage]().path)
+        directory = os.path.join(VAULT_DIRECTORY, name)
+        with self._lock():
+            self._vaults = self._read()
+            if name in self._vaults:
+                raise DuplicateVaultError(name)
+            os.makedirs(
+                os.path.join(os.path.dirname(self.path), directory),
+                mode=0o700,
+                exist_ok=True,
+            )
+            self._vaults[name] = {
+                "storage": storage,
+                "path": os.path.join(directory, filename),
+            }
+            self._write()
+        return self.record(name)[1]
+
+    def forget(self, name):
+        """Removes a vault from the catalog. Its files are kept.
+
+        Args:
+            name (str): Name of the vault.
+
+        Returns:
+            path (str): Path of the database of the vault.
+
+        Raises:
+            VaultNotFoundError: If no vault of the name is listed.
+
+        """
+
+        with self._lock():
+            self._vaults = self._read()
+            path = self.record(name)[1]
+            del self._vaults[name]
+            self._write()
+        return path
+
+
+class Vault:
+    """One vault: its storage and, once mounted, its PasswordManager.
+
+    Args:
+        name (str): Name of the vault.
+        storage (StorageBackend): Storage of the vault, neither unlocked nor loaded.
+
+    Attributes:
+        name (str): Name of the vault.
+        storage (StorageBackend): Storage of the vault.
+        manager (PasswordManager): Password manager of the vault, None until mounted.
+
+    """
+
+    def __init__(self, name, storage):
+        assert isinstance(name, str)
+        self.name = name
+        self.storage = storage
+        self.manager = None
+
+    @property
+    def mounted(self):
+        """Whether the vault is unlocked and loaded."""
+        return self.manager is not None
+
+
+class VaultSet:
+    """The default vault and the vaults of a catalog, each mounted (unlocked and
+    loaded) when it is first accessed and kept mounted until close().
+
+    Args:
+        catalog (Catalog): Catalog of the vaults besides the default vault.
+        unlock (callable): Called with a Vault to mount; unlocks (or initializes) its
+                           storage and returns True if it succeeded. Defaults to None
+                           (vaults are only mounted by mount(name, unlock)).
+        default_storage (str): Storage backend of the default vault, stored at the
+                               default path of the backend. Defaults to 'journal'.
+        breach_corpus (BreachCorpus): Breached password corpus of every vault's
+                                      PasswordManager. Defaults to None.
+
+    Methods:
+        names(): Returns the names of all vaults.
+        vault(name): Returns a vault.
+        mounted(): Returns the names of the mounted vaults.
+        mount(name, unlock): Mounts a vault and returns its PasswordManager.
+        manager(name, mount): Returns the PasswordManager of a vault, mounting it first.
+        search(website, k): Returns websites similar to website in all mounted vaults.
+        find(**criteria): Returns the entries matching criteria in all mounted vaults.
+        close(): Commits and releases all mounted vaults.
+
+    """
+
+    def __init__(
+        self, catalog, unlock=None, default_storage="journal", breach_corpus=None
+    ):
+        assert isinstance(catalog, Catalog)
+        assert default_storage in BACKENDS
+        self.catalog = catalog
+        self.unlock = unlock
+        self.default_storage = default_storage
+        self.breach_corpus = breach_corpus
+        # name -> Vault, created on first access
+        self._vaults = {}
+
+    def names(self):
+        """Returns the names of all vaults, the default vault first."""
+        return [DEFAULT_VAULT] + self.catalog.names()
+
+    def vault(self, name=DEFAULT_VAULT):
+        """Returns a vault, without mounting it.
+
+        Args:
+            name (str): Name of the vault. Defaults to DEFAULT_VAULT.
+
+        Returns:
+            vault (Vault): The vault.
+
+        Raises:
+            VaultNotFoundError: If name is neither the default vault nor listed
+                                in the catalog.
+
+        """
+
+        vault = self._vaults.get(name)
+        if vault is not None:
+            return vault
+        if name == DEFAULT_VAULT:
+            storage = BACKENDS[self.default_storage]()
+        else:
+            if name not in self.catalog:
+                # possibly added by another process since the catalog was read
+                self.catalog.reload()
+            backend, path = self.catalog.record(name)
+            storage = BACKENDS[backend](path)
+        vault = self._vaults[name] = Vault(name, storage)
+        return vault
+
+    def mounted(self):
+        """Returns the names of the mounted vaults, the default vault first."""
+        return [
+            name
+            for name in self.names()
+            if name in self._vaults and self._vaults[name].mounted
+        ]
+
+    @timed("VaultSet.mount")
+    def mount(self, name=DEFAULT_VAULT, unlock=None):
+        """Mounts a vault: unlocks its storage and loads its database.
+        Does nothing if it is mounted already.
+
+        Args:
+            name (str): Name of the vault. Defaults to DEFAULT_VAULT.
+            unlock (callable): Called with the Vault, unlocks its storage and returns
+                               True if it succeeded. Defaults to None (the unlock
+                               callable of the vault set).
+
+        Returns:
+            manager (PasswordManager): Password manager of the vault.
+
+        Raises:
+            VaultNotFoundError: If there is no vault of the name.
+            VaultLockedError: If the vault could not be unlocked.
+
+        """
+
+        vault = self.vault(name)
+        if vault.mounted:
+            return vault.manager
+        unlock = unlock or self.unlock
+        if unlock is None or not unlock(vault):
+            raise VaultLockedError(name)
+        # imported here, so reading the catalog does not load the manager and the
+        # password generator
+        from manager import PasswordManager
+
+        vault.manager = PasswordManager(
+            vault.storage.load(), vault.storage, breach_corpus=self.breach_corpus
+        )
+        return vault.manager
+
+    def manager(self, name=DEFAULT_VAULT, mount=True):
+        """Returns the PasswordManager of a vault, mounting the vault first if needed.
+
+        Args:
+            name (str): Name of the vault. Defaults to DEFAULT_VAULT.
+            mount (bool): Whether to mount the vault if it is not mounted.
+                          Defaults to True.
+
+        Returns:
+            manager (PasswordManager): Password manager of the vault.
+
+        Raises:
+            VaultNotFoundError: If there is no vault of the name.
+            VaultLockedError: If the vault is not mounted and mount is False,
+                              or it could not be unlocked.
+
+        """
+
+        vault = self.vault(name)
+        if vault.mounted:
+            return vault.manager
+        if not mount:
+            raise VaultLockedError(name)
+        return self.mount(name)
+
+    def _fan_out(self, func):
+        # Calls func with the PasswordManager of every mounted vault and returns
+        # (vault name, result) pairs in mounted() order. Searches are pure Python and
+        # hold the GIL, so threads would not run them any faster.
+        return [(name, func(self._vaults[name].manager)) for name in self.mounted()]
+
+    @timed("VaultSet.search")
+    def search(self, website, k=3):
+        """Returns the websites most similar to website in every mounted vault
+        (see PasswordManager.suggest).
+
+        Args:
+            website (str): Website to look for.
+            k (int): Maximum number of websites per vault. Defaults to 3.
+
+        Returns:
+            matches (list): (vault name, website) pairs, grouped by vault in mounted()
+                            order, most similar first within every vault.
+
+        """
+
+        results = self._fan_out(lambda manager: manager.suggest(website, k))
+        return [(name, match) for name, matches in results for match in matches]
+
+    @timed("VaultSet.find")
+    def find(self, **criteria):
+        """Returns the entries matching all criteria in every mounted vault
+        (see PasswordManager.find).
+
+        Args:
+            criteria: Keyword arguments of PasswordManager.find, offset and limit
+                      applying to every vault.
+
+        Returns:
+            matches (list): (vault name, Entry) pairs, grouped by vault in mounted()
+                            order.
+
+        Raises:
+            InvalidEntryError: If a criterion is not valid.
+
+        """
+
+        results = self._fan_out(lambda manager: manager.find(**criteria))
+        return [(name, entry) for name, entries in results for entry in entries]
+
+    def close(self):
+        """Commits all changes of the mounted vaults and releases their storage.
+
+        Raises:
+            ConflictError: If some changes of a vault could not be saved because
+                           another process changed the same entries.
+
+        """
+
+        conflict = None
+        for name in self.mounted():
+            try:
+                self._vaults.pop(name).manager.close()
+            except ConflictError as e:
+                # the other vaults are closed all the same
+                conflict = conflict or e
+        if conflict is not None:
+            raise conflict
@@ -0,0 +1 @@
+"""Tests of the password manager, run with python -m pytest from the repository root."""
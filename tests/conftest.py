@@ -0,0 +1,28 @@
+"""Fixtures shared by the tests.
+
+The modules of the password manager import each other by name, as when run with
+python pw_manager/__main__.py, so their directory is put on the import path.
+
+"""
+
+import os
+import sys
+import pytest
+
+PACKAGE_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pw_manager"
+)
+sys.path.insert(0, PACKAGE_DIRECTORY)
+
+
+@pytest.fixture
+def kdf_params():
+    """scrypt parameters cheap enough to unlock a vault many times per test."""
+    return {"n": 2**10, "r": 8, "p": 1}
+
+
+@pytest.fixture
+def in_tmp_path(tmp_path, monkeypatch):
+    """Runs the test in an empty working directory."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,161 @@
+"""Tests of module agent."""
+
+import os
+import tempfile
+import threading
+import time
+import pytest
+from agent import Agent, AgentClient, AgentError, default_socket_path
+from manager import PasswordManager
+from pw_classes import PasswordDB
+from storage import JournalStorage
+from vaults import Catalog, VaultSet
+
+
+def connect(socket_path, timeout=5):
+    """Connects to the agent on socket_path once it is listening."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return AgentClient(socket_path)
+        except AgentError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+
+
+def start(agent):
+    """Runs agent in a thread, stored as agent.thread, until it is listening."""
+    agent.thread = threading.Thread(target=agent.run)
+    agent.thread.start()
+    connect(agent.socket_path).close()
+
+
+def stop(agent):
+    """Stops agent unless it has stopped already."""
+    if agent.thread.is_alive():
+        with AgentClient(agent.socket_path) as client:
+            client.request("stop")
+    agent.thread.join(5)
+    assert not agent.thread.is_alive()
+
+
+def test_socket_directory_must_be_private(tmp_path, monkeypatch):
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    directory = tmp_path / "pw_manager-{}".format(os.getuid())
+    assert default_socket_path() == str(directory / "pw_manager-agent.sock")
+    assert directory.stat().st_mode & 0o777 == 0o700
+    # a directory others can access, or a symlink, may have been created by another user
+    directory.chmod(0o755)
+    with pytest.raises(AgentError, match="only the current user"):
+        default_socket_path()
+    with pytest.raises(AgentError, match="only the current user"):
+        Agent(PasswordManager(PasswordDB()))
+    directory.rmdir()
+    (tmp_path / "elsewhere").mkdir(mode=0o700)
+    directory.symlink_to(tmp_path / "elsewhere")
+    with pytest.raises(AgentError, match="only the current user"):
+        AgentClient()
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path / "elsewhere"))
+    assert default_socket_path() == str(tmp_path / "elsewhere" / "pw_manager-agent.sock")
+
+
+@pytest.fixture
+def agent(tmp_path):
+    """Agent serving an in-memory database in a thread, stopped after the test."""
+    manager = PasswordManager(PasswordDB())
+    manager.add("www.example.com", "me", "secret")
+    agent = Agent(manager, str(tmp_path / "agent.sock"), idle_timeout=0)
+    start(agent)
+    yield agent
+    stop(agent)
+
+
+def test_requests(agent):
+    with connect(agent.socket_path) as client:
+        assert client.request("get", website="www.example.com")["password"] == "secret"
+        client.request("add", website="www.example.org", username="me", password="pw")
+        assert client.request("search", website="www.exampel.org")[0] == "www.example.org"
+        with pytest.raises(AgentError, match="No corresponding entry"):
+            client.request("get", website="www.missing.com")
+        with pytest.raises(AgentError, match="Unknown operation"):
+            client.request("format")
+
+
+def test_invalid_json(agent):
+    client = connect(agent.socket_path)
+    client._file.write(b"{not json\n")
+    client._file.flush()
+    assert b"not valid JSON" in client._file.readline()
+    client.close()
+
+
+def test_stop_while_another_client_is_connected(agent, capfd):
+    idle = connect(agent.socket_path)
+    idle.request("get", website="www.example.com")
+    with connect(agent.socket_path) as client:
+        assert client.request("stop") is None
+    agent.thread.join(5)
+    assert not agent.thread.is_alive()
+    # the connection of the idle client was closed by the agent
+    assert idle._file.readline() == b""
+    idle.close()
+    assert "Traceback" not in capfd.readouterr().err
+
+
+@pytest.fixture
+def vault_agent(in_tmp_path, kdf_params):
+    """Agent serving the default vault of a VaultSet with one more vault, 'work'."""
+    catalog = Catalog()
+    JournalStorage(catalog.add("work")).initialize("work-pw", kdf_params)
+    vaults = VaultSet(catalog)
+    manager = vaults.mount(
+        unlock=lambda vault: vault.storage.initialize("pw", kdf_params) or True
+    )
+    manager.add("www.example.com", "me", "secret")
+    agent = Agent(manager, str(in_tmp_path / "agent.sock"), idle_timeout=0, vaults=vaults)
+    start(agent)
+    yield agent
+    stop(agent)
+
+
+def test_mount_and_search_all_vaults(vault_agent):
+    with connect(vault_agent.socket_path) as client:
+        with pytest.raises(AgentError, match="Vault work is locked"):
+            client.request("get", vault="work", website="www.example.com")
+        with pytest.raises(AgentError, match="Vault work is locked"):
+            client.request("mount", vault="work", password="wrong")
+        client.request("mount", vault="work", password="work-pw")
+        client.request("add", vault="work", website="www.example.org", username="me")
+        assert client.request("vaults") == [
+            {"name": "default", "mounted": True},
+            {"name": "work", "mounted": True},
+        ]
+        assert client.request("search", website="www.example.org", all_vaults=True) == [
+            {"vault": "default", "website": "www.example.com"},
+            {"vault": "work", "website": "www.example.org"},
+        ]
+
+
+def test_slow_mount_does_not_stall_other_clients(vault_agent, monkeypatch):
+    unlock = JournalStorage.unlock
+
+    def slow_unlock(storage, password):
+        time.sleep(0.5)
+        return unlock(storage, password)
+
+    monkeypatch.setattr(JournalStorage, "unlock", slow_unlock)
+    mounting = threading.Thread(
+        target=lambda: connect(vault_agent.socket_path).request(
+            "mount", vault="work", password="work-pw"
+        )
+    )
+    mounting.start()
+    time.sleep(0.1)
+    with connect(vault_agent.socket_path) as client:
+        start_time = time.monotonic()
+        assert client.request("get", website="www.example.com")["password"] == "secret"
+        assert time.monotonic() - start_time < 0.2
+    mounting.join(5)
+    assert vault_agent.vaults.mounted() == ["default", "work"]
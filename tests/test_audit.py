@@ -0,0 +1,72 @@
+"""Tests of module audit."""
+
+import audit
+from audit import Finding, audit_entries, password_strength
+from breach import BreachCorpus, build_corpus
+from pw_classes import Entry
+
+NOW = 1700000000
+DAY = 86400
+
+
+def entry(website, password, age_days=0):
+    """Entry of user 'me' created age_days before NOW."""
+    return Entry.trusted(website, "me", password, NOW - age_days * DAY)
+
+
+def test_password_strength():
+    assert password_strength("") == 0
+    assert password_strength("aaaaaaaaaa") < password_strength("kq7#Vt2!mZ")
+    assert password_strength("abcdefgh") < 20
+    assert password_strength("123456789") < 20
+    # words of the wordlists count as one choice out of the wordlist
+    assert password_strength("aardvark") < password_strength("kzqxvwjy")
+
+
+def test_findings():
+    entries = [
+        entry("www.a.com", "Xq7#vT2!mZp9"),
+        entry("www.b.com", "password"),
+        entry("www.c.com", "Xq7#vT2!mZp9", age_days=400),
+        entry("www.d.com", "Xq7#vT2!mZp9"),
+        entry("www.e.com", None, age_days=400),
+    ]
+    findings = list(audit_entries(entries, now=NOW))
+    assert set(findings) == {
+        Finding("weak", "www.b.com", "me", round(password_strength("password"), 1)),
+        Finding("reused", "www.c.com", "me", ("www.a.com", "me")),
+        Finding("reused", "www.a.com", "me", ("www.c.com", "me")),
+        Finding("reused", "www.d.com", "me", ("www.a.com", "me")),
+        Finding("stale", "www.c.com", "me", 400),
+        Finding("stale", "www.e.com", "me", 400),
+    }
+    assert not list(audit_entries(entries[:2], max_age_days=None, min_bits=0, now=NOW))
+
+
+def test_breached_passwords(tmp_path):
+    path = str(tmp_path / "corpus.bin")
+    build_corpus(["Xq7#vT2!mZp9\n"], path)
+    with BreachCorpus(path) as corpus:
+        findings = list(
+            audit_entries(
+                [entry("www.a.com", "Xq7#vT2!mZp9"), entry("www.b.com", "kq7#Vt2!mZ3x")],
+                now=NOW,
+                corpus=corpus,
+            )
+        )
+    assert findings == [Finding("breached", "www.a.com", "me", None)]
+
+
+def test_process_pool_finds_the_same(monkeypatch):
+    monkeypatch.setattr(audit, "AUDIT_BATCH", 10)
+    entries = [
+        entry(
+            "www.site{}.com".format(i),
+            "abc{}".format(i % 30) if i % 3 else "Xq7#vT2!mZp{}".format(i),
+        )
+        for i in range(60)
+    ]
+    serial = list(audit_entries(entries, now=NOW))
+    parallel = list(audit_entries(entries, processes=2, now=NOW))
+    assert sorted(parallel) == sorted(serial)
+    assert {finding.kind for finding in serial} == {"weak", "reused"}
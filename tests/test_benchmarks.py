@@ -0,0 +1,59 @@
+"""Tests of the benchmark suite in benchmarks/bench_pw_manager.py."""
+
+import json
+import os
+import subprocess
+import sys
+
+BENCHMARK = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "benchmarks",
+    "bench_pw_manager.py",
+)
+
+
+def run_benchmark(*args):
+    """Runs the benchmark suite on tiny vaults and returns its stdout and stderr."""
+    result = subprocess.run(
+        [sys.executable, BENCHMARK, "--sizes", "30", "--ops", "10", "--repeat", "1"]
+        + list(args),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout, result.stderr
+
+
+def test_records():
+    stdout, _ = run_benchmark("--commits", "2")
+    lines = [json.loads(line) for line in stdout.splitlines()]
+    assert set(lines[0]) == {"python", "platform", "cpus", "time"}
+    records = lines[1:]
+    names = {record["benchmark"] for record in records}
+    assert {"database_build", "generate_random_pw", "storage_batch_commit"} <= names
+    for record in records:
+        if "bytes_per_entry" in record:
+            assert record["benchmark"].startswith("memory_")
+            assert record["bytes_per_entry"] > 0
+        else:
+            assert record["best_us"] <= record["mean_us"]
+    memory = {
+        record["benchmark"]: record["bytes_per_entry"]
+        for record in records
+        if "bytes_per_entry" in record
+    }
+    assert 0 < memory["memory_entries"] < memory["memory_database"]
+    assert {record["backend"] for record in records if "backend" in record} == {
+        "journal",
+        "pickle",
+        "sqlite",
+    }
+
+
+def test_baseline_comparison(tmp_path):
+    baseline = tmp_path / "before.jsonl"
+    stdout, _ = run_benchmark("--only", "generation")
+    baseline.write_text(stdout)
+    _, stderr = run_benchmark("--only", "generation", "--baseline", str(baseline))
+    assert "generate_random_pw" in stderr
+    assert "us -> " in stderr
@@ -0,0 +1,83 @@
+"""Tests of module breach."""
+
+import hashlib
+import os
+import subprocess
+import sys
+import pytest
+import breach
+from breach import BreachCorpus, build_corpus, format_from_line
+
+BREACHED = ["password", "123456", "letmein"]
+
+
+def sha1_line(password, count=1):
+    """Returns the line of password in a dump of SHA-1 hashes."""
+    return "{}:{}\n".format(hashlib.sha1(password.encode()).hexdigest().upper(), count)
+
+
+def test_plain_corpus(tmp_path):
+    path = str(tmp_path / "corpus.bin")
+    assert build_corpus([p + "\n" for p in BREACHED + ["password", ""]], path) == 3
+    with BreachCorpus(path) as corpus:
+        assert len(corpus) == 3
+        assert "letmein" in corpus
+        assert "correct horse" not in corpus
+        assert corpus.contains_many(["123456", "x", "password"]) == [True, False, True]
+
+
+def test_sha1_corpus_in_runs(tmp_path, monkeypatch):
+    # runs of 32 records, merged and written in blocks of 2
+    monkeypatch.setattr(breach, "BUILD_CHUNK", 32)
+    passwords = ["password{}".format(i) for i in range(100)]
+    lines = [sha1_line(p) for p in passwords + passwords[:10]]
+    assert format_from_line(lines[0]) == "sha1"
+    assert format_from_line("password\n") == "plain"
+    path = str(tmp_path / "corpus.bin")
+    assert build_corpus(lines, path, "sha1") == 100
+    with BreachCorpus(path) as corpus:
+        assert all(password in corpus for password in passwords)
+        assert "password100" not in corpus
+
+
+def test_undecodable_password(tmp_path):
+    # a latin-1 password in a dump read as utf-8 with errors='surrogateescape'
+    path = str(tmp_path / "corpus.bin")
+    build_corpus([b"caf\xe9\n".decode(errors="surrogateescape")], path)
+    with BreachCorpus(path) as corpus:
+        assert "café" not in corpus
+        assert b"caf\xe9".decode(errors="surrogateescape") in corpus
+
+
+@pytest.mark.parametrize("bad_line", ["not a hash", "5BAA61E4C9B93F3F", "XYZ" * 14])
+def test_malformed_sha1_line(tmp_path, bad_line):
+    path = tmp_path / "corpus.bin"
+    build_corpus([sha1_line("old")], str(path), "sha1")
+    lines = [sha1_line("password"), "\n", bad_line + "\n"]
+    with pytest.raises(ValueError, match="Line 3: .* is not a hexadecimal SHA-1 hash"):
+        build_corpus(lines, str(path), "sha1")
+    # the previous corpus is kept and no temporary files are left behind
+    assert os.listdir(tmp_path) == ["corpus.bin"]
+    with BreachCorpus(str(path)) as corpus:
+        assert "old" in corpus
+
+
+def test_build_corpus_command_reports_malformed_line(in_tmp_path):
+    (in_tmp_path / "dump.txt").write_text(sha1_line("password") + "oops\n")
+    result = subprocess.run(
+        [
+            sys.executable,
+            os.path.join(os.path.dirname(breach.__file__), "__main__.py"),
+            "--breach-corpus",
+            "corpus.bin",
+            "build-corpus",
+            "dump.txt",
+        ],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 1
+    assert result.stderr == (
+        "dump.txt: Line 2: 'oops' is not a hexadecimal SHA-1 hash\n"
+    )
+    assert not (in_tmp_path / "corpus.bin").exists()
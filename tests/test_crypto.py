@@ -0,0 +1,92 @@
+"""Tests of module crypto and of the encryption of stored vaults."""
+
+import sqlite3
+import pytest
+from crypto import SealedPassword, VaultCipher, create_key_record, unlock
+from storage import SQLiteStorage
+
+
+def test_key_record(kdf_params):
+    record, cipher = create_key_record("master", kdf_params)
+    assert unlock("wrong", record) is None
+    unlocked = unlock("master", record)
+    assert unlocked.open(cipher.seal(b"data", b"aad"), b"aad") == b"data"
+
+
+def test_seal_is_authenticated(kdf_params):
+    _, cipher = create_key_record("master", kdf_params)
+    blob = cipher.seal(b"data", b"row 1")
+    with pytest.raises(ValueError):
+        cipher.open(blob, b"row 2")
+    with pytest.raises(ValueError):
+        cipher.open(blob[:-1] + bytes([blob[-1] ^ 1]), b"row 1")
+    sealed = SealedPassword.seal(cipher, "secret", b"row 1")
+    assert sealed.reveal() == "secret"
+    with pytest.raises(ValueError):
+        SealedPassword(cipher, sealed.blob).reveal()
+
+
+def test_known_answer():
+    # AES-256-GCM test case 16 of the GCM specification (McGrew and Viega)
+    key = bytes.fromhex("feffe9928665731c6d6a8f9467308308" * 2)
+    nonce = bytes.fromhex("cafebabefacedbaddecaf888")
+    aad = bytes.fromhex("feedfacedeadbeeffeedfacedeadbeefabaddad2")
+    plaintext = bytes.fromhex(
+        "d9313225f88406e5a55909c5aff5269a86a7a9531534f7da2e4c303d8a318a72"
+        "1c3c0c95956809532fcf0e2449a6b525b16aedf5aa0de657ba637b39"
+    )
+    ciphertext = bytes.fromhex(
+        "522dc1f099567d07f47f37a32a84427d643a8cdcbfe5c0c97598a2bd2555d1aa"
+        "8cb08e48590dbb3da7b08b1056828838c5f61e6393ba7a0abcc9f662"
+    )
+    tag = bytes.fromhex("76fc6ece0f4e1768cddf8853bb2d551b")
+    cipher = VaultCipher(key + bytes(32))
+    assert cipher.open(nonce + ciphertext + tag, aad) == plaintext
+    blob = cipher.seal(plaintext, aad)
+    assert len(blob) == len(nonce + ciphertext + tag)
+    assert cipher.open(blob, aad) == plaintext
+
+
+@pytest.fixture
+def sqlite_vault(tmp_path, kdf_params):
+    """Path of an SQLite vault with the master password 'pw' and two entries."""
+    path = str(tmp_path / "vault.sqlite")
+    storage = SQLiteStorage(path)
+    storage.initialize("pw", kdf_params)
+    pw_db = storage.load()
+    pw_db.apply_change("add", "www.a.com", "me", "password a", 1)
+    pw_db.apply_change("add", "www.b.com", "me", "password b", 1)
+    storage.close(pw_db)
+    return path
+
+
+def load(path):
+    """Unlocks and loads the SQLite vault at path."""
+    storage = SQLiteStorage(path)
+    assert storage.unlock("pw")
+    return storage, storage.load()
+
+
+def test_passwords_cannot_be_swapped_between_rows(sqlite_vault):
+    connection = sqlite3.connect(sqlite_vault)
+    (first, a), (second, b) = connection.execute(
+        "SELECT id, password FROM sealed_entries ORDER BY id"
+    ).fetchall()
+    connection.execute("UPDATE sealed_entries SET password = ? WHERE id = ?", (b, first))
+    connection.execute("UPDATE sealed_entries SET password = ? WHERE id = ?", (a, second))
+    connection.commit()
+    connection.close()
+    _, pw_db = load(sqlite_vault)
+    with pytest.raises(ValueError):
+        pw_db.get_entry("www.a.com", "me").password
+
+
+def test_renamed_entry_keeps_its_password(sqlite_vault):
+    storage, pw_db = load(sqlite_vault)
+    entry = pw_db.get_entry("www.a.com", "me")
+    pw_db.update_entry(entry, "w", "www.c.com")
+    storage.close(pw_db)
+    del entry, pw_db
+    _, pw_db = load(sqlite_vault)
+    assert pw_db.get_entry("www.c.com", "me").password == "password a"
+    assert pw_db.get_entry("www.c.com", "me").version(1).password == "password a"
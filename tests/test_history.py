@@ -0,0 +1,103 @@
+"""Tests of the history of earlier versions of entries (Entry, PasswordDB.rollback_entry)."""
+
+import pytest
+from exceptions import ConflictError, DuplicateEntryError, EntryNotFoundError
+from manager import PasswordManager
+from pw_classes import HISTORY_LIMIT, Entry, PasswordDB
+from storage import JournalStorage, PickleStorage, SQLiteStorage
+
+
+def test_history_is_bounded():
+    pw_db = PasswordDB()
+    entry = Entry("www.example.com", "me", "p0")
+    pw_db.add_entry(entry)
+    for i in range(1, HISTORY_LIMIT + 5):
+        pw_db.update_entry(entry, "p", "p{}".format(i), created_at=i)
+    assert entry.history_length() == HISTORY_LIMIT
+    assert entry.version(1).password == "p{}".format(HISTORY_LIMIT + 3)
+    assert entry.version(HISTORY_LIMIT).password == "p4"
+    with pytest.raises(EntryNotFoundError):
+        entry.version(HISTORY_LIMIT + 1)
+
+
+def test_rollback_keeps_the_replaced_version():
+    pw_db = PasswordDB()
+    entry = Entry("www.example.com", "me", "p1")
+    pw_db.add_entry(entry)
+    pw_db.update_entry(entry, "u", "you")
+    pw_db.update_entry(entry, "p", "p2")
+    pw_db.rollback_entry(entry, 2)
+    assert (entry.username, entry.password) == ("me", "p1")
+    assert pw_db.get_entry("www.example.com", "me") is entry
+    assert pw_db.get_entry("www.example.com", "you") is None
+    pw_db.rollback_entry(entry, 1)
+    assert (entry.username, entry.password) == ("you", "p2")
+
+
+def test_rollback_to_a_listed_combination():
+    pw_db = PasswordDB()
+    entry = Entry("www.example.com", "me", "p1")
+    pw_db.add_entry(entry)
+    pw_db.update_entry(entry, "u", "you")
+    pw_db.add_entry(Entry("www.example.com", "me", "other"))
+    with pytest.raises(DuplicateEntryError):
+        pw_db.rollback_entry(entry, 1)
+    assert entry.username == "you"
+
+
+@pytest.mark.parametrize("backend", [JournalStorage, PickleStorage, SQLiteStorage])
+def test_history_is_persisted(tmp_path, kdf_params, backend):
+    storage = backend(str(tmp_path / "vault"))
+    storage.initialize("pw", kdf_params)
+    manager = PasswordManager(storage.load(), storage)
+    manager.add("www.example.com", "me", "p1")
+    manager.update("www.example.com", "me", "p", "p2")
+    manager.update("www.example.com", "me", "p", "p3")
+    manager.rollback("www.example.com", "me", 2)
+    manager.close()
+    storage = backend(str(tmp_path / "vault"))
+    assert storage.unlock("pw")
+    entry = storage.load().get_entry("www.example.com", "me")
+    assert entry.password == "p1"
+    assert [version.password for version in entry.history] == ["p3", "p2", "p1"]
+
+
+def open_manager(backend, path):
+    """PasswordManager of a process of its own on the storage at path."""
+    storage = backend(path)
+    assert storage.unlock("pw")
+    return PasswordManager(storage.load(), storage)
+
+
+@pytest.mark.parametrize("backend", [JournalStorage, PickleStorage])
+def test_rollback_merged_onto_a_newer_version(tmp_path, kdf_params, backend):
+    path = str(tmp_path / "vault")
+    backend(path).initialize("pw", kdf_params)
+    first = open_manager(backend, path)
+    first.add("www.example.com", "me", "p1")
+    first.update("www.example.com", "me", "p", "p2")
+    second = open_manager(backend, path)
+    second.update("www.example.com", "me", "p", "p3")
+    # restores p1, which is version 2 in the history stored by the second process
+    first.rollback("www.example.com", "me", 1)
+    assert first.get("www.example.com", "me").password == "p1"
+    stored = open_manager(backend, path).get("www.example.com", "me")
+    assert stored.password == "p1"
+    assert [version.password for version in stored.history][:2] == ["p3", "p2"]
+
+
+@pytest.mark.parametrize("backend", [JournalStorage, PickleStorage])
+def test_rollback_to_a_version_no_longer_stored_conflicts(
+    tmp_path, kdf_params, backend
+):
+    path = str(tmp_path / "vault")
+    backend(path).initialize("pw", kdf_params)
+    first = open_manager(backend, path)
+    first.add("www.example.com", "me", "p1")
+    first.update("www.example.com", "me", "p", "p2")
+    second = open_manager(backend, path)
+    second.remove("www.example.com", "me")
+    second.add("www.example.com", "me", "new")
+    with pytest.raises(ConflictError):
+        first.rollback("www.example.com", "me", 1)
+    assert open_manager(backend, path).get("www.example.com", "me").password == "new"
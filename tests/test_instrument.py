@@ -0,0 +1,87 @@
+"""Tests of module instrument.
+
+Instrumentation cannot be turned off once enabled, so it is tested in new interpreters.
+
+"""
+
+import json
+import os
+import subprocess
+import sys
+import instrument
+from instrument import observe, summary, timed
+
+PACKAGE_DIRECTORY = os.path.dirname(instrument.__file__)
+# Operations of a PasswordManager, printed as JSON with the statistics collected
+OPERATIONS = """
+import json, sys
+import instrument
+from manager import PasswordManager
+from pw_classes import Entry, PasswordDB
+add_entry = PasswordDB.add_entry
+{enable}
+manager = PasswordManager(PasswordDB())
+add_entry(PasswordDB(), Entry("www.example.org", "me"))
+for i in range(20):
+    manager.add("www.example{{}}.com".format(i), "me")
+    manager.get("www.example{{}}.com".format(i))
+manager.generate_password()
+print(json.dumps(instrument.summary()))
+"""
+
+
+def run_operations(enable="", **environment):
+    """Runs OPERATIONS in a new interpreter and returns its statistics and stderr."""
+    result = subprocess.run(
+        [sys.executable, "-c", OPERATIONS.format(enable=enable)],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=PACKAGE_DIRECTORY,
+        env=dict(os.environ, **environment),
+    )
+    return json.loads(result.stdout), result.stderr
+
+
+def test_disabled_by_default():
+    def operation(value):
+        return value
+
+    assert not instrument.is_enabled()
+    wrapper = timed("operation")(operation)
+    assert wrapper(3) == 3 and wrapper.__wrapped__ is operation
+    observe("operation.retries", 3)
+    assert summary() == {}
+
+
+def test_enabled_by_environment():
+    stats, stderr = run_operations(PW_MANAGER_STATS="1")
+    assert stats["PasswordDB.add_entry"]["count"] == 21
+    assert stats["PasswordDB.select_entry"]["count"] == 20
+    assert stats["generate_password.retries"] == {
+        "count": 1,
+        "unit": "",
+        "total": 0,
+        "mean": 0,
+        "p50": 0,
+        "p99": 0,
+        "max": 0,
+    }
+    add = stats["PasswordDB.add_entry"]
+    assert add["unit"] == "us"
+    assert 0 < add["p50"] <= add["p99"] and add["mean"] <= add["max"]
+    # the summary printed on exit
+    assert stderr.split()[:3] == ["operation", "count", "unit"]
+    assert any(line.startswith("PasswordDB.add_entry ") for line in stderr.splitlines())
+
+
+def test_enabled_after_import(tmp_path):
+    profile = tmp_path / "run.prof"
+    stats, _ = run_operations(
+        enable="instrument.enable({!r})".format(str(profile)),
+        PW_MANAGER_STATS="",
+    )
+    # functions referenced before enable() are timed as well
+    assert stats["generate_random_pw"]["count"] == 1
+    assert stats["PasswordDB.add_entry"]["count"] == 21
+    assert profile.stat().st_size > 0
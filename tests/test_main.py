@@ -0,0 +1,58 @@
+"""Tests of the command line entry point, pw_manager/__main__.py."""
+
+import json
+import os
+import subprocess
+import sys
+import breach
+
+MAIN = os.path.join(os.path.dirname(breach.__file__), "__main__.py")
+# Modules only needed once a menu, agent, audit, generation or SQLite vault is used
+DEFERRED = (
+    "agent",
+    "asyncio",
+    "audit",
+    "concurrent.futures",
+    "manager",
+    "menu_class",
+    "random_password",
+    "sqlite3",
+)
+
+
+def run_python(code):
+    """Runs code in a new interpreter with the password manager importable."""
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(MAIN),
+        stdin=subprocess.DEVNULL,
+    ).stdout
+
+
+def test_import_does_no_work():
+    # without a prompt, input from /dev/null would end the run with an error
+    loaded = json.loads(
+        run_python(
+            "import json, runpy, sys\n"
+            "runpy.run_path({!r}, run_name='pw_main')\n"
+            "print(json.dumps(sorted(sys.modules)))".format(MAIN)
+        )
+    )
+    assert not set(DEFERRED) & set(loaded)
+
+
+def test_help_loads_nothing_deferred(tmp_path):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", MAIN, "--help"],
+        capture_output=True,
+        text=True,
+        cwd=str(tmp_path),
+    )
+    assert result.returncode == 0
+    assert "build-corpus" in result.stdout
+    imported = {line.split("|")[-1].strip() for line in result.stderr.splitlines()}
+    assert not set(DEFERRED) & imported
+    assert os.listdir(str(tmp_path)) == []
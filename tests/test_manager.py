@@ -0,0 +1,126 @@
+"""Tests of module manager."""
+
+import pytest
+from exceptions import (
+    DuplicateEntryError,
+    EntryNotFoundError,
+    InvalidEntryError,
+    PasswordRulesError,
+)
+from manager import PasswordManager
+from menu_class import sleep
+from pw_classes import Entry, PasswordDB
+from storage import JournalStorage
+
+
+@pytest.fixture
+def manager():
+    """PasswordManager of an in-memory database with one entry."""
+    manager = PasswordManager(PasswordDB())
+    manager.add("www.example.com", "me", "secret")
+    return manager
+
+
+def test_results_and_typed_errors(manager, capsys):
+    assert manager.get("https://example.com/login").password == "secret"
+    with pytest.raises(EntryNotFoundError):
+        manager.get("www.example.org")
+    with pytest.raises(DuplicateEntryError):
+        manager.add("www.example.com", "me")
+    with pytest.raises(InvalidEntryError, match="Not a valid website"):
+        manager.add("example", "me")
+    with pytest.raises(PasswordRulesError):
+        manager.generate_password(3, 3)
+    assert manager.remove("www.example.com", "me").username == "me"
+    assert len(manager) == 0
+    assert capsys.readouterr() == ("", "")
+
+
+@pytest.mark.parametrize("value", [None, 42, b"secret", ["secret"]])
+def test_update_rejects_values_that_are_not_strings(manager, value):
+    with pytest.raises(InvalidEntryError, match="Value must be a string, not "):
+        manager.update("www.example.com", "me", "p", value)
+    with pytest.raises(InvalidEntryError, match="Value must be a string, not "):
+        with manager.batch() as batch:
+            batch.update_entry(manager.get("www.example.com"), "p", value)
+    assert manager.get("www.example.com").password == "secret"
+
+
+def test_update(manager):
+    with pytest.raises(InvalidEntryError, match="Value must not be blank"):
+        manager.update("www.example.com", "me", "u", "  ")
+    with pytest.raises(InvalidEntryError, match="Field must be one of"):
+        manager.update("www.example.com", "me", "x", "value")
+    entry = manager.update("www.example.com", "me", "u", "you")
+    assert manager.get("www.example.com", "you") is entry
+
+
+def test_find(manager):
+    manager.add("https://login.example.com", "you")
+    manager.add("www.example.org", "me")
+    assert [e.website for e in manager.find(username="me")] == [
+        "www.example.com",
+        "www.example.org",
+    ]
+    assert [e.username for e in manager.find(domain="example.com")] == ["me", "you"]
+    assert len(manager.find(since=0, offset=1, limit=1)) == 1
+    assert manager.find(username="me", domain="example.com", offset=1) == []
+    with pytest.raises(InvalidEntryError):
+        manager.find(since="yesterday")
+    with pytest.raises(InvalidEntryError):
+        manager.find(username=42)
+    with pytest.raises(InvalidEntryError):
+        manager.find(limit=-1)
+
+
+def test_batch_is_saved_once(manager, monkeypatch):
+    saves = []
+    monkeypatch.setattr(manager, "save", lambda: saves.append(True))
+    with manager.batch() as batch:
+        for i in range(5):
+            batch.add_entry(Entry("www.site{}.com".format(i), "me"))
+    assert len(manager) == 6
+    assert saves == [True]
+    with pytest.raises(DuplicateEntryError):
+        with manager.batch() as batch:
+            batch.remove_entry(manager.get("www.site0.com"))
+            batch.add_entry(Entry("www.site1.com", "me"))
+    with manager.batch():
+        pass
+    assert len(manager) == 6
+    assert saves == [True]
+
+
+def test_autosave(in_tmp_path, kdf_params):
+    storage = JournalStorage()
+    storage.initialize("pw", kdf_params)
+    pw_db = storage.load()
+    PasswordManager(pw_db, storage).add("www.example.com", "me", "secret")
+    unsaved = PasswordManager(pw_db, storage, autosave=False)
+    unsaved.add("www.example.org", "me")
+    reopened = JournalStorage()
+    reopened.unlock("pw")
+    assert [e.website for e in reopened.load()] == ["www.example.com"]
+    unsaved.close()
+    reopened = JournalStorage()
+    reopened.unlock("pw")
+    assert len(reopened.load()) == 2
+
+
+def test_sleep_calls_once_and_returns_the_result():
+    calls = []
+    pauses = []
+
+    class Shown:
+        def _pause(self):
+            pauses.append(True)
+
+        @sleep
+        def show(self, result):
+            calls.append(result)
+            return result
+
+    assert Shown().show(None) is None
+    assert Shown().show("message") == "message"
+    assert calls == [None, "message"]
+    assert pauses == [True]
@@ -0,0 +1,57 @@
+"""Tests of module menu_class."""
+
+import pytest
+from manager import PasswordManager
+from menu_class import Menu
+from pw_classes import Entry, PasswordDB
+
+
+@pytest.fixture
+def menu():
+    """Menu of three entries, added in a different order than they were created."""
+    pw_db = PasswordDB()
+    for website, created_at in (
+        ("www.b.com", 2000),
+        ("www.c.com", 1000),
+        ("www.a.com", 3000),
+    ):
+        pw_db.add_entry(Entry.trusted(website, "me", None, created_at))
+    return Menu(PasswordManager(pw_db), delay=0)
+
+
+def browse(monkeypatch, capsys, show, choices):
+    """Calls show with the menu choices and B, returns the last page and the options below it."""
+    choices = iter(choices + ["B"])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(choices))
+    show()
+    return capsys.readouterr().out.split("\nShowing")[-2:]
+
+
+def websites(lines):
+    """Returns the websites of the entries among lines."""
+    return [line.split()[0] for line in lines if " with username " in line]
+
+
+def test_sort_entries(menu, monkeypatch, capsys):
+    def view(choices):
+        page, _ = browse(monkeypatch, capsys, menu._view_all, choices)
+        return websites(page.splitlines())
+
+    assert view([]) == ["www.b.com", "www.c.com", "www.a.com"]
+    assert view(["S"]) == ["www.a.com", "www.b.com", "www.c.com"]
+    assert view(["D"]) == ["www.c.com", "www.b.com", "www.a.com"]
+    assert view(["D", "U"]) == ["www.b.com", "www.c.com", "www.a.com"]
+
+
+def test_sort_options(menu, monkeypatch, capsys):
+    def options(show, choices):
+        return browse(monkeypatch, capsys, show, choices)[1]
+
+    assert "D: sort by date added" in options(menu._view_all, [])
+    assert "D: sort by date added" not in options(menu._view_all, ["D"])
+    assert "U: unsorted" in options(menu._view_all, ["D"])
+    website_options = options(
+        lambda: menu._browse(menu._show_websites, menu.manager.count_websites()), []
+    )
+    assert "S: sort by website" in website_options
+    assert "date added" not in website_options
@@ -0,0 +1,331 @@
+"""Tests of module pw_classes."""
+
+import pickle
+import pytest
+from exceptions import DuplicateEntryError, EntryNotFoundError
+from pw_classes import (
+    Entry,
+    PasswordDB,
+    Query,
+    format_timestamp,
+    normalize_website,
+    parse_timestamp,
+)
+
+
+@pytest.fixture
+def pw_db():
+    """Database of three entries of two websites."""
+    return PasswordDB(
+        [
+            Entry("www.b.com", "me", "pw1"),
+            Entry("www.a.com", "you", "pw2"),
+            Entry("www.b.com", "admin", "pw3"),
+        ]
+    )
+
+
+def test_lookup(pw_db):
+    assert pw_db.get_entry("www.b.com", "admin").password == "pw3"
+    assert pw_db.get_entry("www.b.com", "you") is None
+    assert pw_db.select_entry("www.b.com").username == "me"
+    assert pw_db.count_websites() == 2
+    with pytest.raises(DuplicateEntryError):
+        pw_db.add_entry(Entry("www.a.com", "you"))
+    assert pw_db.add_entries(
+        [Entry("www.a.com", "you"), Entry("www.c.com", "me")]
+    ) == 1
+    assert len(pw_db) == 4
+
+
+def test_indexes_follow_changes(pw_db):
+    assert [e.username for e in pw_db.iter_entries(sort_by="website")] == [
+        "you",
+        "admin",
+        "me",
+    ]
+    assert list(pw_db.iter_websites(sort_by="website")) == ["www.a.com", "www.b.com"]
+    entry = pw_db.get_entry("www.a.com", "you")
+    pw_db.update_entry(entry, "w", "www.c.com")
+    assert pw_db.get_entry("www.a.com", "you") is None
+    assert pw_db.get_entry("www.c.com", "you") is entry
+    with pytest.raises(DuplicateEntryError):
+        pw_db.update_entry(pw_db.get_entry("www.b.com", "me"), "u", "admin")
+    pw_db.remove_entry(pw_db.get_entry("www.b.com", "me"))
+    with pytest.raises(EntryNotFoundError):
+        pw_db.remove_entry(Entry("www.b.com", "admin"))
+    assert [e.username for e in pw_db.iter_entries(sort_by="website")] == [
+        "admin",
+        "you",
+    ]
+    assert list(pw_db.iter_websites(sort_by="website")) == ["www.b.com", "www.c.com"]
+    assert [e.username for e in pw_db] == ["admin", "you"]
+
+
+def test_pages(pw_db):
+    assert [e.password for e in pw_db.iter_entries(1, 1)] == ["pw2"]
+    assert [e.password for e in pw_db.iter_entries(1, 5, "website")] == ["pw3", "pw1"]
+    assert list(pw_db.iter_websites(1)) == ["www.a.com"]
+    with pytest.raises(ValueError):
+        pw_db.iter_entries(sort_by="password")
+
+
+def test_pickle_rebuilds_indexes(pw_db):
+    copy = pickle.loads(pickle.dumps(pw_db))
+    assert copy.get_entry("www.b.com", "admin").password == "pw3"
+    assert copy.count_websites() == 2
+    assert [e.username for e in copy] == ["me", "you", "admin"]
+
+
+# PasswordDB pickled by the first version after update_entry gave the second of its
+# entries the website and username of the first
+BASELINE_PICKLE = (
+    b"\x80\x04\x95\xbe\x00\x00\x00\x00\x00\x00\x00\x8c\npw_classes\x94\x8c\nPassword"
+    b"DB\x94\x93\x94)\x81\x94}\x94\x8c\x07entries\x94]\x94(h\x00\x8c\x05Entry\x94"
+    b"\x93\x94)\x81\x94}\x94(\x8c\t_password\x94\x8c\x02p1\x94\x8c\ncreated_at\x94"
+    b"\x8c\x1301.02.2021 10:00:00\x94\x8c\x08_website\x94\x8c\twww.a.com\x94\x8c\x08"
+    b"username\x94\x8c\x02me\x94ubh\x08)\x81\x94}\x94(h\x0b\x8c\x02p2\x94h\rh\x0eh"
+    b"\x0fh\x10h\x11h\x12ubesb."
+)
+
+
+def test_duplicates_of_earlier_versions_are_kept():
+    with pytest.warns(UserWarning, match="www.a.com with username me is listed twice"):
+        pw_db = pickle.loads(BASELINE_PICKLE)
+    assert [(e.username, e.password) for e in pw_db] == [
+        ("me", "p1"),
+        ("me (duplicate 2)", "p2"),
+    ]
+    with pytest.warns(UserWarning, match="kept with username me \\(duplicate 3\\)"):
+        PasswordDB(list(pw_db) + [Entry("www.a.com", "me", "p3")])
+
+
+def test_suggestions():
+    websites = ("www.github.com", "www.gitlab.com", "www.google.com", "mail.zoho.eu")
+    pw_db = PasswordDB([Entry(website, "me") for website in websites])
+    assert pw_db.suggest_websites("www.githbu.com", 2) == [
+        "www.github.com",
+        "www.gitlab.com",
+    ]
+    assert pw_db.suggest_websites("zoho.eu", 1) == ["mail.zoho.eu"]
+    assert pw_db.suggest_websites("qqqq") == []
+    # the trigram index follows changes once it is built
+    gitlab = pw_db.get_entry("www.gitlab.com", "me")
+    pw_db.update_entry(gitlab, "w", "www.bitbucket.org")
+    assert pw_db.suggest_websites("www.gitlab.com", 1) == ["www.github.com"]
+    assert pw_db.suggest_websites("bitbuckt.org", 1) == ["www.bitbucket.org"]
+    pw_db.remove_entry(pw_db.get_entry("www.bitbucket.org", "me"))
+    assert pw_db.suggest_websites("bitbuckt.org", 1) != ["www.bitbucket.org"]
+
+
+def test_compact_entries():
+    entry = Entry("www.example.com", "me", "pw")
+    assert not hasattr(entry, "__dict__")
+    assert isinstance(entry.created_at, int)
+    with pytest.raises(AttributeError):
+        entry.notes = "no attributes beyond the slots"
+    copy = pickle.loads(pickle.dumps(entry))
+    assert (copy.website, copy.username, copy.password, copy.created_at) == (
+        "www.example.com",
+        "me",
+        "pw",
+        entry.created_at,
+    )
+
+
+def test_timestamps():
+    timestamp = parse_timestamp("24.12.2021 18:30:00")
+    assert format_timestamp(timestamp) == "24.12.2021 18:30:00"
+    assert parse_timestamp(timestamp) == timestamp
+    with pytest.raises(ValueError, match="created_at is not in"):
+        parse_timestamp("2021-12-24")
+    # entries pickled by earlier versions as an attribute dict with a formatted date
+    entry = Entry.__new__(Entry)
+    entry.__setstate__(
+        {
+            "_website": "www.example.com",
+            "username": "me",
+            "_password": "pw",
+            "created_at": "24.12.2021 18:30:00",
+        }
+    )
+    assert (entry.password, entry.created_at, entry.history) == ("pw", timestamp, [])
+
+
+@pytest.mark.parametrize(
+    "website, host",
+    [
+        ("https://www.Example.com:443/login", "example.com"),
+        ("http://user@mail.example.co.uk./inbox?x=1", "mail.example.co.uk"),
+        ("www.example.com", "example.com"),
+        ("EXAMPLE.com", "example.com"),
+    ],
+)
+def test_normalize_website(website, host):
+    assert normalize_website(website) == host
+
+
+def test_domain_lookup():
+    pw_db = PasswordDB(
+        [
+            Entry("https://example.com", "me", "parent"),
+            Entry("https://login.example.com", "me", "sub"),
+            Entry("https://deep.login.example.com", "you", "deep"),
+            Entry("www.other.com", "me", "other"),
+        ]
+    )
+    assert pw_db.select_entry("http://WWW.EXAMPLE.COM/path").password == "parent"
+    assert pw_db.select_entry("a.b.login.example.com").password == "sub"
+    assert pw_db.select_entry("www.deep.login.example.com", "me").password == "sub"
+    assert pw_db.select_entry("login.example.com", parents=False).password == "sub"
+    assert pw_db.select_entry("x.example.com", parents=False) is None
+    assert pw_db.select_entry("com") is None
+    assert pw_db.find_websites("example.com") == [
+        "https://example.com",
+        "https://login.example.com",
+        "https://deep.login.example.com",
+    ]
+    assert pw_db.find_websites("deep.login.example.com", subdomains=False) == [
+        "https://deep.login.example.com",
+        "https://login.example.com",
+        "https://example.com",
+    ]
+    # the domain index follows changes once it is built
+    pw_db.remove_entry(pw_db.get_entry("https://login.example.com", "me"))
+    pw_db.add_entry(Entry("https://login.other.com", "me"))
+    assert pw_db.find_websites("login.example.com") == [
+        "https://example.com",
+        "https://deep.login.example.com",
+    ]
+    assert pw_db.find_websites("other.com", parents=False) == [
+        "www.other.com",
+        "https://login.other.com",
+    ]
+
+
+@pytest.fixture
+def dated_db():
+    """Database of entries created a day apart, the newest first."""
+    day = 86400
+    return PasswordDB(
+        [
+            Entry.trusted("www.a.com", "me", "pw", 1700000000 + 3 * day),
+            Entry.trusted("login.b.com", "you", "pw", 1700000000 + 2 * day),
+            Entry.trusted("www.b.com", "me", "pw", 1700000000 + day),
+            Entry.trusted("www.c.com", "me", "pw", 1700000000),
+        ]
+    )
+
+
+def websites(entries):
+    """Websites of entries, in order."""
+    return [entry.website for entry in entries]
+
+
+def test_query(dated_db):
+    since = format_timestamp(1700000000 + 86400)
+    assert websites(dated_db.query(username="me")) == [
+        "www.a.com",
+        "www.b.com",
+        "www.c.com",
+    ]
+    # the time index yields entries in chronological order
+    assert websites(dated_db.query(since=since)) == [
+        "www.b.com",
+        "login.b.com",
+        "www.a.com",
+    ]
+    assert websites(dated_db.query(before=since)) == ["www.c.com"]
+    assert websites(dated_db.query(domain="b.com")) == ["www.b.com", "login.b.com"]
+    assert websites(dated_db.query(username="me", domain="b.com")) == ["www.b.com"]
+    query = Query(username="me")
+    assert websites(
+        dated_db.query(query, since=since, where=lambda e: "a" in e.website)
+    ) == ["www.a.com"]
+    assert list(dated_db.query(Query(username="me") & Query(username="you"))) == []
+    assert len(list(dated_db.query())) == 4
+    with pytest.raises(ValueError):
+        dated_db.query(since="yesterday")
+
+
+def test_query_indexes_follow_changes(dated_db):
+    since = 1700000000 + 2 * 86400
+    assert websites(dated_db.query(username="you")) == ["login.b.com"]
+    assert websites(dated_db.query(since=since)) == ["login.b.com", "www.a.com"]
+    dated_db.update_entry(dated_db.get_entry("www.c.com", "me"), "u", "you")
+    dated_db.update_entry(
+        dated_db.get_entry("www.b.com", "me"), "p", "new", created_at=since + 1
+    )
+    dated_db.remove_entry(dated_db.get_entry("www.a.com", "me"))
+    dated_db.add_entry(Entry.trusted("www.d.com", "you", "pw", since - 1))
+    assert websites(dated_db.query(username="you")) == [
+        "login.b.com",
+        "www.c.com",
+        "www.d.com",
+    ]
+    assert websites(dated_db.query(username="me")) == ["www.b.com"]
+    assert websites(dated_db.query(since=since)) == ["login.b.com", "www.b.com"]
+    assert websites(dated_db.iter_entries(sort_by="created_at")) == [
+        "www.c.com",
+        "www.d.com",
+        "login.b.com",
+        "www.b.com",
+    ]
+
+
+def test_batch(pw_db):
+    records = []
+    pw_db.add_listener(lambda op, *args: records.append(op))
+    with pw_db.batch() as batch:
+        batch.update_entry(pw_db.get_entry("www.b.com", "me"), "u", "old")
+        # the combination freed by the update can be taken within the batch
+        batch.add_entry(Entry("www.b.com", "me", "new"))
+        with pytest.raises(DuplicateEntryError):
+            batch.add_entry(Entry("www.b.com", "old"))
+        batch.remove_entry(pw_db.get_entry("www.a.com", "you"))
+        assert batch.get_entry("www.a.com", "you") is None
+        assert len(batch) == 3
+        # nothing is applied before the batch is committed
+        assert pw_db.get_entry("www.b.com", "me").password == "pw1"
+        assert records == []
+    assert records == ["update", "add", "remove"]
+    assert pw_db.get_entry("www.b.com", "old").password == "pw1"
+    assert pw_db.get_entry("www.b.com", "me").password == "new"
+    assert len(pw_db) == 3
+    with pytest.raises(ValueError):
+        batch.add_entry(Entry("www.c.com", "me"))
+
+
+def test_batch_is_discarded_on_error(pw_db):
+    with pytest.raises(EntryNotFoundError):
+        with pw_db.batch() as batch:
+            batch.add_entry(Entry("www.c.com", "me"))
+            batch.remove_entry(Entry("www.a.com", "you"))
+    assert pw_db.get_entry("www.c.com", "me") is None
+    assert len(pw_db) == 3
+
+
+def test_failed_commit_rolls_back_applied_changes(pw_db):
+    records = []
+    pw_db.add_listener(lambda op, *args: records.append(op))
+    entries = list(pw_db)
+    assert pw_db.find_websites("b.com") == ["www.b.com"]
+    entry = pw_db.get_entry("www.a.com", "you")
+    batch = pw_db.batch()
+    batch.update_entry(entry, "p", "changed")
+    batch.update_entry(pw_db.get_entry("www.b.com", "admin"), "w", "www.d.com")
+    batch.remove_entry(pw_db.get_entry("www.b.com", "me"))
+    batch.add_entry(Entry("www.c.com", "me"))
+    # a change made after staging makes the last change fail
+    added = Entry("www.c.com", "me")
+    pw_db.add_entry(added)
+    with pytest.raises(DuplicateEntryError):
+        batch.commit()
+    assert entry.password == "pw2" and entry.history_length() == 0
+    # the same entries are back in place
+    assert list(pw_db) == entries + [added]
+    assert all(pw_db.get_entry(e.website, e.username) is e for e in entries)
+    assert entries[2].website == "www.b.com"
+    assert pw_db.find_websites("b.com") == ["www.b.com"]
+    assert pw_db.find_websites("d.com") == []
+    assert records == ["add"]
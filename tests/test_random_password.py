@@ -0,0 +1,195 @@
+"""Tests of module random_password."""
+
+import gzip
+import json
+import string
+import pytest
+import random_password
+from breach import BreachCorpus, build_corpus
+from exceptions import PasswordRulesError
+from manager import PasswordManager
+from pw_classes import PasswordDB
+from random_password import (
+    BufferedSystemRandom,
+    MappedWordIndex,
+    MappedWordlist,
+    WordIndex,
+    compile_wordlist,
+    generate_random_pw,
+    generate_random_pws,
+    load_pw_components,
+    word_index,
+)
+
+WORDS = ["zebra", "quokka", "yak", "émeu"]
+
+
+def split_word(password):
+    """Returns the letters of a generated password, i.e. its word."""
+    return "".join(c for c in password if c not in string.digits + string.punctuation)
+
+
+@pytest.fixture
+def compiled(tmp_path):
+    """Path of a compiled wordlist of WORDS."""
+    path = str(tmp_path / "words.bin")
+    compile_wordlist(WORDS, path)
+    return path
+
+
+def test_mapped_wordlist(compiled):
+    words = MappedWordlist(compiled)
+    assert len(words) == len(WORDS)
+    assert list(words) == WORDS
+    assert words[-1] == "émeu"
+    with pytest.raises(IndexError):
+        words[len(WORDS)]
+
+
+def test_mapped_wordlist_rejects_other_files(tmp_path):
+    path = tmp_path / "words.bin"
+    path.write_bytes(b"zebra\nquokka\n")
+    with pytest.raises(ValueError, match="not a compiled wordlist"):
+        MappedWordlist(str(path))
+
+
+def test_word_index_candidates():
+    index = WordIndex(WORDS)
+    assert index.candidates(5, 6) == ["zebra", "quokka"]
+    assert index.candidates(0, 10, ["q", "m"]) == ["yak", "zebra"]
+
+
+def test_compiled_word_index(compiled, monkeypatch):
+    decoded = []
+    getitem = MappedWordlist.__getitem__
+    monkeypatch.setattr(
+        MappedWordlist,
+        "__getitem__",
+        lambda self, index: decoded.append(index) or getitem(self, index),
+    )
+    index = word_index(wordlist=compiled)
+    assert isinstance(index, MappedWordIndex)
+    candidates = index.candidates(0, 10, ["q", "m"])
+    assert len(candidates) == 2 and decoded == []
+    assert list(candidates) == ["yak", "zebra"]
+    assert list(index.candidates(4, 6)) == ["émeu", "zebra", "quokka"]
+    assert list(index.candidates(4, 4, ["é"])) == []
+    assert list(index.candidates(4, 4, ["ß"])) == ["émeu"]
+
+
+def test_generate_from_compiled_wordlist(compiled):
+    # a digit and a special character leave 3 to 5 characters for the word
+    password = generate_random_pw(5, 7, wordlist=compiled)
+    assert split_word(password) in {"zebra", "yak", "émeu"}
+    password = generate_random_pw(4, 6, False, ["z"], wordlist=compiled)
+    assert split_word(password) in {"yak", "émeu"}
+
+
+def test_generate_from_json_and_gzip_wordlists(tmp_path):
+    path = tmp_path / "words.json"
+    path.write_text(json.dumps(WORDS))
+    assert split_word(generate_random_pw(8, 8, wordlist=str(path))) == "quokka"
+    path = tmp_path / "words.csv.gz"
+    with gzip.open(str(path), "wt") as file:
+        file.write(",0\n0,quokka\n")
+    assert split_word(generate_random_pw(wordlist=str(path))) == "quokka"
+
+
+def test_unreadable_wordlist(tmp_path, compiled):
+    with pytest.raises(PasswordRulesError, match="Cannot read wordlist"):
+        generate_random_pw(wordlist=str(tmp_path / "missing.bin"))
+    with pytest.raises(PasswordRulesError, match="Cannot read wordlist"):
+        generate_random_pw(wordlist=str(tmp_path / "words.txt"))
+    with pytest.raises(PasswordRulesError, match="No wordlist word"):
+        generate_random_pw(20, 25, wordlist=compiled)
+
+
+def test_manager_generates_from_wordlist(compiled):
+    manager = PasswordManager(PasswordDB())
+    assert split_word(manager.generate_password(4, 4, False, wordlist=compiled)) == "yak"
+    passwords = manager.generate_passwords(3, 4, 4, False, wordlist=compiled)
+    assert [split_word(p) for p in passwords] == ["yak"] * 3
+
+
+def test_bundled_wordlists():
+    assert "abend" in load_pw_components(language="german")["words"]
+    # wordlists are read once per process
+    assert load_pw_components(language="german") is load_pw_components(
+        language="german"
+    )
+    password = generate_random_pw(10, 12, True, ["e", "s"], "french")
+    assert 10 <= len(password) <= 12
+    assert not set(password) & {"e", "s"}
+    with pytest.raises(PasswordRulesError, match="Unknown language"):
+        generate_random_pw(language="latin")
+
+
+def test_buffered_system_random():
+    rng = BufferedSystemRandom(chunk_size=16)
+    assert all(0 <= rng.random() < 1 for _ in range(100))
+    assert all(0 <= rng.getrandbits(13) < 2 ** 13 for _ in range(100))
+    with pytest.raises(NotImplementedError):
+        rng.getstate()
+
+
+def test_bulk_generation(capsys):
+    passwords = generate_random_pws(500, 8, 12, True, ["e", "1"], report=True)
+    assert len(passwords) == 500
+    assert all(8 <= len(p) <= 12 and not set(p) & {"e", "1"} for p in passwords)
+    assert len(set(passwords)) > 400
+    assert "Generated 500 passwords" in capsys.readouterr().out
+    assert generate_random_pws(0) == []
+
+
+def test_bulk_generation_in_processes(monkeypatch):
+    monkeypatch.setattr(random_password, "MIN_BATCH_PER_PROCESS", 50)
+    passwords = generate_random_pws(150, 10, 10, False, processes=3)
+    assert len(passwords) == 150
+    assert all(len(p) == 10 for p in passwords)
+    # workers do not repeat each other's random draws
+    assert passwords[:50] != passwords[50:100] != passwords[100:]
+    assert len(set(passwords)) > 100
+
+
+def test_bulk_generation_from_wordlist(compiled):
+    passwords = generate_random_pws(20, 4, 4, False, ["z", "é"], wordlist=compiled)
+    assert len(passwords) == 20
+    assert all(split_word(p) == "yak" for p in passwords)
+    with pytest.raises(PasswordRulesError, match="No wordlist word"):
+        generate_random_pws(20, 4, 4, False, ["y", "é"], wordlist=compiled)
+
+
+def test_manager_replaces_breached_passwords(tmp_path, compiled):
+    path = str(tmp_path / "corpus.bin")
+    build_corpus([p.format(d) for d in "012345678" for p in ("{}yak", "yak{}")], path)
+    manager = PasswordManager(PasswordDB(), breach_corpus=BreachCorpus(path))
+    passwords = manager.generate_passwords(20, 4, 4, False, wordlist=compiled)
+    assert len(passwords) == 20
+    assert all(p in ("9yak", "yak9") for p in passwords)
+    with pytest.raises(PasswordRulesError, match="breached"):
+        manager.generate_password(4, 4, False, ["9"], wordlist=compiled)
+
+
+@pytest.mark.parametrize("language", ["english", "german", "french", "spanish"])
+def test_word_index_matches_a_scan_of_the_wordlist(language):
+    words = load_pw_components(language=language)["words"]
+    index = word_index(language)
+    for min_length, max_length, excluded in [(0, 100, ""), (5, 6, "ae"), (7, 7, "s")]:
+        assert sorted(index.candidates(min_length, max_length, excluded)) == sorted(
+            word
+            for word in words
+            if min_length <= len(word) <= max_length and not set(word) & set(excluded)
+        )
+
+
+def test_rules_without_candidates_fail_at_once():
+    with pytest.raises(PasswordRulesError, match="No english word"):
+        generate_random_pw(30, 40)
+    with pytest.raises(PasswordRulesError, match="without the excluded characters"):
+        generate_random_pw(exclude_characters=list("aeiou"))
+    with pytest.raises(PasswordRulesError, match="special characters are excluded"):
+        generate_random_pw(exclude_characters=list(string.punctuation))
+    with pytest.raises(PasswordRulesError, match="all digits are excluded"):
+        generate_random_pws(10, exclude_characters=list(string.digits), processes=4)
+    # characters of no word in the wordlist do not restrict the candidates
+    assert len(generate_random_pw(8, 8, False, ["ß"])) == 8
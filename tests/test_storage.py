@@ -0,0 +1,304 @@
+"""Tests of module storage."""
+
+import multiprocessing
+import os
+import pickle
+import pytest
+from exceptions import ConflictError, DuplicateEntryError
+from manager import PasswordManager
+from pw_classes import Entry, PasswordDB
+from storage import (
+    BACKENDS,
+    JOURNAL_MAGIC,
+    SNAPSHOT_MAGIC,
+    JournalStorage,
+    PickleStorage,
+    SQLiteStorage,
+)
+
+
+def open_journal(path, **kwargs):
+    """Unlocked JournalStorage at path and the database loaded from it."""
+    storage = JournalStorage(path, **kwargs)
+    assert storage.unlock("pw")
+    return storage, storage.load()
+
+
+@pytest.fixture
+def journal_path(tmp_path, kdf_params):
+    """Path of an initialized, empty JournalStorage."""
+    path = str(tmp_path / "vault")
+    JournalStorage(path).initialize("pw", kdf_params)
+    return path
+
+
+def test_changes_are_appended_to_the_journal(journal_path):
+    storage, pw_db = open_journal(journal_path)
+    manager = PasswordManager(pw_db, storage)
+    manager.add("www.example.com", "me", "p1")
+    journal_size = os.path.getsize(storage.journal_path)
+    manager.update("www.example.com", "me", "p", "p2")
+    manager.add("www.example.org", "me")
+    # no snapshot is written until the journal is compacted
+    assert not os.path.exists(journal_path)
+    assert 0 < os.path.getsize(storage.journal_path) - journal_size < 2048
+    _, pw_db = open_journal(journal_path)
+    assert pw_db.get_entry("www.example.com", "me").password == "p2"
+    assert len(pw_db) == 2
+
+
+def test_record_cut_short_by_a_crash_is_dropped(journal_path):
+    storage, pw_db = open_journal(journal_path)
+    manager = PasswordManager(pw_db, storage)
+    manager.add("www.example.com", "me", "p1")
+    manager.add("www.example.org", "me", "p2")
+    with open(storage.journal_path, "r+b") as file:
+        file.truncate(os.path.getsize(storage.journal_path) - 3)
+    storage, pw_db = open_journal(journal_path)
+    assert [entry.website for entry in pw_db] == ["www.example.com"]
+    # the next commit cuts off the damaged record before appending
+    PasswordManager(pw_db, storage).add("www.example.net", "me")
+    _, pw_db = open_journal(journal_path)
+    assert [entry.website for entry in pw_db] == ["www.example.com", "www.example.net"]
+
+
+def test_compaction(journal_path):
+    storage, pw_db = open_journal(journal_path, compact_threshold=200)
+    manager = PasswordManager(pw_db, storage)
+    for i in range(5):
+        manager.add("www.example{}.com".format(i), "me", "pw")
+    assert os.path.getsize(storage.journal_path) <= 200
+    with open(storage.journal_path, "rb") as file:
+        journal = file.read()
+    manager.add("www.example5.com", "me", "pw")
+    storage.compact(pw_db)
+    assert os.path.getsize(storage.journal_path) == 0
+    # a journal left behind by a crash during compaction is not replayed again
+    with open(storage.journal_path, "wb") as file:
+        file.write(journal)
+    _, pw_db = open_journal(journal_path)
+    assert len(pw_db) == 6
+
+
+def test_database_of_earlier_versions_is_rewritten(tmp_path, kdf_params):
+    path = str(tmp_path / "password_db.p")
+    with open(path, "wb") as file:
+        pickle.dump(PasswordDB([Entry("www.example.com", "me", "secret")]), file)
+    storage = JournalStorage(path)
+    storage.initialize("pw", kdf_params)
+    assert storage.load().get_entry("www.example.com", "me").password == "secret"
+    with open(path, "rb") as file:
+        snapshot = file.read()
+    assert snapshot.startswith(SNAPSHOT_MAGIC) and b"secret" not in snapshot
+    _, pw_db = open_journal(path)
+    assert pw_db.get_entry("www.example.com", "me").password == "secret"
+
+
+def test_unknown_journal_is_not_replayed(journal_path):
+    storage, _ = open_journal(journal_path)
+    # a journal cut short by a crash while it was started holds part of the magic
+    with open(storage.journal_path, "wb") as file:
+        file.write(JOURNAL_MAGIC[:3])
+    _, pw_db = open_journal(journal_path)
+    assert len(pw_db) == 0
+    with open(storage.journal_path, "wb") as file:
+        file.write(b"not a journal")
+    with pytest.raises(ValueError, match="Unknown storage format"):
+        open_journal(journal_path)
+
+
+@pytest.mark.parametrize("name", sorted(BACKENDS))
+def test_backends(tmp_path, kdf_params, name):
+    path = str(tmp_path / "vault")
+    storage = BACKENDS[name](path)
+    assert not storage.exists()
+    storage.initialize("pw", kdf_params)
+    manager = PasswordManager(storage.load(), storage)
+    manager.add("www.example.com", "me", "p1")
+    manager.add("www.example.org", "you", "p2")
+    manager.update("www.example.com", "me", "u", "admin")
+    manager.remove("www.example.org", "you")
+    manager.close()
+    storage = BACKENDS[name](path)
+    assert storage.exists()
+    assert not storage.unlock("wrong")
+    assert storage.unlock("pw")
+    pw_db = storage.load()
+    assert [(e.website, e.username, e.password) for e in pw_db] == [
+        ("www.example.com", "admin", "p1")
+    ]
+    storage.close(pw_db)
+
+
+def test_sqlite_entries_are_loaded_on_access(tmp_path, kdf_params):
+    path = str(tmp_path / "vault.sqlite")
+    storage = SQLiteStorage(path)
+    storage.initialize("pw", kdf_params)
+    pw_db = storage.load()
+    pw_db.add_entries(Entry("www.site{}.com".format(i), "me", "pw") for i in range(50))
+    storage.close(pw_db)
+    storage = SQLiteStorage(path)
+    storage.unlock("pw")
+    pw_db = storage.load()
+    store = pw_db.store
+    assert len(store._loaded) == 0
+    entry = pw_db.get_entry("www.site7.com", "me")
+    assert list(store._loaded) == [("www.site7.com", "me")]
+    # an entry in use is the same object on every lookup
+    assert pw_db.select_entry("www.site7.com") is entry
+    assert len(pw_db) == 50 and pw_db.count_websites() == 50
+    storage.close(pw_db)
+    # nothing but blind indexes and ciphertext is stored
+    with open(path, "rb") as file:
+        assert b"www.site" not in file.read()
+
+
+def test_sqlite_domain_lookup_reads_only_the_rows_found(
+    tmp_path, kdf_params, monkeypatch
+):
+    path = str(tmp_path / "vault.sqlite")
+    storage = SQLiteStorage(path)
+    storage.initialize("pw", kdf_params)
+    pw_db = storage.load()
+    pw_db.add_entries(Entry("www.site{}.com".format(i), "me", "pw") for i in range(50))
+    pw_db.add_entries(
+        [
+            Entry("https://example.com", "me", "parent"),
+            Entry("https://login.example.com", "me", "sub"),
+            Entry("https://deep.login.example.com", "you", "deep"),
+        ]
+    )
+    storage.close(pw_db)
+    storage = SQLiteStorage(path)
+    storage.unlock("pw")
+    pw_db = storage.load()
+    store = pw_db.store
+    opened = []
+    open_record = store._open_record
+    monkeypatch.setattr(
+        store, "_open_record", lambda row: opened.append(row) or open_record(row)
+    )
+    assert pw_db.select_entry("a.b.login.example.com").password == "sub"
+    assert pw_db.find_websites("deep.login.example.com", subdomains=False) == [
+        "https://deep.login.example.com",
+        "https://login.example.com",
+        "https://example.com",
+    ]
+    assert pw_db.find_websites("example.com") == [
+        "https://example.com",
+        "https://login.example.com",
+        "https://deep.login.example.com",
+    ]
+    assert pw_db.select_entry("com") is None
+    assert [e.password for e in pw_db.query(domain="login.example.com")] == [
+        "sub",
+        "deep",
+    ]
+    assert len(opened) < 20
+    # the domain index follows changes
+    pw_db.remove_entry(pw_db.get_entry("https://login.example.com", "me"))
+    pw_db.add_entry(Entry("https://www.login.example.com", "me"))
+    assert pw_db.find_websites("login.example.com") == [
+        "https://www.login.example.com",
+        "https://example.com",
+        "https://deep.login.example.com",
+    ]
+    storage.close(pw_db)
+
+
+def test_sqlite_failed_batch_is_rolled_back_in_place(tmp_path, kdf_params):
+    path = str(tmp_path / "vault.sqlite")
+    storage = SQLiteStorage(path)
+    storage.initialize("pw", kdf_params)
+    pw_db = storage.load()
+    pw_db.add_entries(Entry("www.site{}.com".format(i), "me", "pw") for i in range(5))
+    storage.commit(pw_db)
+    entries = list(pw_db)
+    rows = storage._conn.execute("SELECT * FROM sealed_entries ORDER BY id").fetchall()
+    batch = pw_db.batch()
+    batch.update_entry(entries[1], "w", "www.moved.com")
+    batch.remove_entry(entries[2])
+    batch.add_entry(Entry("www.new.com", "me"))
+    pw_db.add_entry(Entry("www.new.com", "me"))
+    with pytest.raises(DuplicateEntryError):
+        batch.commit()
+    pw_db.remove_entry(pw_db.get_entry("www.new.com", "me"))
+    assert list(pw_db) == entries
+    assert all(pw_db.get_entry(e.website, e.username) is e for e in entries)
+    assert pw_db.find_websites("moved.com") == []
+    assert pw_db.find_websites("site2.com") == ["www.site2.com"]
+    storage.close(pw_db)
+    storage = SQLiteStorage(path)
+    storage.unlock("pw")
+    pw_db = storage.load()
+    # the rows of the entries are the ones written before the batch
+    assert storage._conn.execute(
+        "SELECT * FROM sealed_entries ORDER BY id"
+    ).fetchall() == rows
+    storage.close(pw_db)
+
+
+def open_manager(backend, path):
+    """PasswordManager of a process of its own on the storage at path."""
+    storage = backend(path)
+    assert storage.unlock("pw")
+    return PasswordManager(storage.load(), storage)
+
+
+@pytest.mark.parametrize("backend", [JournalStorage, PickleStorage])
+def test_changes_of_other_processes_are_merged(tmp_path, kdf_params, backend):
+    path = str(tmp_path / "vault")
+    backend(path).initialize("pw", kdf_params)
+    first = open_manager(backend, path)
+    second = open_manager(backend, path)
+    first.add("www.example.com", "me", "p1")
+    second.add("www.example.org", "me", "p2")
+    # a commit reloads the entries other processes have stored
+    assert second.get("www.example.com", "me").password == "p1"
+    first.add("www.example.net", "me", "p3")
+    first.update("www.example.org", "me", "p", "p4")
+    stored = open_manager(backend, path)
+    assert sorted((e.website, e.password) for e in stored.pw_db) == [
+        ("www.example.com", "p1"),
+        ("www.example.net", "p3"),
+        ("www.example.org", "p4"),
+    ]
+
+
+@pytest.mark.parametrize("backend", [JournalStorage, PickleStorage])
+def test_conflicting_changes(tmp_path, kdf_params, backend):
+    path = str(tmp_path / "vault")
+    backend(path).initialize("pw", kdf_params)
+    first = open_manager(backend, path)
+    second = open_manager(backend, path)
+    first.add("www.example.com", "me", "p1")
+    with pytest.raises(ConflictError):
+        second.add("www.example.com", "me", "p2")
+    assert second.get("www.example.com", "me").password == "p1"
+    second.add("www.example.org", "me")
+    first.add("www.example.net", "me")
+    first.remove("www.example.org", "me")
+    with pytest.raises(ConflictError):
+        second.update("www.example.org", "me", "p", "p3")
+    stored = open_manager(backend, path)
+    assert sorted(e.website for e in stored.pw_db) == ["www.example.com", "www.example.net"]
+
+
+def add_entries(args):
+    """Adds count entries named after worker to the vault at path, one commit each."""
+    backend, path, worker, count = args
+    manager = open_manager(backend, path)
+    for i in range(count):
+        manager.add("www.worker{}.com".format(worker), "user{}".format(i))
+    manager.close()
+
+
+@pytest.mark.parametrize("backend", [JournalStorage, PickleStorage, SQLiteStorage])
+def test_concurrent_processes(tmp_path, kdf_params, backend):
+    path = str(tmp_path / "vault")
+    backend(path).initialize("pw", kdf_params)
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        pool.map(add_entries, [(backend, path, worker, 10) for worker in range(4)])
+    manager = open_manager(backend, path)
+    assert len(manager) == 40
+    assert manager.count_websites() == 4
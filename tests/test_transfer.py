@@ -0,0 +1,91 @@
+"""Tests of module transfer."""
+
+import csv
+import io
+import pytest
+from exceptions import InvalidEntryError
+from pw_classes import Entry, PasswordDB
+from transfer import export_entries, import_entries, read_rows
+
+HEADER = "website,username,password,created_at\n"
+
+
+def text_file(data, errors="strict"):
+    """Returns a text file of the bytes data, decoded as UTF-8 with errors."""
+    return io.TextIOWrapper(io.BytesIO(data), encoding="utf-8", errors=errors, newline="")
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_round_trip(fmt):
+    pw_db = PasswordDB()
+    pw_db.add_entry(Entry("www.example.com", "me", "pä,ss\nword"))
+    pw_db.add_entry(Entry.trusted("www.example.org", "you", None, 1000))
+    file = io.StringIO()
+    assert export_entries(pw_db, file, fmt) == 2
+    file.seek(0)
+    copy = PasswordDB()
+    assert import_entries(copy, file, fmt) == (2, 0, [])
+    assert copy.get_entry("www.example.com", "me").password == "pä,ss\nword"
+    assert copy.get_entry("www.example.org", "you").created_at == 1000
+
+
+def test_invalid_rows():
+    file = io.StringIO(
+        HEADER
+        + "www.example.com,me,pw,\n"
+        + "not a website,me,pw,\n"
+        + "www.example.org,,pw,\n"
+        + "www.example.com,me,other,\n"
+    )
+    pw_db = PasswordDB()
+    assert import_entries(pw_db, file, "csv") == (
+        1,
+        1,
+        [(3, "Not a valid website"), (4, "Username is missing")],
+    )
+    file = io.StringIO('{"website": 1}\n\n[\n')
+    added, skipped, errors = import_entries(pw_db, file, "jsonl")
+    assert errors == [(1, "Not a valid website"), (3, "Not a row of named fields")]
+
+
+def test_malformed_csv_row():
+    file = io.StringIO(
+        HEADER
+        + "www.example.com,me,{},\n".format("x" * (csv.field_size_limit() + 1))
+        + "www.example.org,me,pw,\n"
+    )
+    pw_db = PasswordDB()
+    added, skipped, errors = import_entries(pw_db, file, "csv")
+    assert added == 1
+    assert [line_num for line_num, _ in errors] == [2]
+    assert errors[0][1].startswith("Not valid CSV: field larger than field limit")
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_undecodable_line_is_rejected(fmt):
+    rows = [
+        b"www.example.com,me,caf\xe9,\n",
+        b"www.example.org,me,pw,\n",
+    ]
+    if fmt == "jsonl":
+        rows = [
+            b'{"website": "www.example.com", "username": "me", "password": "caf\xe9"}\n',
+            b'{"website": "www.example.org", "username": "me", "password": "pw"}\n',
+        ]
+    data = (HEADER.encode() if fmt == "csv" else b"") + b"".join(rows)
+    pw_db = PasswordDB()
+    added, skipped, errors = import_entries(
+        pw_db, text_file(data, errors="surrogateescape"), fmt
+    )
+    assert added == 1
+    assert errors == [(1 + (fmt == "csv"), "Not valid UTF-8")]
+    assert pw_db.get_entry("www.example.org", "me").password == "pw"
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_undecodable_file_stops_import(fmt):
+    data = b"\xff\xfe" + HEADER.encode()
+    pw_db = PasswordDB()
+    assert import_entries(pw_db, text_file(data), fmt) == (0, 0, [(1, "Not valid UTF-8")])
+    with pytest.raises(InvalidEntryError, match="Line 1: Not valid UTF-8"):
+        list(read_rows(text_file(data), fmt))
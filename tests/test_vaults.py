@@ -0,0 +1,130 @@
+"""Tests of module vaults."""
+
+import json
+import os
+import pytest
+from exceptions import (
+    DuplicateVaultError,
+    InvalidVaultNameError,
+    VaultLockedError,
+    VaultNotFoundError,
+)
+from storage import JournalStorage, SQLiteStorage
+from vaults import DEFAULT_VAULT, Catalog, VaultSet
+
+
+@pytest.fixture
+def unlock(kdf_params):
+    """Unlock callable initializing vaults that do not exist yet, password 'pw'."""
+
+    def unlock(vault):
+        if not vault.storage.exists():
+            vault.storage.initialize("pw", kdf_params)
+            return True
+        return vault.storage.unlock("pw")
+
+    return unlock
+
+
+def test_catalog(in_tmp_path):
+    catalog = Catalog()
+    assert len(catalog) == 0 and catalog.names() == []
+    path = catalog.add("work", "sqlite")
+    catalog.add("home")
+    assert catalog.names() == ["home", "work"]
+    assert catalog.record("work") == ("sqlite", path)
+    assert path == os.path.join("vaults", "work", "password_db.sqlite")
+    assert os.path.isdir(os.path.join("vaults", "work"))
+    # other processes see the catalog as written
+    with open("vaults.json") as file:
+        assert sorted(json.load(file)["vaults"]) == ["home", "work"]
+    assert Catalog().names() == ["home", "work"]
+    with pytest.raises(DuplicateVaultError):
+        Catalog().add("work")
+    with pytest.raises(DuplicateVaultError):
+        catalog.add(DEFAULT_VAULT)
+    for name in ("", "../work", ".hidden", "a b", "x" * 65):
+        with pytest.raises(InvalidVaultNameError):
+            catalog.add(name)
+    assert catalog.forget("work") == path
+    assert catalog.names() == ["home"]
+    # the files of a forgotten vault are kept
+    assert os.path.isdir(os.path.join("vaults", "work"))
+    with pytest.raises(VaultNotFoundError):
+        catalog.forget("work")
+    with pytest.raises(VaultNotFoundError):
+        catalog.record("work")
+
+
+def test_catalog_paths_are_relative_to_the_catalog(tmp_path):
+    catalog = Catalog(str(tmp_path / "vaults.json"))
+    path = catalog.add("work")
+    assert path == str(tmp_path / "vaults" / "work" / "password_db.p")
+    assert os.path.isdir(str(tmp_path / "vaults" / "work"))
+
+
+def test_vaults_are_mounted_on_first_access(in_tmp_path, unlock):
+    catalog = Catalog()
+    catalog.add("work", "sqlite")
+    vaults = VaultSet(catalog, unlock)
+    assert vaults.names() == [DEFAULT_VAULT, "work"]
+    assert vaults.mounted() == []
+    with pytest.raises(VaultLockedError):
+        vaults.manager("work", mount=False)
+    work = vaults.manager("work")
+    assert vaults.mounted() == ["work"]
+    assert vaults.manager("work") is work
+    assert isinstance(vaults.vault("work").storage, SQLiteStorage)
+    assert isinstance(vaults.vault().storage, JournalStorage)
+    work.add("www.example.com", "me", "work")
+    vaults.manager().add("www.example.com", "me", "default")
+    assert vaults.mounted() == [DEFAULT_VAULT, "work"]
+    vaults.close()
+    assert vaults.mounted() == []
+    reopened = VaultSet(Catalog(), unlock)
+    assert reopened.manager("work").get("www.example.com").password == "work"
+    assert reopened.manager().get("www.example.com").password == "default"
+    reopened.close()
+
+
+def test_mount_errors(in_tmp_path, unlock):
+    catalog = Catalog()
+    vaults = VaultSet(catalog)
+    with pytest.raises(VaultNotFoundError):
+        vaults.mount("work")
+    # vaults added by another process are found
+    Catalog().add("work")
+    with pytest.raises(VaultLockedError):
+        vaults.mount("work")
+    vaults.mount("work", unlock)
+    vaults.close()
+    with pytest.raises(VaultLockedError):
+        vaults.mount("work", lambda vault: vault.storage.unlock("wrong"))
+    assert vaults.mounted() == []
+
+
+def test_search_and_find_all_mounted_vaults(in_tmp_path, unlock):
+    catalog = Catalog()
+    for name in ("home", "work", "old"):
+        catalog.add(name)
+    vaults = VaultSet(catalog, unlock)
+    vaults.manager().add("www.example.com", "me")
+    vaults.manager("work").add("www.example.org", "me")
+    vaults.manager("work").add("https://login.example.com", "you")
+    vaults.manager("home").add("www.example.net", "you")
+    assert vaults.search("www.example.org", k=1) == [
+        (DEFAULT_VAULT, "www.example.com"),
+        ("home", "www.example.net"),
+        ("work", "www.example.org"),
+    ]
+    assert [(name, e.website) for name, e in vaults.find(username="you")] == [
+        ("home", "www.example.net"),
+        ("work", "https://login.example.com"),
+    ]
+    assert [name for name, _ in vaults.find(domain="example.com")] == [
+        DEFAULT_VAULT,
+        "work",
+    ]
+    # vaults that are not mounted are not searched
+    assert "old" not in vaults.mounted()
+    vaults.close()